@@ -1,4 +1,5 @@
 from functools import cached_property
+from importlib.util import spec_from_file_location, module_from_spec
 from sqlite3 import IntegrityError
 from threading import Lock
 from time import time
@@ -6,13 +7,26 @@ from typing import List
 
 from attr import dataclass
 from glob import glob
-from os.path import realpath, dirname, join, basename
+from os.path import realpath, dirname, join, basename, exists
 
 from bofh.model.modules.loggers import Loggers
 from bofh.utils.web3 import bsc_blocknr2ts
 
 schemadir = join(dirname(realpath(__file__)), "schema")
 
+# pool reserves are stored as big endian BLOBs, at least as wide as an uint112 (UniswapV2 reserves)
+RESERVE_BYTES = 14
+
+
+def reserve_to_blob(value):
+    if not isinstance(value, int):
+        value = int(str(value))
+    return value.to_bytes(max(RESERVE_BYTES, (value.bit_length() + 7) // 8), "big")
+
+
+def reserve_from_blob(blob):
+    return int.from_bytes(blob, "big")
+
 
 @dataclass
 class Exchange:
@@ -189,16 +203,37 @@ class ModelDB:
         for i in range(current_version+1, latest+1):
             try:
                 mfile = self.migrations[i]
-                self.log.debug("using %s for upgrading to schema version %r...", mfile, i)
-                with open(mfile, "r") as fd:
-                    self.conn.executescript(fd.read())
-                self.conn.cursor().execute("INSERT INTO schema_version(version) VALUES (%r)" % i)
-                self.conn.commit()
             except KeyError:
                 self.log.error("no migration file found for schema version %r. bailing out now", i)
                 return
+            self.log.debug("using %s for upgrading to schema version %r...", mfile, i)
+            with open(mfile, "r") as fd:
+                script = fd.read()
+            try:
+                # the SQL script, its python step and the version bump are one transaction:
+                # executescript() alone would commit each statement on its own
+                self.conn.executescript("BEGIN;\n" + script)
+                self.run_migration_script(i, mfile)
+                self.conn.cursor().execute("INSERT INTO schema_version(version) VALUES (%r)" % i)
+                self.conn.commit()
+            except:
+                self.conn.rollback()
+                self.log.exception("unable to upgrade to schema version %r. left at version %r", i, i - 1)
+                raise
         self.log.info("successfully bumped schema version up to version %r", latest)
 
+    def run_migration_script(self, version, mfile):
+        # NN_migration.py, if present, completes NN_migration.sql with the data
+        # conversions that can't be expressed in SQL. It exposes a migrate(conn) function
+        pyfile = mfile[:-len(".sql")] + ".py"
+        if not exists(pyfile):
+            return
+        self.log.debug("using %s for converting data to schema version %r...", pyfile, version)
+        spec = spec_from_file_location("%s_migration_%02u" % (self.schema_name, version), pyfile)
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.migrate(self.conn)
+
     def __enter__(self):
         return self.cursor()
 
@@ -259,6 +294,50 @@ class BasicScopedCursor:
                 for i in seq:
                     yield i
 
+class ReservesSnapshotWriter:
+    """Accumulates pool reserves rows and upserts them in bulk.
+
+    Each flush is a single executemany() of INSERT ... ON CONFLICT DO UPDATE, committed as one
+    transaction, and it updates reserves_block_number just once.
+    Use as a context manager, for pending rows to be flushed at exit."""
+
+    FLUSH_SIZE = 20000
+    UPSERT_SQL = ("INSERT INTO pool_reserves (id, reserve0, reserve1, block_number) VALUES (?, ?, ?, ?) "
+                  "ON CONFLICT(id) DO UPDATE SET reserve0 = excluded.reserve0"
+                  ", reserve1 = excluded.reserve1"
+                  ", block_number = excluded.block_number")
+
+    def __init__(self, curs, block_number, flush_size=None):
+        self.curs = curs
+        self.block_number = block_number
+        self.flush_size = flush_size or self.FLUSH_SIZE
+        self.rows = []
+        self.written = 0
+        self.flushes = 0
+
+    def add(self, pool_id, reserve0, reserve1):
+        self.rows.append((pool_id, reserve_to_blob(reserve0), reserve_to_blob(reserve1), self.block_number))
+        if len(self.rows) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.curs.executemany(self.UPSERT_SQL, self.rows)
+        self.curs.reserves_block_number = self.block_number
+        self.curs.conn.commit()
+        self.written += len(self.rows)
+        self.flushes += 1
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_val is None:
+            self.flush()
+
+
 def norm_address(a: str):
     return str(a).lower()
 
@@ -339,8 +418,11 @@ class StatusScopedCursor(BasicScopedCursor):
                             "FROM pools WHERE address = ?", (norm_address(addr),)).get()
 
     def get_lp_reserves_vals(self, id):
-        return self.execute("SELECT reserve0, reserve1 "
+        vals = self.execute("SELECT reserve0, reserve1 "
                             "FROM pool_reserves WHERE id = ?", (id,)).get()
+        if vals is None:
+            return None
+        return tuple(map(reserve_from_blob, vals))
 
     def get_attack_pool_ids(self, path_hash):
         return map(lambda x: x[0],
@@ -434,19 +516,42 @@ class StatusScopedCursor(BasicScopedCursor):
 
     reserves_block_number = property(get_latest_blocknr, update_latest_blocknr)
 
-    def add_pool_reserve(self, pool_id, reserve0, reserve1):
+    def add_pool_reserve(self, pool_id, reserve0, reserve1, block_number=0):
         assert self.conn is not None
-        if not isinstance(reserve0, str): reserve0 = str(reserve0)
-        if not isinstance(reserve1, str): reserve1 = str(reserve1)
+        reserve0 = reserve_to_blob(reserve0)
+        reserve1 = reserve_to_blob(reserve1)
         try:
-            self.execute("INSERT INTO pool_reserves (id, reserve0, reserve1) VALUES (?, ?, ?)", (pool_id, reserve0, reserve1))
+            self.execute("INSERT INTO pool_reserves (id, reserve0, reserve1, block_number) VALUES (?, ?, ?, ?)"
+                         , (pool_id, reserve0, reserve1, block_number))
             self.execute("SELECT last_insert_rowid()")
         except IntegrityError:
             # already existing
-            self.execute("UPDATE pool_reserves SET reserve0 = ?, reserve1 = ? WHERE id = ?", (reserve0, reserve1, pool_id))
+            self.execute("UPDATE pool_reserves SET reserve0 = ?, reserve1 = ?, block_number = ? WHERE id = ?"
+                         , (reserve0, reserve1, block_number, pool_id))
+
+    def reserves_snapshot_writer(self, block_number, flush_size=None):
+        return ReservesSnapshotWriter(self, block_number, flush_size=flush_size)
+
+    def list_stale_pool_reserves(self, min_block_number):
+        """(id, address) of the enabled pools whose reserves were last confirmed before min_block_number,
+           or were never saved"""
+        return self.execute("SELECT p.id, p.address FROM pools p "
+                            "LEFT JOIN pool_reserves r ON r.id = p.id "
+                            "WHERE NOT p.disabled AND COALESCE(r.block_number, 0) < ?"
+                            , (min_block_number,)).get_all()
 
     def update_pool_reserves_batch(self, tuples):
-        self.executemany("UPDATE pool_reserves SET reserve0 = ?, reserve1 = ? WHERE id = ?", tuples)
+        """tuples is a sequence of (reserve0, reserve1, block_number, pool_id)"""
+        self.executemany("UPDATE pool_reserves SET reserve0 = ?, reserve1 = ?, block_number = ? WHERE id = ?"
+                         , ((reserve_to_blob(r0), reserve_to_blob(r1), blocknr, id) for r0, r1, blocknr, id in tuples))
+
+    def list_recent_attacks(self, min_ts, max_count=0):
+        """(path_id, origin_ts) of the attacks recorded since min_ts, oldest first.
+           Only the max_count most recent ones if max_count is set"""
+        sql = "SELECT path_id, origin_ts FROM attacks WHERE origin_ts >= ? ORDER BY origin_ts DESC"
+        if max_count:
+            sql += " LIMIT %u" % max_count
+        return reversed(list(self.execute(sql, (int(min_ts),)).get_all()))
 
     def attack_is_in_mute_cache(self, attack_plan, cache_deadline, max_size=0):
         ts_of_largest_collection = None
@@ -465,18 +570,51 @@ class StatusScopedCursor(BasicScopedCursor):
             args = (path_id, int(time() - cache_deadline))
         return self.execute(check_colliding_sql, args).get_int() > 0
 
-    def add_attack(self, attack_plan
+    ATTACKS_INSERT_SQL = ("INSERT INTO attacks ("
+                          "id"
+                          ", origin"
+                          ", blockNr"
+                          ", origin_tx"
+                          ", origin_ts"
+                          ", amountIn"
+                          ", amountOut"
+                          ", yieldRatio"
+                          ", path_id"
+                          ", path_size"
+                          ", contract"
+                          ", calldata"
+                          ", description) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+    ATTACK_STEPS_INSERT_SQL = ("INSERT INTO attack_steps ("
+                               "fk_attack"
+                               ", pool_id"
+                               ", pool_addr"
+                               ", reserve0"
+                               ", reserve1"
+                               ", tokenIn_addr"
+                               ", tokenOut_addr"
+                               ", tokenIn_id"
+                               ", tokenOut_id"
+                               ", amountIn"
+                               ", feePPM"
+                               ", amountOut"
+                               ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+    @staticmethod
+    def attack_row(attack_plan
+                   , tag=None
                    , origin=None
                    , blockNr=None
                    , origin_tx=None
                    , contract_address=None
-                   , deflationary=False):
-        path_id = str(attack_plan.id())
+                   , deflationary=False
+                   , detected_ts=None):
+        """Row of the attacks table. A None tag lets the DB assign it"""
         if not origin:
             origin = ""
         if not blockNr:
             blockNr = 0
-            origin_ts = time()
+            origin_ts = detected_ts or time()
         else:
             origin_ts = bsc_blocknr2ts(blockNr)
         if not origin_tx:
@@ -485,64 +623,70 @@ class StatusScopedCursor(BasicScopedCursor):
             contract_address = ""
         else:
             contract_address = norm_address(contract_address)
-        args = (origin
+        return (tag
+                , origin
                 , blockNr
                 , origin_tx
                 , int(origin_ts)
                 , str(attack_plan.initial_balance())
                 , str(attack_plan.final_balance())
                 , attack_plan.yield_ratio()
-                , path_id
+                , str(attack_plan.id())
                 , attack_plan.path.size()
                 , contract_address
                 , attack_plan.get_calldata(deflationary)
                 , attack_plan.get_description())
-        self.execute("INSERT INTO attacks ("
-                     "origin"
-                     ", blockNr"
-                     ", origin_tx"
-                     ", origin_ts"
-                     ", amountIn"
-                     ", amountOut"
-                     ", yieldRatio"
-                     ", path_id"
-                     ", path_size"
-                     ", contract"
-                     ", calldata"
-                     ", description) "
-                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", args)
-        attack_plan.tag = self.execute("SELECT last_insert_rowid()").get_int()
 
-        def steps_iter():
-            for i in range(attack_plan.path.size()):
-                swap = attack_plan.path.get(i)
-                yield (attack_plan.tag
-                       , swap.pool.tag
-                       , norm_address(swap.pool.address)
-                       , str(attack_plan.pool_reserve(i, 0))
-                       , str(attack_plan.pool_reserve(i, 1))
-                       , norm_address(swap.tokenSrc.address)
-                       , norm_address(swap.tokenDest.address)
-                       , swap.tokenSrc.tag
-                       , swap.tokenDest.tag
-                       , str(attack_plan.issued_balance_before_step(i))
-                       , swap.pool.feesPPM()
-                       , str(attack_plan.measured_balance_after_step(i))
-                       )
-        self.executemany("INSERT INTO attack_steps ("
-                         "fk_attack"
-                         ", pool_id"
-                         ", pool_addr"
-                         ", reserve0"
-                         ", reserve1"
-                         ", tokenIn_addr"
-                         ", tokenOut_addr"
-                         ", tokenIn_id"
-                         ", tokenOut_id"
-                         ", amountIn"
-                         ", feePPM"
-                         ", amountOut"
-                         ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", steps_iter())
+    @staticmethod
+    def attack_steps_rows(attack_plan, tag):
+        for i in range(attack_plan.path.size()):
+            swap = attack_plan.path.get(i)
+            yield (tag
+                   , swap.pool.tag
+                   , norm_address(swap.pool.address)
+                   , str(attack_plan.pool_reserve(i, 0))
+                   , str(attack_plan.pool_reserve(i, 1))
+                   , norm_address(swap.tokenSrc.address)
+                   , norm_address(swap.tokenDest.address)
+                   , swap.tokenSrc.tag
+                   , swap.tokenDest.tag
+                   , str(attack_plan.issued_balance_before_step(i))
+                   , swap.pool.feesPPM()
+                   , str(attack_plan.measured_balance_after_step(i))
+                   )
+
+    def add_attack(self, attack_plan
+                   , origin=None
+                   , blockNr=None
+                   , origin_tx=None
+                   , contract_address=None
+                   , deflationary=False):
+        self.execute(self.ATTACKS_INSERT_SQL, self.attack_row(attack_plan
+                                                              , origin=origin
+                                                              , blockNr=blockNr
+                                                              , origin_tx=origin_tx
+                                                              , contract_address=contract_address
+                                                              , deflationary=deflationary))
+        attack_plan.tag = self.execute("SELECT last_insert_rowid()").get_int()
+        self.executemany(self.ATTACK_STEPS_INSERT_SQL, self.attack_steps_rows(attack_plan, attack_plan.tag))
+
+    def add_attacks_batch(self, records):
+        """records is a sequence of AttackRecord (see bofh.model.modules.attacks_writer), their tags already assigned"""
+        self.executemany(self.ATTACKS_INSERT_SQL, (self.attack_row(r.attack_plan
+                                                                   , tag=r.tag
+                                                                   , origin=r.origin
+                                                                   , blockNr=r.blockNr
+                                                                   , origin_tx=r.origin_tx
+                                                                   , contract_address=r.contract_address
+                                                                   , deflationary=r.deflationary
+                                                                   , detected_ts=r.detected_ts)
+                                                   for r in records))
+        self.executemany(self.ATTACK_STEPS_INSERT_SQL, (step
+                                                        for r in records
+                                                        for step in self.attack_steps_rows(r.attack_plan, r.tag)))
+
+    def max_attack_id(self):
+        return self.execute("SELECT COALESCE(MAX(id), 0) FROM attacks").get_int()
 
     def add_unknown_pool(self, address):
         try:
@@ -551,8 +695,17 @@ class StatusScopedCursor(BasicScopedCursor):
         except IntegrityError:
             return False
 
+    def list_unknown_pools(self):
+        self.execute("SELECT address FROM unknown_pools")
+        while True:
+            seq = self.curs.fetchmany()
+            if not seq:
+                return
+            for i in seq:
+                yield i[0]
+
     def set_unknown_pool_factory(self, pool, address):
-        self.execute("UPDATE unknown_pools SET factory = ? WHERE address = ?", (norm_address(address), pool))
+        self.execute("UPDATE unknown_pools SET factory = ? WHERE address = ?", (norm_address(address), norm_address(pool)))
 
     def set_unknown_pool_disabled(self, pool, disabled):
         self.execute("UPDATE unknown_pools SET disabled = ? WHERE address = ?", (disabled,norm_address(pool)))
@@ -0,0 +1,495 @@
+__doc__="""Local stand-in of a BSC node, serving the JSON-RPC calls (over HTTP and websocket) used by the model.
+
+Pools, tokens and reserves come from a status DB or a JSON fixture file. Sync logs are synthetic:
+reserves of random pools take a random walk, and are streamed to the logs subscribers.
+The blocks they close are notified to the newHeads subscribers. Given logs can be pushed
+to the logs subscribers as well (see FakeNode.notify_logs()), ie: to replay removed logs of a reorg.
+The last mined logs are served by eth_getLogs.
+
+Usage: bofh.model.fake_node [options]
+
+Options:
+  -h  --help
+  -d, --status_db_dsn=<connection_str>      serve the pools and tokens of this status DB
+  --fixture=<file>                          serve the pools and tokens of this JSON fixture file
+                                            ({"tokens": {address: [name, symbol, decimals]},
+                                              "pools": {address: [token0, token1, reserve0, reserve1]},
+                                              "factories": {address: [pool address, ...]}})
+  --host=<host>                             listen address [default: 127.0.0.1]
+  --port=<n>                                listen port [default: 8545]
+  --latency_ms=<ms>                         delay of each response [default: 0]
+  --error_rate=<r>                          fraction of calls answered with an error [default: 0]
+  --sync_rate=<n>                           synthetic Sync logs streamed per second, to each subscription (0: none) [default: 100]
+  --logs_per_block=<n>                      synthetic Sync logs per block [default: 50]
+  --max_logs_range=<n>                      widest block range served by eth_getLogs (0: unlimited) [default: 0]
+  --max_filter_addresses=<n>                most addresses in a logs filter (0: unlimited) [default: 0]
+  --seed=<n>                                random seed
+  -v, --verbose                             debug output
+"""
+
+import json
+from asyncio import sleep, get_event_loop, CancelledError
+from collections import deque
+from logging import getLogger, basicConfig
+from random import Random
+from time import time
+
+from aiohttp import web, WSMsgType, WSCloseCode
+
+from bofh.model.modules.constants import MULTICALL_ADDRESS, PREDICTION_LOG_TOPIC0_SYNC, PREDICTION_LOG_TOPIC0_SWAP
+from bofh.model.modules.reserves_download import WORD, _word
+from bofh.utils.web3 import method_id
+
+log = getLogger("bofh.model.fake_node")
+
+
+def _mid(signature):
+    return bytes.fromhex(method_id(signature)[2:])
+
+
+MID_GET_RESERVES = _mid("getReserves()")
+MID_TOKEN0 = _mid("token0()")
+MID_TOKEN1 = _mid("token1()")
+MID_ALL_PAIRS = _mid("allPairs(uint256)")
+MID_ALL_PAIRS_LENGTH = _mid("allPairsLength()")
+MID_DECIMALS = _mid("decimals()")
+MID_NAME = _mid("name()")
+MID_SYMBOL = _mid("symbol()")
+MID_TRY_AGGREGATE = _mid("tryAggregate(bool,(address,bytes)[])")
+
+CHAIN_ID = 56
+
+
+def _uint(v):
+    return int(v).to_bytes(WORD, "big")
+
+
+def _address(a):
+    return bytes.fromhex(a[2:]).rjust(WORD, b'\0')
+
+
+def _string(s):
+    data = s.encode("utf-8")
+    return _uint(WORD) + _uint(len(data)) + data.ljust((len(data) + WORD - 1) // WORD * WORD, b'\0')
+
+
+class RPCError(Exception):
+    def __init__(self, message, code=-32000):
+        super(RPCError, self).__init__(message)
+        self.code = code
+
+
+class FakeChain:
+    """The on-chain state served by FakeNode. All addresses are lowercase"""
+
+    LOGS_HISTORY_SIZE = 100000
+
+    def __init__(self, tokens=None, pools=None, factories=None, block_number=1, seed=None):
+        self.tokens = tokens or dict()        # address -> (name, symbol, decimals)
+        self.pools = pools or dict()          # address -> [token0, token1, reserve0, reserve1]
+        self.factories = factories or dict()  # address -> [pool address, ...]
+        self.pool_addresses = list(self.pools)
+        self.block_number = block_number
+        self.log_index = 0
+        self.random = Random(seed)
+        self.block_hash = self.new_hash()
+        self.logs = deque(maxlen=self.LOGS_HISTORY_SIZE)  # the last mined logs, in block order
+
+    @classmethod
+    def from_fixture(cls, path, **ka):
+        with open(path) as f:
+            data = json.load(f)
+        low = lambda d: {k.lower(): v for k, v in d.items()}
+        pools = {k: [v[0].lower(), v[1].lower(), int(v[2]), int(v[3])] for k, v in low(data.get("pools", {})).items()}
+        factories = {k: [a.lower() for a in v] for k, v in low(data.get("factories", {})).items()}
+        return cls(tokens=low(data.get("tokens", {})), pools=pools, factories=factories, **ka)
+
+    @classmethod
+    def from_status_db(cls, db_dsn, **ka):
+        from bofh.model.database import ModelDB, StatusScopedCursor
+        db = ModelDB(schema_name="status", cursor_factory=StatusScopedCursor, db_dsn=db_dsn)
+        db.open_and_priming()
+        with db as curs:
+            tokens_by_id = dict()
+            tokens = dict()
+            for id, address, name, symbol, decimals, *_ in list(curs.list_tokens()):
+                tokens_by_id[id] = address.lower()
+                tokens[address.lower()] = (name, symbol, decimals)
+            exchanges = {id: address.lower() for id, address, *_ in list(curs.list_exchanges())}
+            pools = dict()
+            factories = dict()
+            for id, address, exchange_id, token0_id, token1_id, *_ in list(curs.list_pools()):
+                if token0_id not in tokens_by_id or token1_id not in tokens_by_id:
+                    continue
+                reserves = curs.get_lp_reserves_vals(id) or (0, 0)
+                pools[address.lower()] = [tokens_by_id[token0_id], tokens_by_id[token1_id], *reserves]
+                factories.setdefault(exchanges.get(exchange_id), []).append(address.lower())
+            factories.pop(None, None)
+            ka.setdefault("block_number", curs.reserves_block_number or 1)
+        return cls(tokens=tokens, pools=pools, factories=factories, **ka)
+
+    def call(self, to, data):
+        """Execute an eth_call. Returns the ABI encoded result"""
+        to = to.lower()
+        mid, args = data[:4], data[4:]
+        if mid == MID_TRY_AGGREGATE and to == MULTICALL_ADDRESS.lower():
+            return self.try_aggregate(args)
+        if to in self.pools:
+            token0, token1, reserve0, reserve1 = self.pools[to]
+            if mid == MID_GET_RESERVES:
+                return _uint(reserve0) + _uint(reserve1) + _uint(0)
+            if mid == MID_TOKEN0:
+                return _address(token0)
+            if mid == MID_TOKEN1:
+                return _address(token1)
+        if to in self.tokens:
+            name, symbol, decimals = self.tokens[to]
+            if mid == MID_NAME:
+                return _string(name)
+            if mid == MID_SYMBOL:
+                return _string(symbol)
+            if mid == MID_DECIMALS:
+                return _uint(decimals)
+        if to in self.factories:
+            pairs = self.factories[to]
+            if mid == MID_ALL_PAIRS_LENGTH:
+                return _uint(len(pairs))
+            if mid == MID_ALL_PAIRS:
+                i = _word(args, 0)
+                if i < len(pairs):
+                    return _address(pairs[i])
+        raise RPCError("execution reverted")
+
+    def try_aggregate(self, args):
+        calls_at = _word(args, WORD)
+        n = _word(args, calls_at)
+        items = calls_at + WORD
+        outcomes = []
+        for i in range(n):
+            tuple_at = items + _word(args, items + i * WORD)
+            target = "0x" + args[tuple_at + 12:tuple_at + WORD].hex()
+            data_at = tuple_at + _word(args, tuple_at + WORD)
+            calldata = args[data_at + WORD:data_at + WORD + _word(args, data_at)]
+            try:
+                outcomes.append((True, self.call(target, calldata)))
+            except RPCError:
+                outcomes.append((False, b''))
+        out = [_uint(WORD), _uint(n)]
+        offset = n * WORD
+        tuples = []
+        for success, data in outcomes:
+            out.append(_uint(offset))
+            padded = data.ljust((len(data) + WORD - 1) // WORD * WORD, b'\0')
+            tuples.append(_uint(success) + _uint(2 * WORD) + _uint(len(data)) + padded)
+            offset += len(tuples[-1])
+        return b''.join(out + tuples)
+
+    def new_hash(self):
+        return "0x%064x" % self.random.getrandbits(256)
+
+    def pick_pool(self, addresses=None):
+        if addresses:
+            candidates = [a for a in sorted(addresses) if a in self.pools]
+        else:
+            candidates = self.pool_addresses
+        return candidates and self.random.choice(candidates) or None
+
+    def walk_reserves(self, address):
+        _, _, reserve0, reserve1 = self.pools[address]
+        k = 1 + self.random.uniform(-0.01, 0.01)
+        return max(1, int(reserve0 * k)), max(1, int(reserve1 / k))
+
+    def add_logs(self, entries):
+        """Mine the given logs: they are served by eth_getLogs from now on"""
+        self.logs.extend(entries)
+
+    def get_logs(self, from_block, to_block, addresses=None, topic0=None):
+        return [entry for entry in self.logs
+                if from_block <= int(entry["blockNumber"], 16) <= to_block
+                and (not addresses or entry["address"].lower() in addresses)
+                and (topic0 is None or entry["topics"][0] == topic0)]
+
+    def next_sync_log(self, addresses=None, logs_per_block=50):
+        """Apply a random walk step to the reserves of a pool, and return its Sync log"""
+        address = self.pick_pool(addresses)
+        if address is None:
+            return None
+        reserve0, reserve1 = self.walk_reserves(address)
+        self.pools[address][2:] = [reserve0, reserve1]
+        if self.log_index >= logs_per_block:
+            self.block_number += 1
+            self.block_hash = self.new_hash()
+            self.log_index = 0
+        self.log_index += 1
+        entry = {"address": address
+                 , "topics": [PREDICTION_LOG_TOPIC0_SYNC]
+                 , "data": "0x" + (_uint(reserve0) + _uint(reserve1)).hex()
+                 , "blockNumber": hex(self.block_number)
+                 , "blockHash": self.block_hash
+                 , "logIndex": hex(self.log_index - 1)
+                 , "transactionHash": self.new_hash()
+                 , "transactionIndex": hex(self.log_index - 1)
+                 , "removed": False}
+        self.logs.append(entry)
+        return entry
+
+    def predicted_logs(self, count=5):
+        """eth_consPredictLogs() result: Sync logs of the next block, which leave the chain state untouched"""
+        logs = []
+        for i in range(count):
+            address = self.pick_pool()
+            if address is None:
+                break
+            reserve0, reserve1 = self.walk_reserves(address)
+            logs.append({"address": address
+                         , "topic0": PREDICTION_LOG_TOPIC0_SYNC
+                         , "data": "0x" + (_uint(reserve0) + _uint(reserve1)).hex()
+                         , "tx": self.new_hash()
+                         , "transactionIndex": i})
+        return {"blockNumber": self.block_number + 1, "logs": logs}
+
+
+class FakeNode:
+    """Serve a FakeChain over JSON-RPC: plain HTTP POST (batches included) and websocket, on the same port.
+
+       Runs in the event loop of the caller (see start()/stop()), or as a process of its own (see main()).
+       Every response is delayed by latency_ms, and a fraction error_rate of the calls gets an error.
+       Each logs subscription streams sync_rate synthetic Sync logs per second.
+       Given logs are pushed to the logs subscribers with notify_logs(), latency_ms late as well.
+       Like the public nodes do, eth_getLogs ranges wider than max_logs_range blocks, and logs filters
+       of more than max_filter_addresses addresses are refused (0: no limit)."""
+
+    HEADS_POLLING_INTERVAL = 0.01
+
+    def __init__(self, chain, latency_ms=0, error_rate=0, sync_rate=100, logs_per_block=50
+                 , max_logs_range=0, max_filter_addresses=0):
+        self.chain = chain
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.sync_rate = sync_rate
+        self.logs_per_block = logs_per_block
+        self.max_logs_range = max_logs_range
+        self.max_filter_addresses = max_filter_addresses
+        self.calls_ctr = 0
+        self.runner = None
+        self.url = None
+        self.ws_url = None
+        self._subscription_ctr = 0
+        self._log_subscribers = dict()  # subscription id -> (websocket, addresses or None)
+        self._websockets = set()
+
+    async def start(self, host="127.0.0.1", port=8545):
+        """Serve on host:port. With port 0, the system picks a free port: see self.url"""
+        app = web.Application()
+        app.router.add_route("*", "/", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = "http://%s:%u" % (host, port)
+        self.ws_url = "ws://%s:%u" % (host, port)
+        log.info("fake node serving %u pools and %u tokens at %s", len(self.chain.pools), len(self.chain.tokens), self.url)
+
+    async def stop(self):
+        # open websockets would hold the shutdown back, until their clients go away
+        for ws in list(self._websockets):
+            await ws.close(code=WSCloseCode.GOING_AWAY)
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request):
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return await self.handle_ws(request)
+        return web.json_response(await self.dispatch(await request.json()))
+
+    async def handle_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subscriptions = dict()
+        self._websockets.add(ws)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                await ws.send_json(await self.dispatch(json.loads(msg.data), ws=ws, subscriptions=subscriptions))
+        finally:
+            self._websockets.discard(ws)
+            for subscription, task in subscriptions.items():
+                self._log_subscribers.pop(subscription, None)
+                task.cancel()
+        return ws
+
+    async def dispatch(self, payload, **ka):
+        if self.latency_ms:
+            await sleep(self.latency_ms * 0.001)
+        if isinstance(payload, list):
+            return [self.call(req, **ka) for req in payload]
+        return self.call(payload, **ka)
+
+    def call(self, req, **ka):
+        self.calls_ctr += 1
+        res = {"jsonrpc": "2.0", "id": req.get("id")}
+        try:
+            if self.error_rate and self.chain.random.random() < self.error_rate:
+                raise RPCError("injected error")
+            handler = getattr(self, "rpc_%s" % req.get("method"), None)
+            if handler is None:
+                raise RPCError("the method %s does not exist/is not available" % req.get("method"), code=-32601)
+            res["result"] = handler(*req.get("params", []), **ka)
+        except RPCError as err:
+            res["error"] = {"code": err.code, "message": str(err)}
+        return res
+
+    def rpc_eth_chainId(self, **ka):
+        return hex(CHAIN_ID)
+
+    def rpc_net_version(self, **ka):
+        return str(CHAIN_ID)
+
+    def rpc_eth_blockNumber(self, **ka):
+        return hex(self.chain.block_number)
+
+    def rpc_eth_gasPrice(self, **ka):
+        return hex(5 * 10**9)
+
+    def rpc_eth_getBalance(self, address, block="latest", **ka):
+        return hex(0)
+
+    def rpc_eth_call(self, tx, block="latest", **ka):
+        data = tx.get("data") or tx.get("input") or "0x"
+        return "0x" + self.chain.call(tx["to"], bytes.fromhex(data[2:])).hex()
+
+    def rpc_eth_getLogs(self, flt, **ka):
+        def block(v):
+            if v is None or v in ("latest", "pending"):
+                return self.chain.block_number
+            return v == "earliest" and 0 or int(v, 16)
+        from_block = block(flt.get("fromBlock"))
+        to_block = block(flt.get("toBlock"))
+        if self.max_logs_range and to_block - from_block + 1 > self.max_logs_range:
+            raise RPCError("exceed maximum block range: %u" % self.max_logs_range)
+        topics = flt.get("topics") or [None]
+        return self.chain.get_logs(from_block, to_block, self.filter_addresses(flt), topics[0])
+
+    def filter_addresses(self, flt):
+        addresses = (flt or {}).get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        if not addresses:
+            return None
+        if self.max_filter_addresses and len(addresses) > self.max_filter_addresses:
+            raise RPCError("too many addresses in filter: %u" % self.max_filter_addresses)
+        return set(a.lower() for a in addresses)
+
+    def rpc_eth_consPredictLogs(self, *args, **ka):
+        return self.chain.predicted_logs()
+
+    def rpc_eth_subscribe(self, kind, flt=None, ws=None, subscriptions=None, **ka):
+        if ws is None:
+            raise RPCError("notifications not supported")
+        if kind == "newHeads":
+            self._subscription_ctr += 1
+            subscription = hex(self._subscription_ctr)
+            subscriptions[subscription] = get_event_loop().create_task(self.stream_new_heads(ws, subscription))
+            return subscription
+        if kind != "logs":
+            raise RPCError("unsupported subscription type %r" % kind)
+        addresses = self.filter_addresses(flt)
+        self._subscription_ctr += 1
+        subscription = hex(self._subscription_ctr)
+        subscriptions[subscription] = get_event_loop().create_task(self.stream_sync_logs(ws, subscription, addresses))
+        self._log_subscribers[subscription] = (ws, addresses)
+        return subscription
+
+    def rpc_eth_unsubscribe(self, subscription, subscriptions=None, **ka):
+        task = subscriptions and subscriptions.pop(subscription, None)
+        if task is None:
+            return False
+        self._log_subscribers.pop(subscription, None)
+        task.cancel()
+        return True
+
+    async def notify_logs(self, entries):
+        """Push the given logs to the logs subscribers whose filter matches their address, latency_ms late"""
+        if self.latency_ms:
+            await sleep(self.latency_ms * 0.001)
+        for subscription, (ws, addresses) in list(self._log_subscribers.items()):
+            for entry in entries:
+                if addresses and entry["address"].lower() not in addresses:
+                    continue
+                try:
+                    await ws.send_json({"jsonrpc": "2.0"
+                                        , "method": "eth_subscription"
+                                        , "params": {"subscription": subscription, "result": entry}})
+                except ConnectionError:
+                    break
+
+    async def stream_sync_logs(self, ws, subscription, addresses):
+        if not self.sync_rate:
+            return
+        try:
+            while not ws.closed:
+                await sleep(1.0 / self.sync_rate)
+                entry = self.chain.next_sync_log(addresses, self.logs_per_block)
+                if entry is None:
+                    continue
+                await ws.send_json({"jsonrpc": "2.0"
+                                    , "method": "eth_subscription"
+                                    , "params": {"subscription": subscription, "result": entry}})
+        except CancelledError:
+            raise
+        except ConnectionError:
+            pass
+
+    async def stream_new_heads(self, ws, subscription):
+        # blocks are closed by the synthetic Sync logs: heads move only while logs are streamed
+        block_number = self.chain.block_number
+        try:
+            while not ws.closed:
+                await sleep(self.HEADS_POLLING_INTERVAL)
+                if self.chain.block_number == block_number:
+                    continue
+                block_number = self.chain.block_number
+                await ws.send_json({"jsonrpc": "2.0"
+                                    , "method": "eth_subscription"
+                                    , "params": {"subscription": subscription
+                                                 , "result": {"number": hex(block_number)
+                                                              , "timestamp": hex(int(time()))}}})
+        except CancelledError:
+            raise
+        except ConnectionError:
+            pass
+
+
+def main():
+    from docopt import docopt
+    args = docopt(__doc__)
+    basicConfig(level=args["--verbose"] and "DEBUG" or "INFO")
+    seed = args["--seed"] and int(args["--seed"]) or None
+    if args["--fixture"]:
+        chain = FakeChain.from_fixture(args["--fixture"], seed=seed)
+    elif args["--status_db_dsn"]:
+        chain = FakeChain.from_status_db(args["--status_db_dsn"], seed=seed)
+    else:
+        raise SystemExit("either --status_db_dsn or --fixture is required")
+    node = FakeNode(chain
+                    , latency_ms=float(args["--latency_ms"])
+                    , error_rate=float(args["--error_rate"])
+                    , sync_rate=float(args["--sync_rate"])
+                    , logs_per_block=int(args["--logs_per_block"])
+                    , max_logs_range=int(args["--max_logs_range"])
+                    , max_filter_addresses=int(args["--max_filter_addresses"]))
+    ioloop = get_event_loop()
+    ioloop.run_until_complete(node.start(host=args["--host"], port=int(args["--port"])))
+    try:
+        ioloop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ioloop.run_until_complete(node.stop())
+
+
+if __name__ == '__main__':
+    main()
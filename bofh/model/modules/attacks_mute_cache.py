@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from time import time
+
+from bofh.model.modules.loggers import Loggers
+
+log = Loggers.constant_prediction
+
+
+class AttacksMuteCache:
+    """In-memory mute cache of the known attacks, keyed by path id.
+
+       An attack is muted if an attack across the same path was recorded less than deadline secs ago,
+       and it's still among the max_size most recent ones (0 means no size bound).
+       Both checks are O(1): entries are kept in recording order, so the expired and the exceeding ones
+       are all at the front. The attacks DB is only used to warm it up at startup (see preload())."""
+
+    def __init__(self, deadline, max_size=0):
+        self.deadline = deadline
+        self.max_size = max_size
+        self.entries = OrderedDict()  # path_id -> recording timestamp
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path_id):
+        return self.is_muted(path_id)
+
+    def is_muted(self, path_id, now=None):
+        ts = self.entries.get(path_id)
+        if ts is None:
+            return False
+        if (now or time()) - ts > self.deadline:
+            del self.entries[path_id]
+            return False
+        return True
+
+    def add(self, path_id, ts=None):
+        if ts is None:
+            ts = time()
+        self.entries[path_id] = ts
+        self.entries.move_to_end(path_id)
+        self.expunge(ts)
+
+    def expunge(self, now=None):
+        if now is None:
+            now = time()
+        while self.entries:
+            path_id, ts = next(iter(self.entries.items()))
+            if now - ts <= self.deadline and not (self.max_size and len(self.entries) > self.max_size):
+                break
+            del self.entries[path_id]
+
+    def preload(self, rows):
+        """Warm up from (path_id, timestamp) rows, oldest first"""
+        now = time()
+        for path_id, ts in rows:
+            self.entries[int(path_id)] = ts
+            self.entries.move_to_end(int(path_id))
+        self.expunge(now)
+        log.info("%u known attacks preloaded in the mute cache", len(self.entries))
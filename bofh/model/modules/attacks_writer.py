@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from threading import Lock
+from time import time, monotonic
+from typing import Any
+
+from bofh.model.modules.loggers import Loggers
+
+log = Loggers.constant_prediction
+
+
+@dataclass(frozen=True)
+class AttackRecord:
+    tag: int
+    attack_plan: Any
+    origin: str = None
+    blockNr: int = None
+    origin_tx: str = None
+    contract_address: str = None
+    deflationary: bool = False
+    detected_ts: float = None
+
+
+class AttacksWriteBehind:
+    """Write-behind queue of the detected attacks, towards the attacks DB.
+
+       add() only assigns the attack id locally, and queues an immutable record: the calldata, description
+       and steps rows are rendered by flush(), which writes all the queued attacks as one transaction
+       (group commit). So the prediction loop, and the execution decisions, never wait for the DB.
+       If the write fails, the records are queued back in front, to be retried by the next flush.
+
+       The DB connection is expected to be reserved to the writer, as flush() runs on a thread of its own."""
+
+    def __init__(self, db):
+        self.db = db
+        self.written_ctr = 0
+        self.flush_ctr = 0
+        self.flush_latency = 0.0
+        self._pending = []
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        with self.db as curs:
+            self._next_id = curs.max_attack_id() + 1
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, attack_plan, origin=None, blockNr=None, origin_tx=None, contract_address=None, deflationary=False):
+        """Queue an attack, and return its id. It's also set as attack_plan.tag"""
+        with self._lock:
+            tag = self._next_id
+            self._next_id += 1
+            self._pending.append(AttackRecord(tag=tag
+                                              , attack_plan=attack_plan
+                                              , origin=origin
+                                              , blockNr=blockNr
+                                              , origin_tx=origin_tx
+                                              , contract_address=contract_address
+                                              , deflationary=deflationary
+                                              , detected_ts=time()))
+        attack_plan.tag = tag
+        return tag
+
+    def due(self):
+        return bool(self._pending)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+            if not records:
+                return 0
+            t0 = monotonic()
+            try:
+                with self.db as curs:
+                    curs.add_attacks_batch(records)
+            except:
+                with self._lock:
+                    self._pending = records + self._pending
+                raise
+            self.flush_latency = monotonic() - t0
+            self.flush_ctr += 1
+            self.written_ctr += len(records)
+            log.debug("%u attacks recorded to db in %.3f secs", len(records), self.flush_latency)
+            return len(records)
@@ -1,38 +1,86 @@
-from asyncio import sleep
-from threading import Thread, Event
+from asyncio import sleep, gather, wait_for, CancelledError, Event, Queue, QueueEmpty, TimeoutError as WaitTimeout
+from time import time, monotonic
+
 from jsonrpc_base import TransportError
 from jsonrpc_websocket import Server
 
+from bofh.model.modules.attacks_mute_cache import AttacksMuteCache
 from bofh.model.modules.constants import PREDICTION_LOG_TOPIC0_SYNC, PREDICTION_LOG_TOPIC0_SWAP
+from bofh.model.modules.feeds_recording import FEED_PREDICTION
 from bofh.model.modules.loggers import Loggers
 from bofh.utils.misc import checkpointer
-from bofh.utils.web3 import parse_data_parameters
 
 log = Loggers.constant_prediction
 
 
-class ConstantPrediction:
-    def start(self):
-        self._constant_prediction_terminated = Event()
-        self.search_opportunities_by_prediction_thread()
-        self.pools_vs_txhashes = {}
+class PipelineStage:
+    """A stage of the prediction pipeline: its input queue, and its latency figures"""
 
-    def stop(self):
-        try:
-            self._constant_prediction_terminated.set()
-        except AttributeError:
-            pass
+    def __init__(self, name, queue=None):
+        self.name = name
+        self.queue = queue
+        self.ctr = 0
+        self.dropped = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def account(self, t0):
+        elapsed = monotonic() - t0
+        self.ctr += 1
+        self.latency += elapsed
+        if elapsed > self.max_latency:
+            self.max_latency = elapsed
+
+    def put_latest(self, item):
+        """Queue item, dropping the oldest queued ones if there is no room left"""
+        while self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
 
-    def join(self):
-        th = getattr(self, "_search_opportunities_by_prediction_thread", None)
-        if th:
-            th.join()
+    async def get_latest(self):
+        """Wait for an item, and return the newest queued one. The older ones are stale, and dropped"""
+        item = await self.queue.get()
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except QueueEmpty:
+                return item
+            self.dropped += 1
 
-    def search_opportunities_by_prediction_thread(self, constraint=None):
-        self._search_opportunities_by_prediction_thread = Thread(
-            target=lambda: self.ioloop.run_until_complete(self.prediction_polling_task(constraint))
-            , daemon=True)
-        self._search_opportunities_by_prediction_thread.start()
+    def __str__(self):
+        return "%s: %u jobs, avg %.1f ms, max %.1f ms, queue depth %s, %u dropped" % (
+            self.name
+            , self.ctr
+            , self.ctr and 1000.0 * self.latency / self.ctr or 0.0
+            , 1000.0 * self.max_latency
+            , "-" if self.queue is None else self.queue.qsize()
+            , self.dropped)
+
+
+class ConstantPrediction:
+    PREDICTION_MAX_PATH_LEN = 3
+    PREDICTION_MAX_PATHS_PER_LP = 1000
+    PREDICTION_QUEUE_SIZE = 2
+    ATTACKS_QUEUE_SIZE = 16
+    PREDICTION_RETRY_DELAY_MIN = 0.01
+    PREDICTION_RECONNECT_DELAY_MIN = 0.5
+    PREDICTION_RECONNECT_DELAY_MAX = 30
+    ATTACKS_FLUSH_INTERVAL = 0.05
+
+    def start(self, constraint=None, live=True):
+        self.pools_vs_txhashes = {}
+        self.prediction_events = 0
+        self.prediction_attacks = 0
+        self.prediction_stages = dict()
+        self.attacks_mute_cache = AttacksMuteCache(deadline=self.args.attacks_mute_cache_deadline
+                                                   , max_size=self.args.attacks_mute_cache_size)
+        with self.attacks_db as curs:
+            self.attacks_mute_cache.preload(curs.list_recent_attacks(time() - self.args.attacks_mute_cache_deadline
+                                                                     , self.args.attacks_mute_cache_size))
+        if live:
+            self.runtime_tasks.append(self.ioloop.create_task(self.prediction_pipeline_task(constraint)))
+            self.runtime_tasks.append(self.ioloop.create_task(self.attacks_writer_task()))
 
     def pack_payload_from_attack_plan(self, attack_plan, initialAmount=None, expectedAmount=None):
         path = attack_plan.path
@@ -50,106 +98,231 @@ class ConstantPrediction:
             expectedAmount = 0
         return self.pack_args_payload(pools, feesPPM, initialAmount, expectedAmount)
 
-    async def prediction_polling_task(self, constraint=None):
-        # await self.polling_started.wait()
+    async def prediction_pipeline_task(self, constraint=None):
+        """Run the prediction stages, joined by bounded queues:
+
+           - fetch: calls eth_consPredictLogs() on each newHeads notification (or every
+             --pred_polling_interval with --pred_polling), queues the payloads of new blocks.
+             It connects again with a back-off whenever the connection drops
+           - evaluate: applies a payload to the model and looks for attacks across it, on the graph worker
+           - execute: executes the attacks spotted, on a thread of the default executor
+
+           A payload still waiting when a newer one is in is stale, and dropped: evaluation always
+           takes the newest. So a slow evaluation or execution does not delay the next fetches."""
         if constraint is None:
             constraint = self.get_constraints()
-        constraint.max_paths_per_lp = 1000
-        constraint.max_path_len = 3
+        constraint.max_paths_per_lp = self.PREDICTION_MAX_PATHS_PER_LP
+        constraint.max_path_len = self.PREDICTION_MAX_PATH_LEN
+        predictions = Queue(maxsize=self.PREDICTION_QUEUE_SIZE)
+        attacks = Queue(maxsize=self.ATTACKS_QUEUE_SIZE)
+        self.prediction_stages = dict(fetch=PipelineStage("fetch")
+                                      , evaluate=PipelineStage("evaluate", predictions)
+                                      , execute=PipelineStage("execute", attacks))
+        log.info("entering prediction pipeline...")
+        try:
+            await gather(self.prediction_fetch_stage()
+                         , self.prediction_evaluate_stage(constraint)
+                         , self.prediction_execute_stage())
+        finally:
+            log.info("prediction pipeline terminated")
+
+    def prediction_pipeline_stats(self):
+        return "".join("\n \\__ %s" % stage for stage in self.prediction_stages.values())
 
-        log.info("entering prediction polling loop...")
-        server = Server(self.args.web3_rpc_url)
+    async def prediction_fetch_stage(self):
+        """Fetch the predictions of each new block. The connection is opened again whenever it fails
+           or drops, after a delay doubling at each failed attempt: the other stages wait meanwhile"""
+        stage = self.prediction_stages["fetch"]
+        new_head = Event()
+        polling_interval = self.args.pred_polling_interval * 0.001
+        delay = self.PREDICTION_RECONNECT_DELAY_MIN
 
         checkpoint = checkpointer(log.info, "constant_prediction checkpoint #{count}"
                                             ", uptime {elapsed_hr}"
                                             ", {events} events processed"
-                                            ", {attacks} potential attacks routes spotted")
+                                            ", {attacks} potential attacks routes spotted"
+                                            "{pipeline}")
 
-        events = 0
-        attacks = 0
-        stop_after_attacks = 1
         blockNumber = 0
 
-        try:
-            await server.ws_connect()
-            while not self._constant_prediction_terminated.is_set():
-                try:
-                    result = await server.eth_consPredictLogs(0
-                                                              , 0
-                                                              , PREDICTION_LOG_TOPIC0_SYNC
-                                                              , PREDICTION_LOG_TOPIC0_SWAP)
-                    checkpoint(events=events, attacks=attacks)
-                    if result["blockNumber"] <= blockNumber:
-                        continue
-                    blockNumber = result["blockNumber"]
-                    log.debug("prediction results are in for block %r", blockNumber)
-                except TransportError:
-                    # server disconnected
-                    raise
-                except:
-                    log.exception("Error during eth_consPredictLogs() RPC execution")
-                    continue
-                with self.status_lock:
-                    contract = self.get_contract()
-                    prediction_key = self.graph.start_predicted_snapshot()
+        while True:
+            server = Server(self.args.web3_rpc_url)
+            server.eth_subscription = lambda subscription, result: new_head.set()
+            heads_driven = False
+            retry_delay = 0
+            try:
+                await server.ws_connect()
+                if not getattr(self.args, "pred_polling", False):
                     try:
+                        await server.eth_subscribe("newHeads")
+                        heads_driven = True
+                        log.info("prediction fetches are driven by newHeads notifications")
+                    except TransportError:
+                        raise
+                    except Exception as err:
+                        log.warning("newHeads subscription refused (%r): polling predictions every %u ms instead"
+                                    , err, self.args.pred_polling_interval)
+                delay = self.PREDICTION_RECONNECT_DELAY_MIN
+                while True:
+                    try:
+                        new_head.clear()
+                        t0 = monotonic()
+                        result = await server.eth_consPredictLogs(0
+                                                                  , 0
+                                                                  , PREDICTION_LOG_TOPIC0_SYNC
+                                                                  , PREDICTION_LOG_TOPIC0_SWAP)
+                        stage.account(t0)
+                        checkpoint(events=self.prediction_events
+                                   , attacks=self.prediction_attacks
+                                   , pipeline=self.prediction_pipeline_stats())
+                        if result["blockNumber"] <= blockNumber:
+                            if heads_driven:
+                                # the node lags behind its own head: back off, and retry
+                                retry_delay = min(max(2 * retry_delay, self.PREDICTION_RETRY_DELAY_MIN)
+                                                  , polling_interval)
+                                log.debug("prediction results not ready past block %r, retrying in %.3f secs"
+                                          , blockNumber, retry_delay)
+                                await sleep(retry_delay)
+                            continue
+                        retry_delay = 0
+                        blockNumber = result["blockNumber"]
+                        if self.feeds_recorder:
+                            self.feeds_recorder.record(FEED_PREDICTION, result)
+                        log.debug("prediction results are in for block %r", blockNumber)
+                        # the evaluate stage picks it up while we wait for the next block
+                        self.prediction_stages["evaluate"].put_latest((result, blockNumber))
+                    except TransportError:
+                        # server disconnected
+                        raise
+                    except:
+                        log.exception("Error during eth_consPredictLogs() RPC execution")
+                        continue
+
+                    if heads_driven:
+                        # the polling interval is a safety net, in case of lost notifications
                         try:
-                            res = self.digest_prediction_payload(result, blockNumber, prediction_key)
-                            if res: events += res
-                        except:
-                            log.exception("Error during parsing of eth_consPredictLogs() results")
-                        try:
-                            matches = self.graph.evaluate_paths_of_interest(constraint, prediction_key)
-                            for i, attack_plan in enumerate(matches):
-
-                                if constraint.match_limit and i >= constraint.match_limit:
-                                    return
-                                new_entry = self.post_attack_to_db(attack_plan=attack_plan
-                                                                         , contract=contract
-                                                                         , origin="pred")
-                                if new_entry:
-                                    if stop_after_attacks and attacks >= stop_after_attacks:
-                                        continue
-                                    attacks += 1
-                                    self.execute_attack(attack_plan)
-                                else:
-                                    pass
-                                    #log.debug("match having path id %r is already in mute_cache. "
-                                    #          "activation inhibited", attack_plan.id())
-                        except:
-                            log.exception("Error during execution of TheGraph::evaluate_paths_of_interest()")
-                    finally:
-                        # forget about predicted states. go back to normal
-                        self.pools_vs_txhashes.clear()
-                        self.graph.terminate_predicted_snapshot(prediction_key)
-
-                await sleep(self.args.pred_polling_interval * 0.001)
-        except:
-            log.exception("Error in prediction polling thread")
-        finally:
-            log.info("prediction polling loop terminated")
+                            await wait_for(new_head.wait(), polling_interval)
+                        except WaitTimeout:
+                            pass
+                    else:
+                        await sleep(polling_interval)
+            except CancelledError:
+                await server.close()
+                raise
+            except TransportError as err:
+                log.info("prediction connection to %s failed or lost (%r) .. retrying .."
+                         , self.args.web3_rpc_url, err)
+            except:
+                log.exception("Error in prediction polling task .. retrying ..")
             await server.close()
+            await sleep(delay)
+            delay = min(delay * 2, self.PREDICTION_RECONNECT_DELAY_MAX)
+
+    async def prediction_evaluate_stage(self, constraint):
+        stage = self.prediction_stages["evaluate"]
+        execute = self.prediction_stages["execute"]
+        while True:
+            result, blockNumber = await stage.get_latest()
+            t0 = monotonic()
+            try:
+                # CPU bound: the event loop keeps serving the other stages meanwhile
+                attack_plans = await self.in_graph_worker(self.evaluate_prediction, result, blockNumber, constraint)
+            except CancelledError:
+                raise
+            except:
+                # already logged by the graph worker
+                continue
+            finally:
+                stage.account(t0)
+            for attack_plan in attack_plans:
+                execute.put_latest(attack_plan)
+
+    async def prediction_execute_stage(self):
+        stage = self.prediction_stages["execute"]
+        while True:
+            attack_plan = await stage.queue.get()
+            t0 = monotonic()
+            try:
+                # blocking web3 calls, off the graph worker
+                await self.ioloop.run_in_executor(None, self.execute_attack, attack_plan)
+            except CancelledError:
+                raise
+            except:
+                log.exception("Error during execution of attack %r", attack_plan.id())
+            finally:
+                stage.account(t0)
+
+    def evaluate_prediction(self, result, blockNumber, constraint, stop_after_attacks=1):
+        """Apply the predicted reserves to the model, and look for attacks across them.
+           Runs on the graph worker. Returns the attack plans to be executed."""
+        attack_plans = []
+        with self.status_lock:
+            contract = self.get_contract()
+            prediction_key = self.graph.start_predicted_snapshot()
+            try:
+                try:
+                    res = self.digest_prediction_payload(result, blockNumber, prediction_key)
+                    if res: self.prediction_events += res
+                except:
+                    log.exception("Error during parsing of eth_consPredictLogs() results")
+                try:
+                    matches = self.graph.evaluate_paths_of_interest(constraint, prediction_key)
+                    for i, attack_plan in enumerate(matches):
+
+                        if constraint.match_limit and i >= constraint.match_limit:
+                            break
+                        new_entry = self.post_attack_to_db(attack_plan=attack_plan
+                                                                 , contract=contract
+                                                                 , origin="pred")
+                        if new_entry:
+                            if stop_after_attacks and self.prediction_attacks >= stop_after_attacks:
+                                continue
+                            self.prediction_attacks += 1
+                            attack_plans.append(attack_plan)
+                        else:
+                            pass
+                            #log.debug("match having path id %r is already in mute_cache. "
+                            #          "activation inhibited", attack_plan.id())
+                except:
+                    log.exception("Error during execution of TheGraph::evaluate_paths_of_interest()")
+            finally:
+                # forget about predicted states. go back to normal
+                self.pools_vs_txhashes.clear()
+                self.graph.terminate_predicted_snapshot(prediction_key)
+        return attack_plans
+
+    async def attacks_writer_task(self):
+        writer = self.attacks_writer
+        while True:
+            await sleep(self.ATTACKS_FLUSH_INTERVAL)
+            if writer.due():
+                # group commit of the attacks queued meanwhile, on a thread of the default executor
+                try:
+                    await self.ioloop.run_in_executor(None, writer.flush)
+                except CancelledError:
+                    raise
+                except:
+                    log.exception("unable to record attacks to db")
 
     def post_attack_to_db(self, attack_plan, contract, origin):
-        with self.attacks_db as curs:
-            if curs.attack_is_in_mute_cache(
-                    attack_plan=attack_plan
-                    , cache_deadline=self.args.attacks_mute_cache_deadline
-                    , max_size=self.args.attacks_mute_cache_size):
-                return False
-            tx, txindex, blockNumber = None, None, None
-            for i in range(attack_plan.path.size()):
-                swap = attack_plan.path.get(i)
-                x = self.pools_vs_txhashes.pop(swap.pool.tag, None)
-                if x:
-                    tx, txindex, blockNumber = x
-                    break
-            curs.add_attack(attack_plan
-                                  , origin=origin
-                                  , blockNr=blockNumber
-                                  , origin_tx=tx
-                                  , contract_address=contract.address)
-            return True
+        """Record the attack, unless muted. It's only queued to the attacks writer: the DB is not waited for"""
+        path_id = attack_plan.id()
+        if self.attacks_mute_cache.is_muted(path_id):
+            return False
+        tx, txindex, blockNumber = None, None, None
+        for i in range(attack_plan.path.size()):
+            swap = attack_plan.path.get(i)
+            x = self.pools_vs_txhashes.pop(str(swap.pool.address).lower(), None)
+            if x:
+                tx, txindex, blockNumber = x
+                break
+        self.attacks_writer.add(attack_plan
+                                , origin=origin
+                                , blockNr=blockNumber
+                                , origin_tx=tx
+                                , contract_address=contract.address)
+        self.attacks_mute_cache.add(path_id)
+        return True
 
     def digest_prediction_payload(self, payload, blockNumber, prediction_key):
         events = 0
@@ -158,24 +331,20 @@ class ConstantPrediction:
         logs = payload["logs"]
         if not logs:
             return
+        sync_logs = []
         for log in logs:
             address = log["address"]
             if not address:
                 continue
-            pool = self.graph.lookup_lp(address, False)
-            if not pool:
-                logger.debug("unknown pool of interest: %s", address)
-                continue
             tx = log["tx"]
             txindex = log["transactionIndex"]
-            self.pools_vs_txhashes[pool.tag] = (tx, txindex, blockNumber)
+            self.pools_vs_txhashes[address.lower()] = (tx, txindex, blockNumber)
             topic0 = log["topic0"]
             if topic0 == PREDICTION_LOG_TOPIC0_SYNC:
-                events += 1
-                try:
-                    r0, r1 = parse_data_parameters(log["data"])
-                    pool.set_predicted_reserves(prediction_key, r0, r1)
-                except:
-                    continue
-                continue
+                sync_logs.append((address, log["data"], blockNumber))
+        if sync_logs:
+            updated, unknown = self.graph.apply_sync_logs(sync_logs, prediction_key)
+            events = len(updated)
+            for i in unknown:
+                logger.debug("unknown pool of interest: %s", sync_logs[i][0])
         return events
@@ -2,3 +2,6 @@ from bofh.utils.web3 import log_topic_id
 
 PREDICTION_LOG_TOPIC0_SWAP = log_topic_id("Swap(address,uint256,uint256,uint256,uint256,address)")
 PREDICTION_LOG_TOPIC0_SYNC = log_topic_id("Sync(uint112,uint112)")
+
+# Multicall3 aggregate-call contract (same address on all the major EVM chains, BSC included)
+MULTICALL_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
@@ -1,4 +1,4 @@
-from asyncio import get_event_loop
+from asyncio import get_event_loop, run_coroutine_threadsafe
 from functools import lru_cache
 from os.path import join, dirname, realpath
 
@@ -33,13 +33,23 @@ class ContractCalling:
             self.__w3 = Web3Connector.get_connection(self.__args.web3_rpc_url)
         return self.__w3
 
+    def run_coroutine(self, coro):
+        """Run coro on the event loop of this object, and wait for its outcome.
+
+           Once the loop is running (ie: the runner runtime), this is expected to be called from
+           a worker thread, and coro is scheduled as a task of the loop."""
+        if self.__io_loop.is_running():
+            return run_coroutine_threadsafe(coro, self.__io_loop).result()
+        return self.__io_loop.run_until_complete(coro)
+
     @property
     def jsonrpc_conn(self):
         try:
             res = self.__jsonrpc_conn
         except AttributeError:
             self.__jsonrpc_conn = res = Server(self.__args.web3_rpc_url)
-        self.__io_loop.run_until_complete(res.ws_connect())
+        if not res.connected:
+            self.run_coroutine(res.ws_connect())
         return res
 
     @lru_cache
@@ -157,7 +167,7 @@ class ContractCalling:
     def call_ll(self, from_address, to_address, calldata):
         conn = self.jsonrpc_conn
         f = conn.eth_estimateGas({"from":from_address, "to":to_address, "data":calldata}, "latest")
-        return self.__io_loop.run_until_complete(f)
+        return self.run_coroutine(f)
 
 
     def _call(self, name, *args, address=None, abi=None):
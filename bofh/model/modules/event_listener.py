@@ -1,195 +1,444 @@
-from json import loads
+from asyncio import sleep, wait, Queue, CancelledError
+from collections import deque
 from logging import basicConfig
-from threading import Thread, Event
-from urllib.parse import urlparse, splitport
+from time import monotonic
 
 from eth_utils import to_checksum_address
-from twisted.internet.protocol import ReconnectingClientFactory
-from autobahn.twisted.websocket import WebSocketClientProtocol, \
-    WebSocketClientFactory
-import json
-from twisted.internet import reactor
+from jsonrpc_base import TransportError
+from jsonrpc_websocket import Server
 from web3.exceptions import ContractLogicError
 
+from bofh.model.modules.feeds_recording import FEED_SYNC
 from bofh.model.modules.loggers import Loggers
+from bofh.model.modules.sync_subscriptions import SyncLogsSubscriptions
 from bofh.utils.misc import checkpointer
 from bofh.utils.web3 import log_topic_id, parse_data_parameters
 
 log = Loggers.realtime_sync_events
 
 
+TOPIC_SYNC = log_topic_id("Sync(uint112,uint112)")
+
+
+def sync_log_entry(result):
+    """Pick the result of a logs subscription notification carrying a Sync event.
+
+       Returns a raw (address, data, blockNumber) tuple, as expected by TheGraph.apply_sync_logs(),
+       or None for any other kind of log."""
+    if not isinstance(result, dict):
+        return None
+    blockNumber = result.get("blockNumber", None)
+    if isinstance(blockNumber, str):
+        if blockNumber.startswith("0x"):
+            blockNumber = int(blockNumber, 16)
+        else:
+            blockNumber = int(blockNumber)
+    address = result.get("address")
+    topics = result.get("topics")
+    hexdata = result.get("data")
+    if not address or not topics or not isinstance(topics, list) or topics[0] != TOPIC_SYNC:
+        return None
+    return address, hexdata, blockNumber
+
+
+def _int(v):
+    if isinstance(v, str):
+        return int(v, 16) if v.startswith("0x") else int(v)
+    return v
+
+
+def parse_sync_log(result):
+    """Parse the result of a logs subscription notification carrying a Sync event.
+
+       Returns a (address, reserve0, reserve1, blockNumber) tuple, or None for any other kind of log."""
+    entry = sync_log_entry(result)
+    if entry is None:
+        return None
+    address, hexdata, blockNumber = entry
+    reserve0, reserve1 = parse_data_parameters(hexdata)
+    return address, reserve0, reserve1, blockNumber
+
+
+class SyncEndpoint:
+    """A websocket endpoint feeding Sync logs, with its subscriptions and its arrival statistics"""
+
+    def __init__(self, url):
+        self.url = url
+        self.subscriptions = None
+        self.backfill_buffer = None
+        self.first = 0    # events delivered by this endpoint before the others
+        self.late = 0     # events already delivered by another endpoint
+        self.lag = 0.0    # total delay of the late events, in secs
+
+    def __str__(self):
+        events = self.first + self.late
+        return "%s: first on %.1f%% of %u events, %.1f ms late on average otherwise" % (
+            self.url
+            , events and 100.0 * self.first / events or 0.0
+            , events
+            , self.late and 1000.0 * self.lag / self.late or 0.0)
+
+
 class SyncEventRealtimeTracker:
-    def start(self):
-        self._sync_event_rt_terminated = Event()
+    """Track Sync events via a websocket logs subscription, as a task of the runner event loop.
+
+       Subscriptions are filtered on the addresses of the loaded pools (see SyncLogsSubscriptions),
+       and they follow the changes of self.pool_addresses every RESUBSCRIBE_INTERVAL seconds.
+       Notifications are queued raw as they arrive. The graph worker (see Runner.to_graph_worker())
+       drains the queue and applies all of its Sync logs with one TheGraph.apply_sync_logs() call,
+       so that bursts of events cost one lock and one crossing of the C++ boundary.
+
+       Addresses of pools not in the graph are remembered in a bounded in-memory set, preloaded
+       from the unknown_pools table: only the first sighting of a pool reaches the reports DB,
+       and that's done by a task of its own (see unknown_pools_task()), together with the resolution
+       of its factory. The graph worker never waits for disk or RPC calls because of irrelevant pools.
+
+       After each (re)connection, the Sync logs missed since the last applied block are fetched
+       with eth_getLogs (see sync_logs_backfill()). Live notifications are held back meanwhile,
+       then they are applied after the backfilled logs, so that updates are applied in block order.
+
+       Removed logs (ie: chain reorganizations) are queued as (None, None, blockNumber) markers:
+       the pools changed since that block are set back to their reserves before it, as recorded
+       by the undo log of the model (see TheGraph.rollback_sync_logs()), and so is the status DB.
+
+       More websocket endpoints can be given with --sync_ws_urls: all of them are subscribed, and each
+       Sync log is applied the first time it arrives, whatever the endpoint. Logs are told apart by
+       (blockNumber, blockHash, logIndex, address, removed): after a reorg, the log of the new canonical
+       block is another log than the removed one, even at the same position. Arrival statistics
+       are reported per endpoint."""
+
+    RECONNECT_DELAY_MIN = 0.5
+    RECONNECT_DELAY_MAX = 30
+    RESERVES_FLUSH_CHECK_INTERVAL = 1
+    RESUBSCRIBE_INTERVAL = 30
+    UNKNOWN_POOLS_CACHE_SIZE = 1000000
+    BACKFILL_RANGE = 500
+    REORG_UNDO_BLOCKS = 64
+    SEEN_SYNC_LOGS_SIZE = 100000
+
+    def start(self, live=True):
         self.checkpoint = checkpointer(log.info, "sync_events checkpoint #{count}"
                                                  ", uptime {elapsed_hr}"
                                                  ", {events} events processed"
-                                                 ", {new_pools} new pools spotted")
-        self.track_swaps_thread()
-        self.periodic_reserve_flush_thread()
+                                                 ", {new_pools} new pools spotted"
+                                                 ", {flushes} reserves flushes (last took {flush_latency:.3f}s"
+                                                 ", coalescing ratio {coalescing_ratio:.1f})"
+                                                 ", {warm_pools} pools warmed up"
+                                                 " ({warm_coverage:.1f}% of events on warm pools)"
+                                                 "{endpoints}")
         self.events = 0
         self.new_pools = 0
+        self.sync_logs_queue = deque()
+        self.sync_logs_scheduled = False
+        self.sync_endpoints = [SyncEndpoint(url) for url in self.sync_ws_urls]
+        # insertion ordered: the oldest entries are evicted first. Not needed with one endpoint only
+        self.seen_sync_logs = dict() if len(self.sync_endpoints) > 1 else None
+        self.last_sync_block = 0
+        self.graph.sync_undo_depth = self.REORG_UNDO_BLOCKS
+        self.unknown_pools = dict()  # insertion ordered: the oldest entries are evicted first
+        self.unknown_pools_queue = Queue()
+        self.preload_unknown_pools()
+        if not live:
+            return
+        for endpoint in self.sync_endpoints:
+            self.runtime_tasks.append(self.ioloop.create_task(self.track_sync_events_task(endpoint)))
+        self.runtime_tasks.append(self.ioloop.create_task(self.periodic_reserve_flush_task()))
+        self.runtime_tasks.append(self.ioloop.create_task(self.unknown_pools_task()))
 
-    def stop(self):
-        try:
-            reactor.stop()
-            self._sync_event_rt_terminated.set()
-        except AttributeError:
-            pass
-
-    def join(self):
-        th = getattr(self, "_track_swaps_thread", None)
-        if th:
-            th.join()
-        th = getattr(self, "_periodic_reserve_flush_thread", None)
-        if th:
-            th.join()
-
-    def track_swaps_thread(self):
-        if getattr(self, "_track_swaps_thread", None):
-            log.error("track_swaps_thread already started")
-        self._track_swaps_thread = Thread(target=self._track_swaps_task, daemon=True)
-        self._track_swaps_thread.start()
-
-    def _track_swaps_task(self):
-        try:
-            factory = EventLogListenerFactory(self, self.args.web3_rpc_url)
-            factory.run()
-        finally:
-            del self._track_swaps_thread
+    @property
+    def sync_ws_urls(self):
+        urls = getattr(self.args, "sync_ws_urls", None)
+        if not urls:
+            return [self.args.web3_rpc_url]
+        return [url.strip() for url in urls.split(",") if url.strip()]
+
+    def endpoints_stats(self):
+        if len(self.sync_endpoints) < 2:
+            return ""
+        return "".join("\n \\__ %s" % endpoint for endpoint in self.sync_endpoints)
+
+    def first_arrival(self, result, entry, endpoint=None):
+        """Tell if a Sync log is seen for the first time, accounting its arrival to endpoint"""
+        if entry[2] is None:
+            # pending log: nothing to tell it apart
+            return True
+        key = (entry[2]
+               , result.get("blockHash")
+               , result.get("logIndex")
+               , entry[0].lower()
+               , bool(result.get("removed")))
+        now = monotonic()
+        first = self.seen_sync_logs.get(key)
+        if first is None:
+            if len(self.seen_sync_logs) >= self.SEEN_SYNC_LOGS_SIZE:
+                del self.seen_sync_logs[next(iter(self.seen_sync_logs))]
+            self.seen_sync_logs[key] = now
+            if endpoint:
+                endpoint.first += 1
+            return True
+        if endpoint:
+            endpoint.late += 1
+            endpoint.lag += now - first
+        return False
+
+    def preload_unknown_pools(self):
+        with self.reports_db as curs:
+            for address in curs.list_unknown_pools():
+                self.remember_unknown_pool(address)
+        log.info("%u unknown pools preloaded from reports DB", len(self.unknown_pools))
+
+    def remember_unknown_pool(self, address):
+        """Add address to the unknown pools cache. Returns False if it was already there"""
+        address = address.lower()
+        if address in self.unknown_pools:
+            return False
+        if len(self.unknown_pools) >= self.UNKNOWN_POOLS_CACHE_SIZE:
+            del self.unknown_pools[next(iter(self.unknown_pools))]
+        self.unknown_pools[address] = None
+        return True
+
+    async def track_sync_events_task(self, endpoint):
+        delay = self.RECONNECT_DELAY_MIN
+        while True:
+            server = Server(endpoint.url)
+            server.eth_subscription = lambda subscription, result: self.on_subscription_message(subscription
+                                                                                                , result
+                                                                                                , endpoint)
+            subscriptions = SyncLogsSubscriptions(server
+                                                  , TOPIC_SYNC
+                                                  , shard_size=self.args.sync_subscription_shard_size
+                                                  , catch_all=self.args.sync_subscription_catch_all)
+            try:
+                listener = await server.ws_connect()
+                endpoint.subscriptions = subscriptions
+                # live notifications are held back until sync_logs_backfill() is done
+                endpoint.backfill_buffer = list()
+                await subscriptions.subscribe(list(self.pool_addresses))
+                log.info("WebSocket connection to %s open, subscribed to Sync events of %u pools "
+                         "(%u subscriptions%s)"
+                         , endpoint.url
+                         , len(subscriptions.watched)
+                         , len(subscriptions)
+                         , subscriptions.catch_all and ", plus catch-all" or "")
+                await self.sync_logs_backfill(server, endpoint)
+                delay = self.RECONNECT_DELAY_MIN
+                while not listener.done():
+                    await wait((listener,), timeout=self.RESUBSCRIBE_INTERVAL)
+                    if not listener.done():
+                        await subscriptions.update(list(self.pool_addresses))
+                await listener
+                log.info("WebSocket connection to %s closed", endpoint.url)
+            except CancelledError:
+                await server.close()
+                raise
+            except TransportError as err:
+                log.info("WebSocket connection to %s failed or lost (%r) .. retrying ..", endpoint.url, err)
+            except:
+                log.exception("Error in Sync events subscription to %s .. retrying ..", endpoint.url)
+            await server.close()
+            await sleep(delay)
+            delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
 
-    def periodic_reserve_flush_thread(self):
-        if getattr(self, "_periodic_reserve_flush_thread", None):
-            log.error("periodic_reserve_flush_thread already started")
-        self._periodic_reserve_flush_thread = Thread(target=self._periodic_reserve_flush_task, daemon=True)
-        self._periodic_reserve_flush_thread.start()
+    async def sync_logs_backfill(self, server, endpoint):
+        """Apply the Sync logs emitted since the last applied block, up to the current head.
 
-    def _periodic_reserve_flush_task(self):
+           The last applied block is fetched again, as it may have been seen only in part:
+           Sync logs carry absolute reserves, so applying them twice is harmless.
+           Live notifications buffered meanwhile are applied next, except those
+           not newer than the backfilled range, which are duplicates."""
+        subscriptions = endpoint.subscriptions
+        from_block = max(self.last_sync_block, self.graph.reserves_block_number)
+        backfilled = list()
+        # the live notifications are known duplicates only once the backfill is done
+        backfilled_to = None
         try:
-            while True:
-                if self._sync_event_rt_terminated.wait(timeout=60):
-                    return
-                if not self.reserves_update_batch:
-                    continue
-                log.debug("syncing %u pool reserves udates to db...", len(self.reserves_update_batch))
-                with self.status_lock, self.db as curs:
-                    curs.update_pool_reserves_batch(self.reserves_update_batch)
-                    curs.reserves_block_number = self.reserves_update_blocknr
-                    self.reserves_update_batch.clear()
+            if from_block > 0:
+                head = _int(await server.eth_blockNumber())
+                for result in await self.fetch_sync_logs(server, from_block, head):
+                    entry = not result.get("removed") and sync_log_entry(result)
+                    if not entry or not (subscriptions.catch_all or entry[0].lower() in subscriptions.watched):
+                        continue
+                    if self.seen_sync_logs is None or self.first_arrival(result, entry):
+                        backfilled.append(entry)
+                backfilled_to = head
+                log.info("backfilled %u Sync events of blocks %u-%u", len(backfilled), from_block, head)
+        except TransportError:
+            raise
+        except:
+            log.exception("unable to backfill Sync events since block %u .. resuming live events", from_block)
         finally:
-            del self._periodic_reserve_flush_thread
+            live, endpoint.backfill_buffer = endpoint.backfill_buffer or [], None
+            if backfilled_to is not None:
+                live = [entry for entry in live if entry[0] is None or entry[2] is None or entry[2] > backfilled_to]
+            self.queue_sync_logs(backfilled + live)
 
-    def on_sync_event(self, address, reserve0, reserve1, blocknr):
-        self.checkpoint(events=self.events, new_pools=self.new_pools)
-        self.events += 1
-        with self.status_lock:
-            pool = self.graph.lookup_lp(address, False)
-            if pool:
-                log.debug("use Sync event to update reserves of pool %r: %s(%s-%s), reserve=%r, reserve1=%r"
-                              , pool.address
-                              , pool.exchange.name
-                              , pool.token0.symbol
-                              , pool.token1.symbol
-                              , reserve0
-                              , reserve1)
-                pool.setReserves(reserve0, reserve1)
-                if not isinstance(reserve0, str): reserve0 = str(reserve0)
-                if not isinstance(reserve1, str): reserve1 = str(reserve1)
-                self.reserves_update_batch.append((reserve0, reserve1, pool.tag))
-                if blocknr and blocknr > self.reserves_update_blocknr:
-                    self.reserves_update_blocknr = blocknr
-            else:
-                # unknown pool. annotate it
-                address = to_checksum_address(address)
-                with self.reports_db as curs:
-                    is_new = curs.add_unknown_pool(address)
-                    if is_new:
-                        self.new_pools += 1
-                        contract = self.get_contract(address=address, abi="IGenericLiquidityPool")
-                        try:
-                            factory = contract.functions.factory().call()
-                            log.debug("discovered new liquidity pool %s, has factory %s", address, factory)
-                            curs.set_unknown_pool_factory(address, factory)
-                        except ContractLogicError:
-                            log.warning("discovered pool %s is broken/has no factory. marked as disabled", address)
-                            curs.set_unknown_pool_disabled(address, 1)
-
-
-class EventLogClientProtocol(WebSocketClientProtocol):
-    def onConnect(self, response):
-        log.info("Server connected: {0}".format(response.peer))
-
-    def onConnecting(self, transport_details):
-        log.info("Connecting; transport details: {}".format(transport_details))
-        return None  # ask for defaults
-
-    TOPIC_SYNC = log_topic_id("Sync(uint112,uint112)")
-
-    def onOpen(self):
-        log.info("WebSocket connection open.")
-        # Change this part to the subscription you want to get
-        self.sendMessage(json.dumps({"jsonrpc":"2.0","id": 1, "method": "eth_subscribe", "params": ["logs", {"topics": [self.TOPIC_SYNC]}]}).encode('utf8'))
-        #self.sendMessage(json.dumps({"jsonrpc":"2.0","id": 1, "method": "eth_subscribe", "params": ["logs"]}).encode('utf8'))
-
-    def onMessage(self, payload, isBinary):
-        if isBinary:
-            payload = payload.decode("utf-8")
-        data = loads(payload)
-        if not isinstance(data, dict):
+    async def fetch_sync_logs(self, server, from_block, to_block):
+        """eth_getLogs() of the Sync events of a block range, in block order.
+           The range is split whenever the node refuses it"""
+        logs = list()
+        next_block = from_block
+        span = self.BACKFILL_RANGE
+        while next_block <= to_block:
+            last_block = min(next_block + span - 1, to_block)
+            try:
+                logs.extend(await server.eth_getLogs({"fromBlock": hex(next_block)
+                                                      , "toBlock": hex(last_block)
+                                                      , "topics": [TOPIC_SYNC]}))
+            except TransportError:
+                raise
+            except Exception as err:
+                if last_block == next_block:
+                    raise
+                span = max(1, (last_block - next_block + 1) // 2)
+                log.debug("eth_getLogs refused range %u-%u (%r), range is now %u blocks"
+                          , next_block, last_block, err, span)
+                continue
+            next_block = last_block + 1
+        logs.sort(key=lambda l: (_int(l["blockNumber"]), _int(l["logIndex"])))
+        return logs
+
+    def on_subscription_message(self, subscription, result, endpoint=None):
+        entry = sync_log_entry(result)
+        if not entry:
             return
-        params = data.get("params")
-        if not isinstance(params, dict):
+        if endpoint and endpoint.subscriptions and endpoint.subscriptions.is_redundant(subscription, entry[0]):
+            # the address filtered subscriptions deliver this one
             return
-        result = params.get("result")
-        if not isinstance(result, dict):
+        if self.seen_sync_logs is not None and not self.first_arrival(result, entry, endpoint):
             return
-        blockNumber = result.get("blockNumber", None)
-        if isinstance(blockNumber, str):
-            if blockNumber.startswith("0x"):
-                blockNumber = int(blockNumber, 16)
-            else:
-                blockNumber = int(blockNumber)
-        address = result.get("address")
-        topics = result.get("topics")
-        hexdata = result.get("data")
-        if not data or not address or not topics or not isinstance(topics, list):
+        if self.feeds_recorder:
+            self.feeds_recorder.record(FEED_SYNC, result)
+        if result.get("removed"):
+            if not entry[2]:
+                return
+            entry = (None, None, entry[2])
+        if endpoint and endpoint.backfill_buffer is not None:
+            endpoint.backfill_buffer.append(entry)
             return
-        if self.TOPIC_SYNC == topics[0]:
-            reserve0, reserve1 = parse_data_parameters(hexdata)
-            if self.factory.bofh:
-                self.factory.bofh.on_sync_event(address, reserve0, reserve1, blockNumber)
+        self.queue_sync_logs((entry, ))
 
-    def onClose(self, wasClean, code, reason):
-        log.info("WebSocket connection closed: {0}".format(reason))
+    def queue_sync_logs(self, entries):
+        if not entries:
+            return
+        self.sync_logs_queue.extend(entries)
+        if not self.sync_logs_scheduled:
+            self.sync_logs_scheduled = True
+            self.to_graph_worker(self.apply_queued_sync_logs)
 
+    def apply_queued_sync_logs(self):
+        # reset the flag first: entries appended from now on get another run scheduled
+        self.sync_logs_scheduled = False
+        entries = []
+        reorged_block = None
+        while self.sync_logs_queue:
+            entry = self.sync_logs_queue.popleft()
+            if entry[0] is not None:
+                if reorged_block:
+                    self.on_reorg(reorged_block)
+                    reorged_block = None
+                entries.append(entry)
+                continue
+            if entries:
+                self.on_sync_logs(entries)
+                entries = []
+            # consecutive removed logs are rolled back at once, since the earliest block
+            reorged_block = min(reorged_block or entry[2], entry[2])
+        if reorged_block:
+            self.on_reorg(reorged_block)
+        if entries:
+            self.on_sync_logs(entries)
 
-class EventLogListenerFactory(WebSocketClientFactory, ReconnectingClientFactory):
-    def __init__(self, bofh, connection_url):
-        self.bofh = bofh
-        self.connection_url = connection_url
-        super(EventLogListenerFactory, self).__init__(connection_url)
+    def on_reorg(self, blocknr):
+        with self.status_lock:
+            restored = self.graph.rollback_sync_logs(blocknr)
+            self.reserves_flusher.add(restored)
+            if self.last_sync_block >= blocknr:
+                self.last_sync_block = blocknr - 1
+        log.info("chain reorganization at block %u: %u pools set back to their previous reserves"
+                 , blocknr, len(restored))
 
-    protocol = EventLogClientProtocol
+    async def periodic_reserve_flush_task(self):
+        flusher = self.reserves_flusher
+        while True:
+            await sleep(self.RESERVES_FLUSH_CHECK_INTERVAL)
+            if flusher.due():
+                # the DB write runs on a thread of the default executor: neither the event loop,
+                # nor the graph worker wait for it
+                try:
+                    await self.ioloop.run_in_executor(None, flusher.flush)
+                except CancelledError:
+                    raise
+                except:
+                    log.exception("unable to sync pool reserves updates to db")
+                    continue
+                self.graph.reserves_block_number = flusher.block_number
+                await self.ioloop.run_in_executor(None, self.refresh_graph_snapshot)
 
-    def clientConnectionFailed(self, connector, reason):
-        log.info("Client connection failed .. retrying ..")
-        self.retry(connector)
+    def on_sync_logs(self, entries):
+        """Apply a batch of raw (address, data, blockNumber) Sync logs, in order"""
+        self.checkpoint(events=self.events
+                        , new_pools=self.new_pools
+                        , flushes=self.reserves_flusher.flush_ctr
+                        , flush_latency=self.reserves_flusher.flush_latency
+                        , coalescing_ratio=self.reserves_flusher.coalescing_ratio
+                        , warm_pools=len(self.warm_pools)
+                        , warm_coverage=self.warmup_coverage(self.events)
+                        , endpoints=self.endpoints_stats())
+        self.events += len(entries)
+        blocknr = max(entry[2] or 0 for entry in entries)
+        if blocknr > self.last_sync_block:
+            self.last_sync_block = blocknr
+        with self.status_lock:
+            updated, unknown = self.graph.apply_sync_logs(entries)
+            log.debug("%u Sync events applied, %u of unknown pools", len(updated), len(unknown))
+            self.reserves_flusher.add(updated)
+            for reserve0, reserve1, blocknr, tag in updated:
+                self.count_sync_event(tag)
+                if self.live_synced_pools is not None:
+                    # reserves are still being loaded in background: do not let them overwrite this
+                    self.live_synced_pools[tag] = blocknr
+            for i in unknown:
+                self.on_unknown_pool(entries[i][0])
 
-    def clientConnectionLost(self, connector, reason):
-        log.info("Client connection lost .. retrying ..")
-        self.retry(connector)
+    def on_unknown_pool(self, address):
+        if self.remember_unknown_pool(address):
+            self.ioloop.call_soon_threadsafe(self.unknown_pools_queue.put_nowait, address)
 
-    def run(self):
-        host, port = splitport(urlparse(self.connection_url).netloc)
-        port = int(port)
-        reactor.connectTCP(host, port, self)
-        reactor.run(installSignalHandlers=False)
+    async def unknown_pools_task(self):
+        while True:
+            address = await self.unknown_pools_queue.get()
+            try:
+                await self.ioloop.run_in_executor(None, self.annotate_unknown_pool, address)
+            except CancelledError:
+                raise
+            except:
+                log.exception("unable to annotate unknown pool %s", address)
 
-    def stop(self):
-        reactor.stop()
+    def annotate_unknown_pool(self, address):
+        address = to_checksum_address(address)
+        with self.reports_db as curs:
+            is_new = curs.add_unknown_pool(address)
+            if is_new:
+                self.new_pools += 1
+                contract = self.get_contract(address=address, abi="IGenericLiquidityPool")
+                try:
+                    factory = contract.functions.factory().call()
+                    log.debug("discovered new liquidity pool %s, has factory %s", address, factory)
+                    curs.set_unknown_pool_factory(address, factory)
+                except ContractLogicError:
+                    log.warning("discovered pool %s is broken/has no factory. marked as disabled", address)
+                    curs.set_unknown_pool_disabled(address, 1)
 
 
 if __name__ == '__main__':
+    from asyncio import get_event_loop
     basicConfig(level="INFO")
-    factory = EventLogListenerFactory(None, "ws://127.0.0.1:8546")
-    factory.run()
+
+    async def dump_sync_events(url="ws://127.0.0.1:8546"):
+        server = Server(url)
+        server.eth_subscription = lambda subscription, result: log.info("%r", parse_sync_log(result))
+        listener = await server.ws_connect()
+        await server.eth_subscribe("logs", {"topics": [TOPIC_SYNC]})
+        await listener
+
+    get_event_loop().run_until_complete(dump_sync_events())
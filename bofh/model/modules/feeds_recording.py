@@ -0,0 +1,106 @@
+import gzip
+import json
+from asyncio import sleep
+from time import time, monotonic
+
+from bofh.model.modules.loggers import Loggers
+
+log = Loggers.runner
+
+
+FEED_SYNC = "s"         # a logs subscription notification (the result object)
+FEED_PREDICTION = "p"   # an eth_consPredictLogs() result
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class FeedRecorder:
+    """Append the live feeds to a file, one [timestamp, kind, payload] JSON array per line.
+
+       The file is gzip compressed if its name ends with .gz. Appending to an existing file adds
+       to its content (for gzip files, as a new member)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.out = _open(path, "a")
+        self.ctr = 0
+
+    def record(self, kind, payload):
+        self.out.write(json.dumps([round(time(), 6), kind, payload], separators=(",", ":")))
+        self.out.write("\n")
+        self.ctr += 1
+
+    def close(self):
+        self.out.close()
+        log.info("%u feed records appended to %s", self.ctr, self.path)
+
+
+def read_feeds(path):
+    """Yield the (timestamp, kind, payload) records of a feeds file, in order"""
+    with _open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield tuple(json.loads(line))
+
+
+class FeedsReplay:
+    """Replay a recorded feeds file through the runner, in place of the live services.
+
+       Sync logs are fed to on_subscription_message(), predictions are evaluated on the graph worker,
+       up to the attacks lookup (no attack is executed, nor posted to DB).
+       speed is the time scale of the replay (1 means original speed), 0 means as fast as possible."""
+
+    def start_replay(self, path, speed=0, constraint=None):
+        self.runtime_tasks.append(self.ioloop.create_task(self.feeds_replay_task(path, speed, constraint)))
+
+    async def feeds_replay_task(self, path, speed, constraint):
+        if constraint is None:
+            constraint = self.get_constraints()
+        constraint.max_paths_per_lp = self.PREDICTION_MAX_PATHS_PER_LP
+        constraint.max_path_len = self.PREDICTION_MAX_PATH_LEN
+        log.info("replaying feeds from %s (%s)", path, speed and "speed x%g" % speed or "as fast as possible")
+        sync_ctr = 0
+        latencies = []
+        first_ts = None
+        t0 = monotonic()
+        for ts, kind, payload in read_feeds(path):
+            if first_ts is None:
+                first_ts = ts
+            if speed:
+                delay = (ts - first_ts) / speed - (monotonic() - t0)
+                if delay > 0:
+                    await sleep(delay)
+            if kind == FEED_SYNC:
+                sync_ctr += 1
+                self.on_subscription_message(None, payload)
+            elif kind == FEED_PREDICTION:
+                t1 = monotonic()
+                await self.in_graph_worker(self.replay_prediction, payload, constraint)
+                latencies.append(monotonic() - t1)
+        # wait for the queued Sync logs to be applied
+        await self.in_graph_worker(lambda: None)
+        elapsed = monotonic() - t0
+        log.info("feeds replay done in %.3f secs: %u Sync events (%.0f events/s), %u predictions"
+                 , elapsed, sync_ctr, elapsed and sync_ctr / elapsed or 0, len(latencies))
+        if latencies:
+            latencies.sort()
+            log.info(" \\__ prediction latency: avg %.3f ms, p50 %.3f ms, p99 %.3f ms, max %.3f ms"
+                     , 1000 * sum(latencies) / len(latencies)
+                     , 1000 * latencies[len(latencies) // 2]
+                     , 1000 * latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+                     , 1000 * latencies[-1])
+
+    def replay_prediction(self, result, constraint):
+        with self.status_lock:
+            prediction_key = self.graph.start_predicted_snapshot()
+            try:
+                self.prediction_events += self.digest_prediction_payload(result, result["blockNumber"], prediction_key) or 0
+                matches = self.graph.evaluate_paths_of_interest(constraint, prediction_key)
+                self.prediction_attacks += len(matches)
+            finally:
+                self.pools_vs_txhashes.clear()
+                self.graph.terminate_predicted_snapshot(prediction_key)
@@ -0,0 +1,100 @@
+from collections import Counter
+from threading import Thread, Event
+from time import monotonic
+
+from bofh.model.modules.loggers import Loggers
+
+log = Loggers.path_evaluation
+
+
+class PathsIndexWarmup:
+    """Precompute the paths index entries of the busiest pools, on a background thread.
+
+       Pools are ranked by the frequency of their Sync events (counted by on_sync_logs()),
+       with an exponential decay at each round, so that recent activity weighs more.
+       Each round spends at most --paths_warmup_round_secs on path discovery, and warmup stops
+       for good once the paths index holds --paths_warmup_max_paths paths.
+       The paths index is saved to --paths_index_file as warmup grows it, and once it's completed."""
+
+    WARMUP_INTERVAL_SECS = 10
+    WARMUP_DECAY = 0.5
+    WARMUP_MIN_SCORE = 0.01
+    PATHS_INDEX_SAVE_INTERVAL_SECS = 600
+
+    def start(self):
+        self._paths_warmup_terminated = Event()
+        self.sync_events_per_pool = Counter()
+        self.warm_pools = set()
+        self.warm_events = 0
+        if not self.args.paths_warmup_max_paths:
+            return
+        self._paths_warmup_thread = Thread(target=self._paths_warmup_task, daemon=True)
+        self._paths_warmup_thread.start()
+
+    def stop(self):
+        try:
+            self._paths_warmup_terminated.set()
+        except AttributeError:
+            pass
+
+    def join(self):
+        th = getattr(self, "_paths_warmup_thread", None)
+        if th:
+            th.join()
+
+    def count_sync_event(self, tag):
+        """Account a Sync event of a known pool, given its tag. Expected to be called under status_lock"""
+        self.sync_events_per_pool[tag] += 1
+        if tag in self.warm_pools:
+            self.warm_events += 1
+
+    def warmup_coverage(self, events):
+        """Percentage of the Sync events that hit an already warm pool"""
+        return events and 100.0 * self.warm_events / events or 0.0
+
+    def _paths_warmup_task(self):
+        ranking = Counter()
+        saved_paths = self.graph.paths_count()
+        saved_at = monotonic()
+        try:
+            while not self._paths_warmup_terminated.wait(timeout=self.WARMUP_INTERVAL_SECS):
+                with self.status_lock:
+                    counts, self.sync_events_per_pool = self.sync_events_per_pool, Counter()
+                ranking = Counter({tag: score * self.WARMUP_DECAY for tag, score in ranking.items()
+                                   if score * self.WARMUP_DECAY >= self.WARMUP_MIN_SCORE
+                                   and tag not in self.warm_pools})
+                ranking.update(counts)
+                if not self.paths_warmup_round(ranking):
+                    log.info("paths index warmup completed: %u pools warm, %u paths in index"
+                             , len(self.warm_pools), self.graph.paths_count())
+                    self.save_paths_index()
+                    return
+                if monotonic() - saved_at >= self.PATHS_INDEX_SAVE_INTERVAL_SECS \
+                        and self.graph.paths_count() != saved_paths:
+                    saved_paths = self.graph.paths_count()
+                    saved_at = monotonic()
+                    self.save_paths_index()
+        except:
+            log.exception("paths index warmup failed")
+        finally:
+            del self._paths_warmup_thread
+
+    def paths_warmup_round(self, ranking):
+        """Warm up the top ranked pools which are not warm yet, within the round time budget.
+
+           Returns False once the paths index is over its size budget."""
+        deadline = monotonic() + self.args.paths_warmup_round_secs
+        for tag, _ in ranking.most_common():
+            if self.graph.paths_count() >= self.args.paths_warmup_max_paths:
+                return False
+            if monotonic() >= deadline or self._paths_warmup_terminated.is_set():
+                break
+            if tag in self.warm_pools:
+                continue
+            pool = self.graph.lookup_lp(tag, False)
+            if pool:
+                self.graph.warmup_paths_crossing_lp(pool
+                                                    , self.PREDICTION_MAX_PATH_LEN
+                                                    , self.PREDICTION_MAX_PATHS_PER_LP)
+            self.warm_pools.add(tag)
+        return True
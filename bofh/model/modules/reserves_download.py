@@ -0,0 +1,142 @@
+from asyncio import get_event_loop, gather
+from collections import deque
+
+from bofh.model.modules.constants import MULTICALL_ADDRESS
+from bofh.model.modules.loggers import Loggers
+from bofh.utils.web3 import JSONRPCConnector, method_id
+
+
+WORD = 32
+
+
+def _word(data, offset):
+    return int.from_bytes(data[offset:offset+WORD], "big")
+
+
+def encode_try_aggregate(calls):
+    """ABI-encode a call to Multicall.tryAggregate(bool,(address,bytes)[]) with requireSuccess=false.
+
+       calls is a sequence of (target_address, calldata) tuples, where calldata is a bytes object
+       no longer than 32 bytes (that's the case of all the view functions we need, which have no arguments).
+       Returns the 0x... hexstring of the calldata"""
+    n = len(calls)
+    tuple_size = 4 * WORD  # address, offset to bytes, bytes length, bytes (padded to one word)
+    out = [bytes.fromhex(method_id("tryAggregate(bool,(address,bytes)[])")[2:])
+        , (0).to_bytes(WORD, "big")  # requireSuccess=false
+        , (2 * WORD).to_bytes(WORD, "big")  # offset of calls[]
+        , n.to_bytes(WORD, "big")]
+    for i in range(n):
+        out.append((n * WORD + i * tuple_size).to_bytes(WORD, "big"))
+    for target, calldata in calls:
+        assert len(calldata) <= WORD
+        out.append(bytes.fromhex(target[2:]).rjust(WORD, b'\0'))
+        out.append((2 * WORD).to_bytes(WORD, "big"))
+        out.append(len(calldata).to_bytes(WORD, "big"))
+        out.append(calldata.ljust(WORD, b'\0'))
+    return "0x" + b''.join(out).hex()
+
+
+def decode_try_aggregate(res):
+    """Decode the (bool success, bytes returnData)[] outcome of Multicall.tryAggregate().
+
+       Returns a list of returnData bytes objects, or None for the failed calls."""
+    if isinstance(res, str):
+        res = bytes.fromhex(res[2:] if res.startswith("0x") else res)
+    res = bytes(res)
+    base = _word(res, 0)
+    n = _word(res, base)
+    items = base + WORD
+    out = []
+    for i in range(n):
+        tuple_start = items + _word(res, items + i * WORD)
+        success = _word(res, tuple_start)
+        data_start = tuple_start + _word(res, tuple_start + WORD)
+        data_len = _word(res, data_start)
+        data = res[data_start+WORD:data_start+WORD+data_len]
+        if len(data) != data_len:
+            raise ValueError("truncated tryAggregate() response")
+        out.append(data if success else None)
+    return out
+
+
+def parse_reserves(data):
+    """Parse getReserves() returned data: (reserve0, reserve1, blockTimestampLast)"""
+    if data is None or len(data) < 3 * WORD:
+        return None
+    return _word(data, 0), _word(data, WORD), _word(data, 2 * WORD)
+
+
+class ReservesSnapshotDownloader:
+    """Download LP reserves packing many PoolContract.getReserves() calls into each
+       aggregate-call (Multicall.tryAggregate()) eth_call invocation.
+
+       All the calls are pinned to one single block number, so that the resulting snapshot is consistent.
+
+       Batch size is adaptive: it's halved whenever a whole batch fails (ie: the node refuses
+       the gas or the response size) and grows back on success.
+       Items failing individually are retried in later batches, up to max_attempts times.
+
+       download() produces the same (pool_addr, reserve0, reserve1, blockTimestampLast) stream of
+       the getReserves() function, with None values for pools which never returned valid reserves.
+    """
+    def __init__(self, block_number
+                 , connection=None
+                 , multicall_address=MULTICALL_ADDRESS
+                 , batch_size=100
+                 , min_batch_size=1
+                 , max_batch_size=1000
+                 , max_attempts=4
+                 , max_pending=4):
+        self.block_number = block_number
+        self.exe = connection or JSONRPCConnector.get_connection()
+        self.ioloop = get_event_loop()
+        self.multicall_address = multicall_address
+        self.batch_size = max(min_batch_size, min(batch_size, max_batch_size))
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_attempts = max_attempts
+        self.max_pending = max(1, max_pending)
+        self.mid = bytes.fromhex(method_id("getReserves()")[2:])
+        self.calls_ctr = 0
+
+    async def call_batch(self, addresses):
+        data = encode_try_aggregate([(addr, self.mid) for addr in addresses])
+        self.calls_ctr += 1
+        res = await self.exe.eth_call({"to": self.multicall_address, "data": data}, hex(self.block_number))
+        results = decode_try_aggregate(res)
+        if len(results) != len(addresses):
+            raise ValueError("tryAggregate() returned %u results for %u calls" % (len(results), len(addresses)))
+        return [parse_reserves(r) for r in results]
+
+    async def call_batches(self, batches):
+        return await gather(*[self.call_batch([addr for addr, _ in b]) for b in batches], return_exceptions=True)
+
+    def download(self, pool_addresses):
+        log = Loggers.preloader
+        queue = deque((addr, 0) for addr in pool_addresses)
+        while queue:
+            batches = []
+            for _ in range(self.max_pending):
+                if not queue:
+                    break
+                batches.append([queue.popleft() for _ in range(min(self.batch_size, len(queue)))])
+            outcomes = self.ioloop.run_until_complete(self.call_batches(batches))
+            for batch, outcome in zip(batches, outcomes):
+                if isinstance(outcome, Exception):
+                    if len(batch) > self.min_batch_size:
+                        # whole batch refused: shrink and retry with no penalty for its items
+                        self.batch_size = max(self.min_batch_size, len(batch) // 2)
+                        log.debug("aggregate call of %u items failed (%r), batch size is now %u"
+                                  , len(batch), outcome, self.batch_size)
+                        queue.extend(batch)
+                        continue
+                    outcome = [None] * len(batch)
+                elif len(batch) >= self.batch_size:
+                    self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+                for (addr, attempts), reserves in zip(batch, outcome):
+                    if reserves is not None:
+                        yield (addr, *reserves)
+                    elif attempts + 1 < self.max_attempts:
+                        queue.append((addr, attempts + 1))
+                    else:
+                        yield addr, None, None, None
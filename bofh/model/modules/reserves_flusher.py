@@ -0,0 +1,85 @@
+from threading import Lock
+from time import monotonic
+
+from bofh.model.modules.loggers import Loggers
+
+log = Loggers.realtime_sync_events
+
+
+class ReservesWriteBehind:
+    """Write-behind buffer of the pool reserves updates, towards the status DB.
+
+       add() takes (reserve0, reserve1, block_number, tag) tuples, as returned by TheGraph.apply_sync_logs(),
+       and keeps only the latest reserves of each pool.
+       flush() is due once the buffer holds max_size pools, or its oldest update is max_age_secs old.
+       It swaps the buffer for an empty one before writing, so that add() never waits for the DB.
+       If the write fails, the rows are merged back into the buffer (the newer ones added meanwhile win),
+       so that they are retried by the next flush.
+
+       The DB connection is expected to be reserved to the flusher, as flush() runs on a thread of its own."""
+
+    def __init__(self, db, max_size=10000, max_age_secs=60):
+        self.db = db
+        self.max_size = max_size
+        self.max_age_secs = max_age_secs
+        self.block_number = 0
+        self.updates_ctr = 0
+        self.written_ctr = 0
+        self.flush_ctr = 0
+        self.flush_latency = 0.0
+        self._pending = dict()  # tag -> (reserve0, reserve1, block_number, tag)
+        self._pending_since = None
+        self._lock = Lock()
+        self._flush_lock = Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, rows):
+        with self._lock:
+            if self._pending_since is None and rows:
+                self._pending_since = monotonic()
+            for row in rows:
+                self._pending[row[3]] = row
+                if row[2] > self.block_number:
+                    self.block_number = row[2]
+            self.updates_ctr += len(rows)
+
+    def due(self):
+        if self._pending_since is None:
+            return False
+        return len(self._pending) >= self.max_size or monotonic() - self._pending_since >= self.max_age_secs
+
+    @property
+    def coalescing_ratio(self):
+        """Reserves updates received per row written to the DB"""
+        return self.written_ctr and self.updates_ctr / self.written_ctr or 1.0
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, dict()
+                self._pending_since = None
+                block_number = self.block_number
+            if not rows:
+                return 0
+            t0 = monotonic()
+            try:
+                with self.db as curs:
+                    curs.update_pool_reserves_batch(rows.values())
+                    curs.reserves_block_number = block_number
+            except:
+                self._requeue(rows)
+                raise
+            self.flush_latency = monotonic() - t0
+            self.flush_ctr += 1
+            self.written_ctr += len(rows)
+            log.debug("%u pool reserves updates synced to db in %.3f secs (block %u, coalescing ratio %.1f)"
+                      , len(rows), self.flush_latency, block_number, self.coalescing_ratio)
+            return len(rows)
+
+    def _requeue(self, rows):
+        with self._lock:
+            rows.update(self._pending)
+            self._pending = rows
+            self._pending_since = monotonic()
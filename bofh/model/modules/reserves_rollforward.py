@@ -0,0 +1,88 @@
+from asyncio import get_event_loop
+
+from bofh.model.modules.constants import PREDICTION_LOG_TOPIC0_SYNC
+from bofh.model.modules.loggers import Loggers
+from bofh.utils.web3 import JSONRPCConnector, parse_data_parameters
+
+
+def _int(v):
+    if isinstance(v, str):
+        return int(v, 16) if v.startswith("0x") else int(v)
+    return v
+
+
+def last_sync_per_pool(logs):
+    """Reduce a sequence of Sync logs (as returned by eth_getLogs) to the latest one per pool.
+
+       Returns a dict of {pool_address: (reserve0, reserve1, blockNumber)}, pool_address being lowercase."""
+    latest = {}
+    for entry in logs:
+        if entry.get("removed"):
+            continue
+        address = entry.get("address")
+        if not address:
+            continue
+        key = (_int(entry["blockNumber"]), _int(entry["logIndex"]))
+        address = address.lower()
+        prev = latest.get(address)
+        if prev is None or prev[0] < key:
+            latest[address] = (key, entry["data"])
+    res = {}
+    for address, ((blocknr, _), data) in latest.items():
+        reserve0, reserve1 = parse_data_parameters(data)
+        res[address] = (reserve0, reserve1, blocknr)
+    return res
+
+
+class SyncLogsRollForward:
+    """Roll forward pool reserves scanning Sync logs with eth_getLogs() over block ranges.
+
+       Ranges are sized adaptively: a range is split in half whenever the node refuses it
+       (too many results, range too wide, timeout...), and it's grown back after successful calls.
+
+       ranges() yields (from_block, to_block, updates) in block order, where updates
+       is the last Sync state of every pool touched in the range (see last_sync_per_pool())."""
+
+    INITIAL_RANGE = 500
+    MAX_RANGE = 5000
+
+    def __init__(self, start_block, end_block
+                 , connection=None
+                 , initial_range=INITIAL_RANGE
+                 , max_range=MAX_RANGE):
+        self.start_block = start_block
+        self.end_block = end_block
+        self.exe = connection or JSONRPCConnector.get_connection()
+        self.ioloop = get_event_loop()
+        self.max_range = max(1, max_range)
+        self.range = max(1, min(initial_range, self.max_range))
+        self.calls_ctr = 0
+        self.logs_ctr = 0
+
+    def get_logs(self, from_block, to_block):
+        self.calls_ctr += 1
+        fut = self.exe.eth_getLogs({"fromBlock": hex(from_block)
+                                    , "toBlock": hex(to_block)
+                                    , "topics": [PREDICTION_LOG_TOPIC0_SYNC]})
+        return self.ioloop.run_until_complete(fut)
+
+    def ranges(self):
+        log = Loggers.preloader
+        next_block = self.start_block
+        while next_block <= self.end_block:
+            to_block = min(next_block + self.range - 1, self.end_block)
+            try:
+                logs = self.get_logs(next_block, to_block)
+            except Exception as err:
+                if to_block == next_block:
+                    raise
+                # the node limit is deterministic enough: don't grow back towards the refused size
+                self.range = self.max_range = max(1, (to_block - next_block + 1) // 2)
+                log.debug("eth_getLogs refused range %u-%u (%r), range is now %u blocks"
+                          , next_block, to_block, err, self.range)
+                continue
+            if to_block - next_block + 1 >= self.range:
+                self.range = min(self.max_range, self.range * 2)
+            self.logs_ctr += len(logs)
+            yield next_block, to_block, last_sync_per_pool(logs)
+            next_block = to_block + 1
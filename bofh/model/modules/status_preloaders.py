@@ -1,15 +1,46 @@
-from asyncio import get_event_loop
-from concurrent.futures import ThreadPoolExecutor
+from asyncio import get_event_loop, new_event_loop, set_event_loop
+from contextlib import nullcontext
+from itertools import islice
+from os import replace
+from os.path import exists
+from threading import Event, Lock, Thread
 
-from bofh.model.modules.constants import PREDICTION_LOG_TOPIC0_SYNC
 from bofh.model.modules.loggers import Loggers
+from bofh.model.modules.reserves_download import ReservesSnapshotDownloader
+from bofh.model.modules.reserves_rollforward import SyncLogsRollForward
 from bofh.utils.misc import progress_printer, secs_to_human_repr
-from bofh.utils.web3 import bsc_block_age_secs, Web3PoolExecutor, JSONRPCConnector, method_id, parse_data_parameters
+from bofh.utils.web3 import bsc_block_age_secs, JSONRPCConnector, method_id, parse_data_parameters
+from bofh_model_ext import read_graph_snapshot_block_number
+from jsonrpc_websocket import Server
+
+
+def iter_columns(rows, chunk_size, addr_col=1):
+    """
+    Group DB rows in chunks, and transpose each chunk into columns suitable for
+    TheGraph.add_tokens_bulk() and TheGraph.add_lps_bulk().
+    The address column is packed into a single bytes blob (20 bytes per row).
+    Yields (chunk, columns) tuples.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        columns = list(zip(*chunk))
+        columns[addr_col] = b''.join(bytes.fromhex(a[2:]) for a in columns[addr_col])
+        yield chunk, columns
 
 
 class EntitiesPreloader:
+    BULK_LOAD_CHUNK_SIZE = 10000
+
     def __init__(self):
         self.pool_addresses = set()
+        self.reserves_ready = Event()
+        # {pool tag: block number} of the live Sync events seen while reserves are loaded in background
+        self.live_synced_pools = None
+        # the paths index is saved both by the warmup thread and at exit
+        self.paths_index_save_lock = Lock()
 
     def load(self, load_start_token=True
              , load_pools=True
@@ -19,29 +50,132 @@ class EntitiesPreloader:
              , include_disabled_tokens=False
              , ignore_bad_pools=False):
         log = Loggers.preloader
-        self.preload_exchanges()
-        self.preload_tokens(only_inspected_tokens=only_inspected_tokens
-                            , ignore_existing=ignore_existing_tokens
-                            , include_disabled=include_disabled_tokens)
-        if load_pools:
-            self.preload_pools(ignore_bad_pools=ignore_bad_pools)
-            if load_reserves:
-                self.preload_balances()
+        reserves_loaded = False
+        if load_pools and load_reserves and self.preload_from_graph_snapshot():
+            reserves_loaded = True
+        else:
+            self.preload_exchanges()
+            self.preload_tokens(only_inspected_tokens=only_inspected_tokens
+                                , ignore_existing=ignore_existing_tokens
+                                , include_disabled=include_disabled_tokens)
+            if load_pools:
+                self.preload_pools(ignore_bad_pools=ignore_bad_pools)
         if load_start_token:
-            start_token = self.graph.lookup_token(self.args.start_token_address)
-            if not start_token:
-                msg = "start_token not found: address %s is unknown or not of a token" % self.args.start_token_address
-                log.error(msg)
-                raise RuntimeError(msg)
-            else:
-                log.info("start_token is %s (%s)", start_token.symbol, start_token.address)
-                self.graph.set_start_token(start_token)
+            # token distances only depend on the graph topology: they are known before reserves are,
+            # which is what a progressive reserves download needs to rank pools
+            self.preload_start_token()
+            self.preload_paths_index()
+        if load_pools and load_reserves:
+            self.preload_balances(reserves_loaded=reserves_loaded)
+            if self.reserves_ready.is_set():
+                self.save_graph_snapshot()
         #if calculate_paths:
         #    self.graph.calculate_paths()
         log.info("  ********************************************")
         log.info("  ***  KNOWLEDGE GRAPH LOAD COMPLETED :-)  ***")
         log.info("  ********************************************")
 
+    @property
+    def graph_snapshot_file(self):
+        return getattr(self.args, "graph_snapshot_file", None)
+
+    @property
+    def paths_index_file(self):
+        return getattr(self.args, "paths_index_file", None)
+
+    @property
+    def progressive_startup(self):
+        return getattr(self.args, "progressive_startup", False)
+
+    def preload_start_token(self):
+        log = Loggers.preloader
+        start_token = self.graph.lookup_token(self.args.start_token_address)
+        if not start_token:
+            msg = "start_token not found: address %s is unknown or not of a token" % self.args.start_token_address
+            log.error(msg)
+            raise RuntimeError(msg)
+        log.info("start_token is %s (%s)", start_token.symbol, start_token.address)
+        self.graph.set_start_token(start_token)
+
+    def preload_from_graph_snapshot(self):
+        """Load exchanges, tokens, pools and reserves from the binary graph snapshot file,
+           if configured and not older than the status DB content.
+
+           Returns True if the graph has been loaded."""
+        log = Loggers.preloader
+        path = self.graph_snapshot_file
+        if not path:
+            return False
+        snapshot_blocknr = read_graph_snapshot_block_number(path)
+        if not snapshot_blocknr:
+            log.info("graph snapshot %s is missing or unusable. falling back to status DB", path)
+            return False
+        with self.db as curs:
+            db_blocknr = curs.reserves_block_number
+            if snapshot_blocknr < db_blocknr:
+                log.info("graph snapshot %s is for block %u, status DB is newer (block %u). "
+                         "falling back to status DB", path, snapshot_blocknr, db_blocknr)
+                return False
+            log.info("loading graph snapshot %s (block %u)", path, snapshot_blocknr)
+            try:
+                self.graph.load_snapshot(path)
+            except RuntimeError:
+                log.exception("unable to load graph snapshot %s. falling back to status DB", path)
+                return False
+            self.pool_addresses.update(address for _, address, *_ in curs.list_pools())
+        log.info("graph snapshot loaded: %r exchanges, %r tokens, %r pools"
+                 , self.graph.exchanges_count()
+                 , self.graph.tokens_count()
+                 , self.graph.pools_count())
+        return True
+
+    def preload_paths_index(self):
+        """Reload the paths discovered in previous sessions, instead of searching them again
+           as pools get touched"""
+        log = Loggers.preloader
+        path = self.paths_index_file
+        if not path or not exists(path):
+            return
+        try:
+            self.graph.load_paths_index(path)
+        except RuntimeError:
+            log.exception("unable to load paths index %s. paths are going to be searched again", path)
+
+    def save_paths_index(self):
+        log = Loggers.preloader
+        path = self.paths_index_file
+        if not path:
+            return
+        try:
+            with self.paths_index_save_lock:
+                self.graph.save_paths_index(path + ".tmp")
+                replace(path + ".tmp", path)
+        except (RuntimeError, OSError):
+            log.exception("unable to save paths index to %s", path)
+
+    def save_graph_snapshot(self):
+        log = Loggers.preloader
+        path = self.graph_snapshot_file
+        if not path:
+            return
+        try:
+            # write aside, then swap: a crash while saving never leaves a broken snapshot behind
+            self.graph.save_snapshot(path + ".tmp")
+            replace(path + ".tmp", path)
+        except (RuntimeError, OSError):
+            log.exception("unable to save graph snapshot to %s", path)
+
+    def refresh_graph_snapshot(self):
+        """Save the graph snapshot again, as of the reserves last flushed to the status DB.
+
+           A snapshot older than the status DB is discarded at startup: it has to keep up with the
+           reserves flushes, or it would be useless after a crash. Nothing is saved until all the
+           reserves are loaded."""
+        if not self.reserves_ready.is_set():
+            return
+        with self.status_lock:
+            self.save_graph_snapshot()
+
     def preload_exchanges(self):
         log = Loggers.preloader
         log.info("preloading exchanges...")
@@ -64,17 +198,16 @@ class EntitiesPreloader:
                                                    " eta={eta_hr} at {rate:.0f} items/s) ..."
                                               , on_same_line=True)
             with print_progress:
-                for id, addr, *args in curs.list_tokens(only_inspected_tokens=only_inspected_tokens
-                                                        , include_disabled=include_disabled):
-                    tok = self.graph.add_token(id, addr, *args)
-                    if tok is None:
-                        if ignore_existing:
-                            tok = self.graph.lookup_token(addr)
-                            assert tok is not None
-                            return tok
+                rows = curs.list_tokens(only_inspected_tokens=only_inspected_tokens
+                                        , include_disabled=include_disabled)
+                for chunk, columns in iter_columns(rows, self.BULK_LOAD_CHUNK_SIZE):
+                    rejected = self.graph.add_tokens_bulk(*columns)
+                    if rejected and not ignore_existing:
+                        id, addr, *args = chunk[rejected[0]]
                         raise RuntimeError(
                             "integrity error: token address is already not of a token: id=%r, %r" % (id, args))
-                    print_progress()
+                    for _ in range(len(chunk) - len(rejected)):
+                        print_progress()
             log.info("TOKENS set loaded, size is %r items", print_progress.ctr)
 
     def preload_pools(self, ignore_bad_pools=False):
@@ -86,15 +219,18 @@ class EntitiesPreloader:
                                               , on_same_line=True)
             with print_progress:
                 bad_pools = list()
-                for id, address, *args in curs.list_pools():
-                    print_progress()
-                    pool = self.graph.add_lp(id, address, *args)
-                    if pool is not None:
-                        self.pool_addresses.add(address)
-                        continue
-                    if not ignore_bad_pools:
-                        log.debug("integrity error: unable to load pool: id=%r, %r", id, address)
-                        bad_pools.append([id])
+                for chunk, columns in iter_columns(curs.list_pools(), self.BULK_LOAD_CHUNK_SIZE):
+                    rejected = set(self.graph.add_lps_bulk(*columns))
+                    for i, (id, address, *args) in enumerate(chunk):
+                        print_progress()
+                        # the bulk API does not use fetch callbacks, rejected rows
+                        # get a second chance through the regular per-row API
+                        if i not in rejected or self.graph.add_lp(id, address, *args) is not None:
+                            self.pool_addresses.add(address)
+                            continue
+                        if not ignore_bad_pools:
+                            log.debug("integrity error: unable to load pool: id=%r, %r", id, address)
+                            bad_pools.append([id])
                 if bad_pools:
                     curs.mark_pool_disabled_many(bad_pools)
 
@@ -104,34 +240,126 @@ class EntitiesPreloader:
                 log.info("  \\__ %r over pool the total %r were not loaded due to "
                               "failed graph connectivity or other problems", missing, print_progress.tot)
 
-    def preload_balances(self):
-        if not self.preload_balances_from_db():
+    def preload_balances(self, reserves_loaded=False):
+        start_block = None
+        if reserves_loaded and self.reserves_snapshot_is_usable(self.graph.reserves_block_number):
+            start_block = self.graph.reserves_block_number
+        elif not self.preload_balances_from_db():
+            if self.progressive_startup:
+                self.start_progressive_reserves_download()
+                return
             self.download_reserves_snapshot_from_web3()
+            reserves_loaded = False
+        else:
+            reserves_loaded = True
         if not self.args.do_not_update_reserves_from_chain:
-            self.update_balances_from_web3()
+            self.update_balances_from_web3(start_block=start_block)
+        if reserves_loaded:
+            if self.args.force_reuse_reserves_snapshot:
+                Loggers.preloader.warning("stale pool reserves are not re-fetched "
+                                          "(as per --force_reuse_reserves_snapshot)")
+            else:
+                self.refresh_stale_reserves()
+        self.reserves_ready.set()
+
+    def refresh_stale_reserves(self):
+        """Re-fetch the reserves of the pools last confirmed (by a download or a Sync log) more than
+           --max_reserves_snapshot_age_secs before the current reserves block.
+
+           Pools touched by Sync logs are already up to date after the roll forward, and an untouched
+           pool still holds the reserves it was last confirmed with: only the idle ones past the age
+           threshold need to be queried again."""
+        log = Loggers.preloader
+        block_number = self.graph.reserves_block_number
+        max_age = int(self.args.max_reserves_snapshot_age_secs / bsc_block_age_secs(1))
+        with self.db as curs:
+            stale = [address for _, address in curs.list_stale_pool_reserves(block_number - max_age)
+                     if address in self.pool_addresses]
+        log.info("%u pools over %u have reserves last confirmed more than %u blocks ago"
+                 , len(stale), len(self.pool_addresses), max_age)
+        if stale:
+            # pinned at the roll forward block, for the refreshed reserves to be consistent with the others
+            self.download_reserves_snapshot_from_web3(pool_addresses=stale, block_number=block_number)
+
+    def pools_ranked_by_distance(self):
+        """Known pool addresses, sorted by distance of their closest token from the start token.
+
+           Pools unreachable from the start token come last."""
+        def distance(addr):
+            pool = self.graph.lookup_lp(addr, False)
+            if not pool:
+                return float("inf")
+            return min(pool.token0.distance(), pool.token1.distance())
+        return sorted(self.pool_addresses, key=distance)
+
+    def start_progressive_reserves_download(self):
+        """Download reserves in background, pools closest to the start token first.
+
+           Meanwhile, path evaluation is restricted to paths whose pools all have their reserves loaded,
+           and live Sync events are tracked so that the download never overwrites newer values."""
+        log = Loggers.preloader
+        log.info("progressive startup: reserves are downloaded in background, "
+                 "only paths with all reserves known are evaluated meanwhile")
+        self.graph.only_ready_paths = True
+        self.live_synced_pools = dict()
+        self._progressive_reserves_thread = Thread(target=self._progressive_reserves_task, daemon=True)
+        self._progressive_reserves_thread.start()
+
+    def _progressive_reserves_task(self):
+        log = Loggers.preloader
+        # JSON-RPC calls are driven on a private event loop and connection, the main thread owns the default ones
+        ioloop = new_event_loop()
+        set_event_loop(ioloop)
+        try:
+            conn = Server(self.args.web3_rpc_url)
+            ioloop.run_until_complete(conn.ws_connect())
+            self.download_reserves_snapshot_from_web3(pool_addresses=self.pools_ranked_by_distance()
+                                                      , connection=conn
+                                                      , lock=self.status_lock)
+            if not self.args.do_not_update_reserves_from_chain:
+                self.update_balances_from_web3(start_block=self.graph.reserves_block_number
+                                               , connection=conn
+                                               , lock=self.status_lock)
+            with self.status_lock:
+                self.live_synced_pools = None
+                self.graph.only_ready_paths = False
+                self.reserves_ready.set()
+                self.save_graph_snapshot()
+            log.info("progressive startup: all pool reserves loaded")
+        except:
+            log.exception("progressive startup: background reserves download failed")
+        finally:
+            del self._progressive_reserves_thread
+
+    def is_live_synced(self, pool, blocknr):
+        """True if a live Sync event newer than blocknr has been applied to the pool meanwhile"""
+        live = self.live_synced_pools
+        return live is not None and live.get(pool.tag, -1) >= blocknr
+
+    def reserves_snapshot_is_usable(self, latest_blocknr):
+        log = Loggers.preloader
+        current_blocknr = self.w3.eth.block_number
+        age = current_blocknr-latest_blocknr
+        if not latest_blocknr or age < 0:
+            log.warning("unable to reuse reserves snapshot (latest block number not set, or invalid)")
+            return False
+        age_secs = bsc_block_age_secs(age)
+        log.info("reserves snapshot is for block %u (%d blocks old), which is %s old"
+                      , latest_blocknr
+                      , age
+                      , secs_to_human_repr(age_secs))
+        # the snapshot age is not a reason to discard it as a whole anymore: it's rolled forward
+        # with Sync logs, then only the pools not confirmed recently enough are re-fetched
+        # (see refresh_stale_reserves())
+        return True
 
     def preload_balances_from_db(self):
         log = Loggers.preloader
         with self.db as curs:
             latest_blocknr = curs.reserves_block_number
-            current_blocknr = self.w3.eth.block_number
-            age = current_blocknr-latest_blocknr
-            if not latest_blocknr or age < 0:
-                log.warning("unable to preload reserves from DB (latest block number not set in DB, or invalid)")
+            if not self.reserves_snapshot_is_usable(latest_blocknr):
                 return
-            age_secs = bsc_block_age_secs(age)
-            log.info("reserves DB snapshot is for block %u (%d blocks old), which is %s old"
-                          , latest_blocknr
-                          , age
-                          , secs_to_human_repr(age_secs))
-            if not self.args.force_reuse_reserves_snapshot:
-                if age_secs > self.args.max_reserves_snapshot_age_secs:
-                    log.warning("reserves DB snapshot is too old (older than --max_reserves_snapshot_age_secs=%r)"
-                                     , self.args.max_reserves_snapshot_age_secs)
-                    return
-            else:
-                log.warning(
-                    "forcing reuse of existing reserves DB snapshot (as per --force_reuse_reserves_snapshot)")
+            self.graph.reserves_block_number = latest_blocknr
 
             log.info("fetching LP reserves previously saved in db")
             nr = curs.execute("SELECT COUNT(1) FROM pool_reserves").get_int()
@@ -147,115 +375,99 @@ class EntitiesPreloader:
                     if not pool:
                         disc += 1
                         continue
-                    pool.setReserves(reserve0, reserve1)
+                    pool.setReservesRaw(reserve0, reserve1)
                     ok += 1
                 log.info("%r records read, reserves loaded for %r pools, %r discarded"
                               , print_progress.ctr, ok, disc)
             return True
 
-    def download_reserves_snapshot_from_web3(self):
+    def download_reserves_snapshot_from_web3(self, pool_addresses=None, block_number=None
+                                             , connection=None, lock=None):
         log = Loggers.preloader
         log.info("downloading a new reserves snapshot from Web3")
-        print_progress = progress_printer(self.graph.pools_count()
+        if pool_addresses is None:
+            pool_addresses = self.pool_addresses
+        lock = lock or nullcontext()
+        print_progress = progress_printer(len(pool_addresses)
                                           , "fetching pool reserves {percent}% ({count} of {tot}"
                                             " eta={eta_hr} at {rate:.0f} items/s) ..."
                                           , on_same_line=True)
-        with Web3PoolExecutor(connection_uri=self.args.web3_rpc_url, max_workers=self.args.max_workers) as executor:
-            log.info("concurrent reserves download via Web3:"
-                     "\n\t- %r pool getReserve requests"
-                     "\n\t- on Web3 servant at %s"
-                     "\n\t- using %d workers"
-                     "\n\t- each with a %d preload queue"
-                      , self.graph.pools_count()
-                      , self.args.web3_rpc_url
-                      , self.args.max_workers
-                      , self.args.chunk_size
-                      )
-            with self.db as curs:
-                try:
-                    currentBlockNr = self.w3.eth.block_number
-                    def pool_addresses_iter():
-                        for addr in self.pool_addresses:
-                            yield addr
-                    for pool_addr, reserve0, reserve1, blockTimestampLast in executor.map(getReserves, pool_addresses_iter(), chunksize=self.args.chunk_size):
-                        try:
-                            if reserve0 is None or reserve1 is None:
+        currentBlockNr = block_number or self.w3.eth.block_number
+        downloader = ReservesSnapshotDownloader(currentBlockNr
+                                                , connection=connection or self.jsonrpc_conn
+                                                , multicall_address=self.args.multicall_address
+                                                , batch_size=self.args.chunk_size
+                                                , max_pending=self.args.max_workers)
+        log.info("batched reserves download via Web3:"
+                 "\n\t- %r pool getReserve requests"
+                 "\n\t- on Web3 servant at %s"
+                 "\n\t- pinned at block %u"
+                 "\n\t- packed in aggregate calls to %s"
+                 "\n\t- initial batch size of %d, with up to %d batches in flight"
+                  , len(pool_addresses)
+                  , self.args.web3_rpc_url
+                  , currentBlockNr
+                  , downloader.multicall_address
+                  , downloader.batch_size
+                  , downloader.max_pending
+                  )
+        with self.db as curs, curs.reserves_snapshot_writer(currentBlockNr) as writer:
+            try:
+                for pool_addr, reserve0, reserve1, blockTimestampLast in downloader.download(pool_addresses):
+                    try:
+                        if reserve0 is None or reserve1 is None:
+                            continue
+                        pair = self.graph.lookup_lp(pool_addr)
+                        if not pair:
+                            raise IndexError("unknown pool: %s" % pool_addr)
+                        with lock:
+                            if self.is_live_synced(pair, currentBlockNr):
                                 continue
-                            pair = self.graph.lookup_lp(pool_addr)
-                            if not pair:
-                                raise IndexError("unknown pool: %s" % pool_addr)
                             # reset pool reserves
                             pair.setReserves(reserve0, reserve1)
-                            pool = self.graph.lookup_lp(pool_addr)
-                            assert pool
-                            curs.add_pool_reserve(pool.tag, reserve0, reserve1)
-                            print_progress()
-                        except:
-                            log.exception("unable to query pool %s", pool_addr)
-                        curs.reserves_block_number = currentBlockNr
-                finally:
-                    curs.reserves_block_number = currentBlockNr
-            executor.shutdown(wait=True)
-
-    def update_balances_from_web3(self, start_block=None):
+                            writer.add(pair.tag, reserve0, reserve1)
+                        print_progress()
+                    except:
+                        log.exception("unable to query pool %s", pool_addr)
+                with lock:
+                    writer.flush()
+            finally:
+                self.graph.reserves_block_number = currentBlockNr
+        log.info("reserves snapshot downloaded in %u aggregate calls, %u rows saved in %u transactions"
+                 , downloader.calls_ctr, writer.written, writer.flushes)
+
+    def update_balances_from_web3(self, start_block=None, connection=None, lock=None):
         log = Loggers.preloader
-        per_thread_queue_size = self.args.max_workers * 10
         current_block = self.w3.eth.block_number
-        with self.db as curs:
-            if start_block is None:
+        if start_block is None:
+            with self.db as curs:
                 start_block = curs.reserves_block_number
-            latest_read = max(0, start_block-1)
-            nr = current_block - latest_read
-            if nr <= 0:
-                return
-            with progress_printer(nr, "rolling forward pool reserves {percent}% ({count} of {tot}"
-                                      " eta={eta_hr} at {rate:.0f} items/s) ..."
-                                      , on_same_line=True) as print_progress:
-                while True:
-                    nr = current_block - latest_read
-                    print_progress.tot = nr
-                    if nr <= 0:
-                        log.info("LP balances updated to current block (%u)", current_block)
-                        break
-                    target = min(latest_read+per_thread_queue_size, current_block+1)
-                    with ThreadPoolExecutor(max_workers=self.args.max_workers) as executor:
-                        for next_block in range(latest_read, target):
-                            log.debug("loading reserves from block %r ... ", next_block)
-                            if print_progress():
-                                self.db.commit()
-                            executor.submit(self.reserves_parse_blocknr, next_block)
-                            latest_read = next_block
-                        executor.shutdown()
-                curs.reserves_block_number = latest_read
-
-    def reserves_parse_blocknr(self, blocknr):
-        block = self.w3.eth.get_block(blocknr)
-        if not block:
+        # Sync logs carry absolute reserves, re-reading start_block is harmless
+        nr = current_block - start_block + 1
+        if nr <= 0:
             return
-        txs = block.get("transactions")
-        if not txs:
-            return
-
-        with self.db as curs:
-            try:
-                for txh in txs:
-                    txr = self.w3.eth.get_transaction_receipt(txh)
-                    if not txr:
-                        continue
-                    logs = txr.get("logs")
-                    if not logs:
-                        continue
-                    for log in logs:
-                        topics = log.get("topics")
-                        address = log.get("address")
-                        if address and topics and topics[0] == PREDICTION_LOG_TOPIC0_SYNC:
-                            pool = self.graph.lookup_lp(address)
-                            if not pool:
-                                continue
-                            self.update_pool_reserves_by_tx_sync_log(pool, log["data"], curs)
-            except:
-                self.db.rollback()
-                raise
+        roll = SyncLogsRollForward(start_block, current_block, connection=connection or self.jsonrpc_conn)
+        lock = lock or nullcontext()
+        with progress_printer(nr, "rolling forward pool reserves {percent}% ({count} of {tot}"
+                                  " eta={eta_hr} at {rate:.0f} items/s) ..."
+                                  , on_same_line=True) as print_progress:
+            for from_block, to_block, updates in roll.ranges():
+                # ranges come in block order: each one is committed before moving on to the next
+                with lock, self.db as curs:
+                    batch = []
+                    for address, (reserve0, reserve1, blocknr) in updates.items():
+                        pool = self.graph.lookup_lp(address, False)
+                        if not pool or self.is_live_synced(pool, blocknr):
+                            continue
+                        pool.setReserves(reserve0, reserve1)
+                        batch.append((reserve0, reserve1, blocknr, pool.tag))
+                    curs.update_pool_reserves_batch(batch)
+                    curs.reserves_block_number = to_block
+                    self.graph.reserves_block_number = to_block
+                for _ in range(to_block - from_block + 1):
+                    print_progress()
+        log.info("LP balances updated to current block (%u): %u blocks, %u Sync logs, in %u eth_getLogs calls"
+                 , current_block, nr, roll.logs_ctr, roll.calls_ctr)
 
 
 
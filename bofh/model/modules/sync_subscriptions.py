@@ -0,0 +1,90 @@
+from jsonrpc_base import TransportError
+
+from bofh.model.modules.loggers import Loggers
+
+log = Loggers.realtime_sync_events
+
+
+class SyncLogsSubscriptions:
+    """Sync logs subscriptions filtered on the addresses of the watched pools, over one websocket connection.
+
+       Addresses are split into shards of at most shard_size items, one `logs` subscription each.
+       The shard size is halved whenever the node refuses a filter (ie: too many addresses).
+
+       update() resubscribes incrementally: only the shards holding dropped addresses are replaced,
+       added addresses get new shards of their own.
+
+       The optional catch-all subscription receives the Sync logs of every pool of the chain,
+       for the discovery of new pools. Its notifications of watched pools are redundant, see is_redundant()."""
+
+    def __init__(self, server, topic, shard_size=1000, catch_all=False):
+        self.server = server
+        self.topic = topic
+        self.shard_size = max(1, shard_size)
+        self.catch_all = catch_all
+        self.catch_all_subscription = None
+        self.shards = {}  # subscription id -> set of addresses
+        self.watched = {}  # address -> subscription id
+
+    def __len__(self):
+        return len(self.shards)
+
+    async def subscribe(self, addresses):
+        queue = sorted(set(a.lower() for a in addresses) - self.watched.keys())
+        while queue:
+            shard = queue[:self.shard_size]
+            try:
+                subscription = await self.server.eth_subscribe("logs", {"address": shard, "topics": [self.topic]})
+            except TransportError:
+                raise
+            except Exception as err:
+                if len(shard) > 1:
+                    self.shard_size = max(1, len(shard) // 2)
+                    log.debug("node refused a Sync logs subscription of %u addresses (%r), shard size is now %u"
+                              , len(shard), err, self.shard_size)
+                    continue
+                log.warning("node refused the Sync logs subscription of pool %s (%r)", shard[0], err)
+            else:
+                self.shards[subscription] = set(shard)
+                for address in shard:
+                    self.watched[address] = subscription
+            del queue[:len(shard)]
+        if self.catch_all and self.catch_all_subscription is None:
+            self.catch_all_subscription = await self.server.eth_subscribe("logs", {"topics": [self.topic]})
+
+    async def unsubscribe(self, subscription):
+        try:
+            await self.server.eth_unsubscribe(subscription)
+        except TransportError:
+            raise
+        except Exception as err:
+            log.warning("unable to drop Sync logs subscription %s (%r)", subscription, err)
+
+    async def update(self, addresses):
+        """Follow the changes of the set of the watched pool addresses.
+
+           Returns True if any subscription has been replaced or added"""
+        wanted = set(a.lower() for a in addresses)
+        dropped = self.watched.keys() - wanted
+        added = wanted - self.watched.keys()
+        if not dropped and not added:
+            return False
+        replaced = set(self.watched[a] for a in dropped)
+        for subscription in replaced:
+            for address in self.shards[subscription]:
+                del self.watched[address]
+                if address not in dropped:
+                    added.add(address)
+        # the new shards are in place before the old ones are dropped: no Sync log gets lost meanwhile
+        await self.subscribe(added)
+        for subscription in replaced:
+            del self.shards[subscription]
+            await self.unsubscribe(subscription)
+        log.info("Sync logs subscriptions updated: %u pools dropped, %u subscriptions replaced, "
+                 "%u pools watched over %u subscriptions"
+                 , len(dropped), len(replaced), len(self.watched), len(self.shards))
+        return True
+
+    def is_redundant(self, subscription, address):
+        """Tell if a notification of the catch-all subscription is about a pool watched by another one"""
+        return subscription == self.catch_all_subscription and address.lower() in self.watched
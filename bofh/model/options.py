@@ -2,7 +2,7 @@ from dataclasses import dataclass
 
 from docopt import docopt
 
-from bofh.model.modules.constants import START_TOKEN, ENV_SWAP_CONTRACT_ADDRESS, ENV_BOFH_WALLET_ADDRESS, \
+from bofh.model.modules.constants import MULTICALL_ADDRESS, START_TOKEN, ENV_SWAP_CONTRACT_ADDRESS, ENV_BOFH_WALLET_ADDRESS, \
     ENV_BOFH_WALLET_PASSWD
 from bofh.utils.config_data import AttrDict, DynaConfig
 from bofh.utils.misc import optimal_cpu_threads
@@ -18,14 +18,41 @@ STATEFUL_KEYS = AttrDict.deepcopy(
             web3_rpc_url=(JSONRPCConnector.connection_uri(), "Web3 RPC connection URL"),
             max_workers=(optimal_cpu_threads(), "number of RPC data ingest workers, default one per hardware thread"),
             chunk_size=(100, "preloaded work chunk size per each worker"),
+            multicall_address=(MULTICALL_ADDRESS, "aggregate-call contract used for batched reserves download"),
             runner=dict(
                 pred_polling_interval=(1000, "Web3 prediction polling internal in millisecs"),
-                max_reserves_snapshot_age_secs=(7200, "max age of usable LP reserves DB snapshot "
-                                                      "(refuses to preload from DB if older)"),
-                force_reuse_reserves_snapshot=(False, "disregard --max_reserves_snapshot_age_secs "
+                pred_polling=(False, "poll predictions every --pred_polling_interval, instead of fetching "
+                                     "them on each newHeads notification"),
+                max_reserves_snapshot_age_secs=(7200, "max age of LP reserves in the DB snapshot: pools not "
+                                                      "confirmed by a download or a Sync log since are re-fetched"),
+                force_reuse_reserves_snapshot=(False, "do not re-fetch the pool reserves older than "
+                                                      "--max_reserves_snapshot_age_secs "
                                                       "(use for debug purposes, avoids download of reserves)"),
                 do_not_update_reserves_from_chain=(False, "do not attempt to forward an existing reserves "
                                                           "DB snapshot to the latest known block"),
+                graph_snapshot_file=(None, "binary graph snapshot file. It's preferred to the status DB "
+                                           "at startup if not older than it"),
+                paths_index_file=(None, "binary file of the known swap paths. It's reloaded at startup "
+                                        "and rewritten on exit"),
+                paths_warmup_max_paths=(2000000, "size budget of the background paths index warmup "
+                                                 "(0 disables it)"),
+                paths_warmup_round_secs=(2.0, "time budget of each background paths index warmup round"),
+                reserves_flush_max_size=(10000, "pool reserves updates are written behind to the status DB, "
+                                                "once this many pools have changed"),
+                reserves_flush_max_age_secs=(60, "... or once the oldest pending change is this old"),
+                sync_subscription_shard_size=(1000, "max number of pool addresses filtered by each "
+                                                    "Sync logs subscription"),
+                sync_subscription_catch_all=(False, "keep also a subscription to the Sync logs of all pools, "
+                                                    "for the discovery of new pools"),
+                sync_ws_urls=(None, "comma separated websocket endpoints to take Sync events from, all at once: "
+                                    "each event is applied as it first arrives"),
+                record_feeds=(None, "append the Sync logs notifications and the prediction payloads "
+                                    "to a feeds file (gzip compressed if its name ends with .gz)"),
+                replay_feeds=(None, "replay a feeds file in place of the live services, "
+                                    "and report the throughput"),
+                replay_speed=(0, "time scale of replay_feeds: 1 is original speed, 0 is as fast as possible"),
+                progressive_startup=(False, "when no usable reserves snapshot is available, download reserves "
+                                            "in background and evaluate only the paths already loaded"),
                 initial_amount_min=(0, "min initial amount of start_token considered for swap operation"),
                 initial_amount_max=(10 ** 16, "max initial amount of start_token considered for swap operation"),
                 path_estimation_amount=(10 ** 16, "amount used for initial exploratory search of profitable paths"),
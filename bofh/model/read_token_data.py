@@ -70,8 +70,8 @@ Options:
   -v, --verbose                             debug output
   --chunk_size=<n>                          preloaded work chunk size per each worker Default is {Args.chunk_size}
   --start_token_address=<address>           on-chain address of start token. Default is {Args.start_token_address}
-  --max_reserves_snapshot_age_secs=<s>      max age of usable LP reserves DB snapshot (refuses to preload from DB if older). Default is {Args.max_reserves_snapshot_age_secs}
-  --force_reuse_reserves_snapshot           disregard --max_reserves_snapshot_age_secs (use for debug purposes, avoids download of reserves)       
+  --max_reserves_snapshot_age_secs=<s>      max age of LP reserves in the DB snapshot: pools not confirmed by a download or a Sync log since are re-fetched. Default is {Args.max_reserves_snapshot_age_secs}
+  --force_reuse_reserves_snapshot           do not re-fetch the pool reserves older than --max_reserves_snapshot_age_secs (use for debug purposes, avoids download of reserves)       
   --do_not_update_reserves_from_chain       do not attempt to forward an existing reserves DB snapshot to the latest known block
   --contract_address=<address>              set contract counterpart address. Default is {Args.contract_address}
   --wallet_address=<address>                funding wallet address. Default is {Args.wallet_address}
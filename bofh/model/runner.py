@@ -1,5 +1,7 @@
-from asyncio import get_event_loop
+from asyncio import get_event_loop, gather
+from concurrent.futures import ThreadPoolExecutor
 from os.path import dirname, realpath, join
+from signal import SIGINT, SIGTERM
 from threading import Lock
 from time import time
 
@@ -7,10 +9,15 @@ from coloredlogs import ColoredFormatter
 from eth_utils import to_checksum_address
 from web3.exceptions import ContractLogicError
 
+from bofh.model.modules.constants import MULTICALL_ADDRESS
 from bofh.model.modules.graph import TheGraph
 from bofh.model.modules.constant_prediction import ConstantPrediction
 from bofh.model.modules.delayed_execution import DelayedExecutor
 from bofh.model.modules.event_listener import SyncEventRealtimeTracker
+from bofh.model.modules.feeds_recording import FeedRecorder, FeedsReplay
+from bofh.model.modules.paths_warmup import PathsIndexWarmup
+from bofh.model.modules.reserves_flusher import ReservesWriteBehind
+from bofh.model.modules.attacks_writer import AttacksWriteBehind
 from bofh.model.modules.loggers import Loggers
 from bofh.model.modules.status_preloaders import EntitiesPreloader
 from bofh.model.modules.contract_calls import ContractCalling
@@ -41,11 +48,26 @@ class Args:
     web3_rpc_url: str = BOFH_WEB3_RPC_URL
     max_workers: int = BOFH_MAX_WORKERS
     chunk_size: int = 100
+    multicall_address: str = MULTICALL_ADDRESS
     pred_polling_interval: int = 1000
+    pred_polling: bool = False
     start_token_address: str = BOFH_START_TOKEN_ADDRESS
     max_reserves_snapshot_age_secs: int = 7200
     force_reuse_reserves_snapshot: bool = False
     do_not_update_reserves_from_chain: bool = False
+    graph_snapshot_file: str = None
+    progressive_startup: bool = False
+    paths_index_file: str = None
+    paths_warmup_max_paths: int = 2000000
+    paths_warmup_round_secs: float = 2.0
+    reserves_flush_max_size: int = 10000
+    reserves_flush_max_age_secs: int = 60
+    sync_subscription_shard_size: int = 1000
+    sync_subscription_catch_all: bool = False
+    sync_ws_urls: str = None
+    record_feeds: str = None
+    replay_feeds: str = None
+    replay_speed: float = 0
     contract_address: str = BOFH_CONTRACT_ADDRESS
     wallet_address: str = BOFH_WALLET_ADDRESS
     wallet_password: str = BOFH_WALLET_PASSWD
@@ -108,11 +130,36 @@ Options:
   -j, --max_workers=<n>                     number of RPC data ingest workers, default one per hardware thread. Default is {Args.max_workers}
   -v, --verbose                             debug output
   --chunk_size=<n>                          preloaded work chunk size per each worker Default is {Args.chunk_size}
+  --multicall_address=<address>             aggregate-call contract used for batched reserves download. Default is {Args.multicall_address}
   --pred_polling_interval=<n>               Web3 prediction polling internal in millisecs. Default is {Args.pred_polling_interval}
+  --pred_polling                            poll predictions every --pred_polling_interval, instead of fetching them on each
+                                            newHeads notification (the interval is then only a safety net)
   --start_token_address=<address>           on-chain address of start token. Default is {Args.start_token_address}
-  --max_reserves_snapshot_age_secs=<s>      max age of usable LP reserves DB snapshot (refuses to preload from DB if older). Default is {Args.max_reserves_snapshot_age_secs}
-  --force_reuse_reserves_snapshot           disregard --max_reserves_snapshot_age_secs (use for debug purposes, avoids download of reserves)       
+  --max_reserves_snapshot_age_secs=<s>      max age of LP reserves in the DB snapshot: pools not confirmed by a download or a Sync log since are re-fetched. Default is {Args.max_reserves_snapshot_age_secs}
+  --force_reuse_reserves_snapshot           do not re-fetch the pool reserves older than --max_reserves_snapshot_age_secs (use for debug purposes, avoids download of reserves)       
   --do_not_update_reserves_from_chain       do not attempt to forward an existing reserves DB snapshot to the latest known block
+  --graph_snapshot_file=<file>              binary graph snapshot file. It's preferred to the status DB at startup
+                                            if not older than it. It's rewritten after each successful load, after each
+                                            reserves flush to the status DB, and on exit
+  --paths_index_file=<file>                 binary file of the known swap paths. It's reloaded at startup, and rewritten by warmup and on exit
+  --paths_warmup_max_paths=<n>             size budget of the background paths index warmup, which precomputes paths crossing the
+                                            pools with the most frequent Sync events (0 disables it). Default is {Args.paths_warmup_max_paths}
+  --paths_warmup_round_secs=<s>             time budget of each background paths index warmup round. Default is {Args.paths_warmup_round_secs}
+  --reserves_flush_max_size=<n>             pool reserves updates are written behind to the status DB, once this many
+                                            pools have changed... Default is {Args.reserves_flush_max_size}
+  --reserves_flush_max_age_secs=<s>         ... or once the oldest pending change is this old. Default is {Args.reserves_flush_max_age_secs}
+  --sync_subscription_shard_size=<n>        max number of pool addresses filtered by each Sync logs subscription. It's halved
+                                            whenever the node refuses a filter. Default is {Args.sync_subscription_shard_size}
+  --sync_subscription_catch_all             keep also a subscription to the Sync logs of all pools, for the discovery of new pools
+  --sync_ws_urls=<url,...>                  comma separated websocket endpoints to take Sync events from, all at once:
+                                            each event is applied as it first arrives. Default is --web3_rpc_url only
+  --record_feeds=<file>                     append the Sync logs notifications and the prediction payloads to a feeds file
+                                            (gzip compressed if its name ends with .gz)
+  --replay_feeds=<file>                     replay a feeds file in place of the live services, and report the throughput
+                                            (no attack is executed, nor reserves are saved)
+  --replay_speed=<x>                        time scale of --replay_feeds: 1 is original speed, 0 is as fast as possible. Default is {Args.replay_speed}
+  --progressive_startup                     when no usable reserves snapshot is available, download reserves in background
+                                            (pools closest to start_token first) and evaluate only the paths already loaded
   --contract_address=<address>              set contract counterpart address. Default is {Args.contract_address}
   --wallet_address=<address>                funding wallet address. Default is {Args.wallet_address}
   --wallet_password=<pass>                  funding wallet address. Default is  {Args.wallet_password}
@@ -147,6 +194,8 @@ class Runner(TheGraph
              , EntitiesPreloader
              , ConstantPrediction
              , SyncEventRealtimeTracker
+             , PathsIndexWarmup
+             , FeedsReplay
              , ContractCalling
              ):
 
@@ -164,12 +213,26 @@ class Runner(TheGraph
         self.ioloop = get_event_loop()
         self.consistency_checks()
         self.status_lock = Lock()
-        self.reserves_update_batch = list()  # reserve0, reserve1, tag
-        self.reserves_update_blocknr = 0
+        # all the live services are tasks of self.ioloop. Their model updates and path evaluations
+        # are serialized on this single worker thread, off the event loop
+        self.graph_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bofh-graph")
+        self.runtime_tasks = list()
+        # the flusher writes from a thread of its own, through a connection of its own
+        reserves_db = ModelDB(schema_name="status", cursor_factory=StatusScopedCursor, db_dsn=self.args.status_db_dsn)
+        reserves_db.open_and_priming()
+        self.reserves_flusher = ReservesWriteBehind(reserves_db
+                                                    , max_size=self.args.reserves_flush_max_size
+                                                    , max_age_secs=self.args.reserves_flush_max_age_secs)
+        # same for the attacks writer
+        attacks_writer_db = ModelDB(schema_name="attacks", cursor_factory=StatusScopedCursor, db_dsn=self.args.attacks_db_dsn)
+        attacks_writer_db.open_and_priming()
+        self.attacks_writer = AttacksWriteBehind(attacks_writer_db)
         self.delayed_executor = DelayedExecutor(self)
         self.attack_ctr = 0
         self.attack_last_ts = 0
         self.attack_attempts = set()
+        self.feeds_recorder = self.args.record_feeds and FeedRecorder(self.args.record_feeds) or None
+        self.stopped = False
         # self.polling_started = Event()
 
     def consistency_checks(self):
@@ -324,17 +387,69 @@ class Runner(TheGraph
         except:
             log.exception("unable to execute dry-run contract estimation")
 
+    def to_graph_worker(self, fn, *args):
+        """Queue fn(*args) to the graph worker. Returns an asyncio future of its outcome"""
+        fut = self.ioloop.run_in_executor(self.graph_executor, fn, *args)
+        fut.add_done_callback(self._log_graph_worker_failure)
+        return fut
+
+    async def in_graph_worker(self, fn, *args):
+        """Run fn(*args) on the graph worker, and wait for its outcome"""
+        return await self.to_graph_worker(fn, *args)
+
+    @staticmethod
+    def _log_graph_worker_failure(fut):
+        if not fut.cancelled() and fut.exception() is not None:
+            log.error("Error in graph worker job", exc_info=fut.exception())
+
+    @property
+    def replay_mode(self):
+        return bool(getattr(self.args, "replay_feeds", None))
+
     def start(self):
-        SyncEventRealtimeTracker.start(self)
-        ConstantPrediction.start(self)
+        PathsIndexWarmup.start(self)
+        SyncEventRealtimeTracker.start(self, live=not self.replay_mode)
+        ConstantPrediction.start(self, live=not self.replay_mode)
+        if self.replay_mode:
+            self.start_replay(self.args.replay_feeds, speed=self.args.replay_speed)
 
     def stop(self):
-        SyncEventRealtimeTracker.stop(self)
-        ConstantPrediction.stop(self)
+        if self.stopped:
+            return
+        self.stopped = True
+        for task in self.runtime_tasks:
+            self.ioloop.call_soon_threadsafe(task.cancel)
+        PathsIndexWarmup.stop(self)
+        if self.replay_mode:
+            return
+        with self.status_lock:
+            if self.reserves_ready.is_set():
+                self.save_graph_snapshot()
+            self.save_paths_index()
 
     def join(self):
-        SyncEventRealtimeTracker.join(self)
-        ConstantPrediction.stop(self)
+        """Run the runtime tasks on the event loop, until they are all terminated.
+
+           SIGINT and SIGTERM call stop(), which cancels them. Whatever the way out,
+           the write-behind buffers are flushed, and the feeds file is closed"""
+        for sig in (SIGINT, SIGTERM):
+            self.ioloop.add_signal_handler(sig, self.stop)
+        try:
+            self.ioloop.run_until_complete(gather(*self.runtime_tasks, return_exceptions=True))
+        finally:
+            for sig in (SIGINT, SIGTERM):
+                self.ioloop.remove_signal_handler(sig)
+            self.graph_executor.shutdown()
+            if not self.replay_mode:
+                for writer, what in ((self.reserves_flusher, "pool reserves updates")
+                                     , (self.attacks_writer, "attacks")):
+                    try:
+                        writer.flush()
+                    except:
+                        log.exception("unable to write the pending %s to db", what)
+            if self.feeds_recorder:
+                self.feeds_recorder.close()
+            PathsIndexWarmup.join(self)
 
 
 
@@ -369,8 +484,12 @@ def main():
         from IPython import embed
         while True:
             embed()
-    bofh.start()
-    bofh.join()
+    try:
+        bofh.start()
+        bofh.join()
+    finally:
+        # saves the graph snapshot and the paths index
+        bofh.stop()
 
 
 if __name__ == '__main__':
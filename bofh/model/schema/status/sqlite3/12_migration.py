@@ -0,0 +1,15 @@
+"""Convert the decimal TEXT reserves left in pool_reserves_old by 12_migration.sql into big endian BLOBs.
+
+All rows are tagged with the reserves_block_number of the snapshot they belong to."""
+
+from bofh.model.database import reserve_to_blob
+
+
+def migrate(conn):
+    blocknr = conn.execute("SELECT value FROM status_meta WHERE key = 'reserves_block_number'").fetchone()
+    blocknr = int(blocknr[0]) if blocknr else 0
+    rows = conn.execute("SELECT id, reserve0, reserve1 FROM pool_reserves_old")
+    conn.executemany("INSERT INTO pool_reserves (id, reserve0, reserve1, block_number) VALUES (?, ?, ?, ?)"
+                     , ((id, reserve_to_blob(reserve0), reserve_to_blob(reserve1), blocknr)
+                        for id, reserve0, reserve1 in rows))
+    conn.execute("DROP TABLE pool_reserves_old")
@@ -0,0 +1,9 @@
+-- pool_reserves.reserve0, reserve1 are stored as big endian BLOBs, together with their block_number.
+-- Decimal TEXT values can't be translated by SQL alone: rows are converted by 12_migration.py
+ALTER TABLE pool_reserves RENAME TO pool_reserves_old;
+CREATE TABLE pool_reserves (
+    id INTEGER PRIMARY KEY,  -- also FK toward pools.id
+    reserve0 BLOB NOT NULL,
+    reserve1 BLOB NOT NULL,
+    block_number INTEGER NOT NULL DEFAULT 0
+);
@@ -1,3 +1,4 @@
+from bofh.model.modules.constants import MULTICALL_ADDRESS
 from bofh.utils.misc import optimal_cpu_threads
 from bofh.utils.web3 import Web3Connector
 
@@ -10,9 +11,10 @@ options:
   -d, --dsn=<connection_str>            DB dsn connection string [default: sqlite3://status.db]
   -c, --connection_url=<url>            Web3 RPC connection URL [default: %s]
   -j <n>                                number of RPC data ingest workers, default one per hardware thread [default: %u]
-  --chunk_size=<n>                      preloaded work chunk size per each worker [default: 100]
+  --chunk_size=<n>                      initial number of getReserves() calls per aggregate call [default: 100]
+  --multicall_address=<address>         aggregate-call contract used for batched reserves download [default: %s]
   -v, --verbose                         debug output
-""" % (Web3Connector.DEFAULT_URI_WSRPC, optimal_cpu_threads())
+""" % (Web3Connector.DEFAULT_URI_WSRPC, optimal_cpu_threads(), MULTICALL_ADDRESS)
 
 from dataclasses import dataclass
 from logging import getLogger, basicConfig
@@ -30,6 +32,7 @@ class Args:
     web3_rpc_url: str = None
     max_workers: int = 0
     chunk_size: int = 0
+    multicall_address: str = None
 
     @staticmethod
     def default(arg, d, suppress_list=None):
@@ -48,6 +51,7 @@ class Args:
             , web3_rpc_url=cls.default(args["--connection_url"], 0)
             , max_workers=int(cls.default(args["-j"], 0))
             , chunk_size=int(cls.default(args["--chunk_size"], 100))
+            , multicall_address=cls.default(args["--multicall_address"], MULTICALL_ADDRESS)
         )
 
 
@@ -51,9 +51,14 @@ void log_emit_ll(log_level lvl, const std::string &msg)
 {
     if (!log_trigger(lvl)) return;
     if (m_status == nullptr) return;
+    // log events may come from C++ code running without the GIL
+    // (ie: the bindings which release it around long jobs)
+    PyGILState_STATE gil = PyGILState_Ensure();
     try {
         m_status->functor(lvl, msg.c_str());
     } catch (...) {
         // silence anything boost::python may rise during dispatch attempts
+        PyErr_Clear();
     }
+    PyGILState_Release(gil);
 }
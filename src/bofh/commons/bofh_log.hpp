@@ -13,6 +13,7 @@
  * - remove (not minimize) runtime impact of log statement parameter
  *   evaluation when log is not triggered
  * - uses boost::format in a more log-context friendly fashion
+ * - the Python sink is always called holding the GIL, whatever the emitting thread
  *
  * @see bofh.model.misc.LogAdapter
  * @note The bofh.model.misc.LogAdapter class is designed to be injected
@@ -66,23 +66,23 @@ static balance_t getAmountIn(const balance_t &amountOut
 }
 
 
-balance_t IdealEstimator::SwapTokensForExactTokens(const LiquidityPool *pool, const Token *boughtToken, const balance_t &boughtAmount) const
+balance_t IdealEstimator::SwapTokensForExactTokens(const LiquidityPool *pool, const Token *boughtToken, const balance_t &boughtAmount, unsigned prediction_snapshot_key) const
 {
     return getAmountIn(boughtAmount
-                       , pool->getReserve(boughtToken == pool->token0 ? pool->token1 : pool->token0)
-                       , pool->getReserve(boughtToken));
+                       , pool->getReserve(boughtToken == pool->token0 ? pool->token1 : pool->token0, prediction_snapshot_key)
+                       , pool->getReserve(boughtToken, prediction_snapshot_key));
 }
 
-balance_t IdealEstimator::SwapExactTokensForTokens(const LiquidityPool *pool, const Token *soldToken, const balance_t &soldAmount) const
+balance_t IdealEstimator::SwapExactTokensForTokens(const LiquidityPool *pool, const Token *soldToken, const balance_t &soldAmount, unsigned prediction_snapshot_key) const
 {
     return getAmountOut(soldAmount
-                        , pool->getReserve(soldToken)
-                        , pool->getReserve(soldToken == pool->token0 ? pool->token1 : pool->token0));
+                        , pool->getReserve(soldToken, prediction_snapshot_key)
+                        , pool->getReserve(soldToken == pool->token0 ? pool->token1 : pool->token0, prediction_snapshot_key));
 }
 
-balance_t EstimatorWithProportionalFees::SwapTokensForExactTokens(const LiquidityPool *pool, const Token *boughtToken, const balance_t &boughtAmount) const
+balance_t EstimatorWithProportionalFees::SwapTokensForExactTokens(const LiquidityPool *pool, const Token *boughtToken, const balance_t &boughtAmount, unsigned prediction_snapshot_key) const
 {
-    auto res = pool->getReserves();
+    auto res = pool->getReserves(prediction_snapshot_key);
     bool available = std::get<0>(res);
     auto &reserve0 = std::get<1>(res);
     auto &reserve1 = std::get<2>(res);
@@ -98,9 +98,9 @@ balance_t EstimatorWithProportionalFees::SwapTokensForExactTokens(const Liquidit
                        , pool->feesPPM());
 }
 
-balance_t EstimatorWithProportionalFees::SwapExactTokensForTokens(const LiquidityPool *pool, const Token *soldToken, const balance_t &soldAmount) const
+balance_t EstimatorWithProportionalFees::SwapExactTokensForTokens(const LiquidityPool *pool, const Token *soldToken, const balance_t &soldAmount, unsigned prediction_snapshot_key) const
 {
-    auto res = pool->getReserves();
+    auto res = pool->getReserves(prediction_snapshot_key);
     bool available = std::get<0>(res);
     auto &reserve0 = std::get<1>(res);
     auto &reserve1 = std::get<2>(res);
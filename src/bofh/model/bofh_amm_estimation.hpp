@@ -36,12 +36,12 @@ struct Estimator
     /**
      * @brief calculates the cost to buy a given wantedAmount of wantedToken
      */
-    virtual balance_t SwapTokensForExactTokens(const LiquidityPool *pool, const Token *wantedToken, const balance_t &wantedAmount) const = 0;
+    virtual balance_t SwapTokensForExactTokens(const LiquidityPool *pool, const Token *wantedToken, const balance_t &wantedAmount, unsigned prediction_snapshot_key = 0) const = 0;
 
     /**
      * @brief calculates the token balance received for in return for selling sentAmount of tokenSent
      */
-    virtual balance_t SwapExactTokensForTokens(const LiquidityPool *pool, const Token *tokenSent, const balance_t &sentAmount) const = 0;
+    virtual balance_t SwapExactTokensForTokens(const LiquidityPool *pool, const Token *tokenSent, const balance_t &sentAmount, unsigned prediction_snapshot_key = 0) const = 0;
 };
 
 
@@ -52,8 +52,8 @@ struct IdealEstimator: Estimator
 {
     using Estimator::Estimator;
 
-    virtual balance_t SwapTokensForExactTokens(const LiquidityPool *pool, const Token *boughtToken, const balance_t &boughtAmount) const;
-    virtual balance_t SwapExactTokensForTokens(const LiquidityPool *pool, const Token *soldToken, const balance_t &soldAmount) const;
+    virtual balance_t SwapTokensForExactTokens(const LiquidityPool *pool, const Token *boughtToken, const balance_t &boughtAmount, unsigned prediction_snapshot_key = 0) const;
+    virtual balance_t SwapExactTokensForTokens(const LiquidityPool *pool, const Token *soldToken, const balance_t &soldAmount, unsigned prediction_snapshot_key = 0) const;
 };
 
 
@@ -69,8 +69,8 @@ struct EstimatorWithProportionalFees: IdealEstimator
      *
      * Ex: 2 means 0.2%
      */
-    virtual balance_t SwapTokensForExactTokens(const LiquidityPool *pool, const Token *boughtToken, const balance_t &boughtAmount) const;
-    virtual balance_t SwapExactTokensForTokens(const LiquidityPool *pool, const Token *soldToken, const balance_t &soldAmount) const;
+    virtual balance_t SwapTokensForExactTokens(const LiquidityPool *pool, const Token *boughtToken, const balance_t &boughtAmount, unsigned prediction_snapshot_key = 0) const;
+    virtual balance_t SwapExactTokensForTokens(const LiquidityPool *pool, const Token *soldToken, const balance_t &soldAmount, unsigned prediction_snapshot_key = 0) const;
 };
 
 
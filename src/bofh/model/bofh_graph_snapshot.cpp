@@ -0,0 +1,348 @@
+#include "bofh_graph_snapshot.hpp"
+#include "bofh_model.hpp"
+#include "bofh_entity_idx.hpp"
+#include "../commons/bofh_log.hpp"
+#include <boost/interprocess/file_mapping.hpp>
+#include <boost/interprocess/mapped_region.hpp>
+#include <fstream>
+#include <cstring>
+#include <vector>
+
+
+namespace bofh {
+namespace model {
+
+namespace {
+// FIY: an unnamed namespace makes its content private to this code unit
+
+constexpr unsigned address_bytes = address_t::size_bits / 8;
+constexpr unsigned balance_bytes = 256 / 8;
+
+constexpr std::uint8_t FLAG_IS_STABLE     = 1 << 0;
+constexpr std::uint8_t FLAG_HAS_FEES      = 1 << 1;
+constexpr std::uint8_t FLAG_RESERVES_SET  = 1 << 2;
+
+
+struct Writer {
+    std::ofstream out;
+
+    explicit Writer(const char *path)
+        : out(path, std::ios::binary | std::ios::trunc)
+    {
+        if (!out)
+        {
+            throw std::runtime_error(strfmt("unable to open snapshot file for writing: %1%", path));
+        }
+    }
+
+    template<typename T> void pod(const T &v)
+    {
+        out.write(reinterpret_cast<const char *>(&v), sizeof(v));
+    }
+
+    void str(const std::string &s)
+    {
+        pod(static_cast<std::uint32_t>(s.size()));
+        out.write(s.data(), s.size());
+    }
+
+    template<typename N> void bigint(const N &v, unsigned nbytes)
+    {
+        char buf[balance_bytes] = {0};
+        assert(nbytes <= sizeof(buf));
+        N tmp = v;
+        for (unsigned i = nbytes; i > 0; --i)
+        {
+            buf[i-1] = static_cast<char>(static_cast<unsigned>(tmp & 0xff));
+            tmp >>= 8;
+        }
+        out.write(buf, nbytes);
+    }
+};
+
+
+struct Reader {
+    const char *ptr;
+    const char *end;
+
+    template<typename T> T pod()
+    {
+        need(sizeof(T));
+        T v;
+        std::memcpy(&v, ptr, sizeof(T));
+        ptr += sizeof(T);
+        return v;
+    }
+
+    std::string str()
+    {
+        auto len = pod<std::uint32_t>();
+        need(len);
+        std::string res(ptr, len);
+        ptr += len;
+        return res;
+    }
+
+    template<typename N> void bigint(N &v, unsigned nbytes)
+    {
+        need(nbytes);
+        auto p = reinterpret_cast<const unsigned char *>(ptr);
+        boost::multiprecision::import_bits(v, p, p+nbytes);
+        ptr += nbytes;
+    }
+
+    void need(std::size_t n)
+    {
+        if (static_cast<std::size_t>(end - ptr) < n)
+        {
+            throw std::runtime_error("snapshot file is truncated");
+        }
+    }
+};
+
+
+template<typename T, EntityType_e type>
+std::vector<const T *> m_entities_of_type(const TheGraph *graph)
+{
+    std::vector<const T *> res;
+    for (auto e: *graph->entity_index)
+    {
+        if (e->type == type)
+        {
+            res.emplace_back(reinterpret_cast<const T *>(e));
+        }
+    }
+    return res;
+}
+
+}; // unnamed namespace
+
+
+std::size_t save_graph_snapshot(const TheGraph *graph, const char *path)
+{
+    assert(graph != nullptr);
+    auto exchanges = m_entities_of_type<Exchange, TYPE_EXCHANGE>(graph);
+    auto tokens = m_entities_of_type<Token, TYPE_TOKEN>(graph);
+    auto pools = m_entities_of_type<LiquidityPool, TYPE_LP>(graph);
+
+    Writer w(path);
+    snapshot_header_t hdr;
+    std::memset(&hdr, 0, sizeof(hdr));
+    std::memcpy(hdr.magic, SNAPSHOT_MAGIC, sizeof(hdr.magic));
+    hdr.version = SNAPSHOT_VERSION;
+    hdr.reserves_block_number = graph->reserves_block_number;
+    hdr.exchanges_count = exchanges.size();
+    hdr.tokens_count = tokens.size();
+    hdr.pools_count = pools.size();
+    w.pod(hdr);
+
+    for (auto e: exchanges)
+    {
+        w.pod(static_cast<std::uint64_t>(e->tag));
+        w.bigint(e->address, address_bytes);
+        w.pod(static_cast<std::int32_t>(e->feesPPM()));
+        w.str(e->name);
+    }
+
+    for (auto t: tokens)
+    {
+        std::uint8_t flags = 0;
+        if (t->is_stable) flags |= FLAG_IS_STABLE;
+        if (t->hasFees()) flags |= FLAG_HAS_FEES;
+        w.pod(static_cast<std::uint64_t>(t->tag));
+        w.bigint(t->address, address_bytes);
+        w.pod(static_cast<std::uint32_t>(t->decimals));
+        w.pod(flags);
+        w.pod(static_cast<std::int32_t>(t->feesPPM()));
+        w.str(t->name);
+        w.str(t->symbol);
+    }
+
+    for (auto p: pools)
+    {
+        std::uint8_t flags = 0;
+        if (p->hasOwnFees()) flags |= FLAG_HAS_FEES;
+        if (p->reserves_set) flags |= FLAG_RESERVES_SET;
+        w.pod(static_cast<std::uint64_t>(p->tag));
+        w.bigint(p->address, address_bytes);
+        w.pod(static_cast<std::uint64_t>(p->exchange->tag));
+        w.pod(static_cast<std::uint64_t>(p->token0->tag));
+        w.pod(static_cast<std::uint64_t>(p->token1->tag));
+        w.pod(flags);
+        w.pod(static_cast<std::int32_t>(p->feesPPM()));
+        w.bigint(p->reserve0, balance_bytes);
+        w.bigint(p->reserve1, balance_bytes);
+    }
+
+    w.out.flush();
+    if (!w.out)
+    {
+        throw std::runtime_error(strfmt("error while writing snapshot file: %1%", path));
+    }
+
+    auto written = exchanges.size() + tokens.size() + pools.size();
+    log_info("graph snapshot saved to %1%: %2% exchanges, %3% tokens, %4% pools (at block %5%)"
+             , path, exchanges.size(), tokens.size(), pools.size(), graph->reserves_block_number);
+    return written;
+}
+
+
+static void m_check_header(const snapshot_header_t &hdr)
+{
+    if (std::memcmp(hdr.magic, SNAPSHOT_MAGIC, sizeof(hdr.magic)) != 0)
+    {
+        throw std::runtime_error("not a graph snapshot file (bad magic)");
+    }
+    if (hdr.version != SNAPSHOT_VERSION)
+    {
+        throw std::runtime_error(strfmt("unsupported graph snapshot version %1% (expected %2%)"
+                                        , hdr.version, SNAPSHOT_VERSION));
+    }
+}
+
+
+SnapshotLoadResult load_graph_snapshot(TheGraph *graph, const char *path)
+{
+    using namespace boost::interprocess;
+    assert(graph != nullptr);
+    SnapshotLoadResult res;
+
+    file_mapping fm(path, read_only);
+    mapped_region region(fm, read_only);
+    const auto begin = static_cast<const char *>(region.get_address());
+    const auto end = begin + region.get_size();
+
+    Reader hdr_reader{begin, end};
+    auto hdr = hdr_reader.pod<snapshot_header_t>();
+    m_check_header(hdr);
+
+    TheGraph::lock_guard_t lock_guard(graph->m_update_mutex);
+
+    // the file is walked twice: a first dry pass validates it entirely,
+    // so that a truncated file does not leave the graph half-loaded.
+    for (bool commit: {false, true})
+    {
+        Reader r{hdr_reader.ptr, end};
+
+        for (std::uint64_t i = 0; i < hdr.exchanges_count; ++i)
+        {
+            auto tag = r.pod<std::uint64_t>();
+            address_t address;
+            r.bigint(address, address_bytes);
+            auto feesPPM = r.pod<std::int32_t>();
+            auto name = r.str();
+            if (!commit) continue;
+
+            auto ptr = std::make_unique<Exchange>(tag, address, graph, name, feesPPM);
+            if (!graph->entity_index->emplace(ptr.get()).second)
+            {
+                res.rejected++;
+                continue;
+            }
+            ptr.release();
+            graph->exchanges_ctr++;
+            res.exchanges++;
+        }
+
+        for (std::uint64_t i = 0; i < hdr.tokens_count; ++i)
+        {
+            auto tag = r.pod<std::uint64_t>();
+            address_t address;
+            r.bigint(address, address_bytes);
+            auto decimals = r.pod<std::uint32_t>();
+            auto flags = r.pod<std::uint8_t>();
+            auto feesPPM = r.pod<std::int32_t>();
+            auto name = r.str();
+            auto symbol = r.str();
+            if (!commit) continue;
+
+            auto ptr = std::make_unique<Token>(tag, address, graph, name, symbol, decimals
+                                               , (flags & FLAG_IS_STABLE) != 0);
+            if (flags & FLAG_HAS_FEES) ptr->set_feesPPM(feesPPM);
+            if (!graph->entity_index->emplace(ptr.get()).second)
+            {
+                res.rejected++;
+                continue;
+            }
+            ptr.release();
+            graph->tokens_ctr++;
+            res.tokens++;
+        }
+
+        for (std::uint64_t i = 0; i < hdr.pools_count; ++i)
+        {
+            auto tag = r.pod<std::uint64_t>();
+            address_t address;
+            r.bigint(address, address_bytes);
+            auto exchange_tag = r.pod<std::uint64_t>();
+            auto token0_tag = r.pod<std::uint64_t>();
+            auto token1_tag = r.pod<std::uint64_t>();
+            auto flags = r.pod<std::uint8_t>();
+            auto feesPPM = r.pod<std::int32_t>();
+            balance_t reserve0, reserve1;
+            r.bigint(reserve0, balance_bytes);
+            r.bigint(reserve1, balance_bytes);
+            if (!commit) continue;
+
+            auto exchange = graph->entity_index->lookup<Exchange, TYPE_EXCHANGE>(exchange_tag);
+            auto token0 = graph->entity_index->lookup<Token, TYPE_TOKEN>(token0_tag);
+            auto token1 = graph->entity_index->lookup<Token, TYPE_TOKEN>(token1_tag);
+            if (exchange == nullptr || token0 == nullptr || token1 == nullptr)
+            {
+                res.rejected++;
+                continue;
+            }
+            auto lp = graph->add_lp_ll_unlocked(tag
+                                                , address
+                                                , exchange
+                                                , const_cast<Token*>(token0)
+                                                , const_cast<Token*>(token1)
+                                                , (flags & FLAG_HAS_FEES) != 0
+                                                , feesPPM);
+            if (lp == nullptr)
+            {
+                res.rejected++;
+                continue;
+            }
+            if (flags & FLAG_RESERVES_SET)
+            {
+                nonconst(*lp).setReserves(reserve0, reserve1);
+            }
+            res.pools++;
+        }
+    }
+
+    graph->reserves_block_number = hdr.reserves_block_number;
+    log_info("graph snapshot loaded from %1%: %2% exchanges, %3% tokens, %4% pools, "
+             "%5% rejected (at block %6%)"
+             , path, res.exchanges, res.tokens, res.pools, res.rejected, hdr.reserves_block_number);
+    return res;
+}
+
+
+std::uint64_t read_graph_snapshot_block_number(const char *path)
+{
+    std::ifstream in(path, std::ios::binary);
+    if (!in)
+    {
+        return 0;
+    }
+    snapshot_header_t hdr;
+    if (!in.read(reinterpret_cast<char *>(&hdr), sizeof(hdr)))
+    {
+        return 0;
+    }
+    try {
+        m_check_header(hdr);
+    }
+    catch (std::runtime_error &err) {
+        log_warning("%1%: %2%", path, err.what());
+        return 0;
+    }
+    return hdr.reserves_block_number;
+}
+
+
+} // namespace model
+} // namespace bofh
+
@@ -0,0 +1,79 @@
+/**
+ * @file bofh_graph_snapshot.hpp
+ * @brief Binary dump and reload of TheGraph content
+ *
+ * Preloading the knowledge graph from the status DB requires one
+ * Python->C++ call per entity, and parsing of every address and reserve
+ * from its text form. With hundreds of thousands of pools this takes minutes.
+ *
+ * A snapshot file stores the very same content (exchanges, tokens, pools,
+ * their reserves and the reserves_block_number they refer to) in a flat,
+ * fixed-layout binary form, that is read back via a memory mapped file.
+ *
+ * File layout (all integers are little endian, addresses and balances are
+ * big endian byte strings, as they are on-chain):
+ *
+ *  - snapshot_header_t
+ *  - exchanges_count x { tag, address[20], feesPPM, name }
+ *  - tokens_count    x { tag, address[20], decimals, flags, feesPPM, name, symbol }
+ *  - pools_count     x { tag, address[20], exchange, token0, token1, flags, feesPPM, reserve0[32], reserve1[32] }
+ *
+ * Strings are stored as { uint32 length, bytes }.
+ */
+
+#pragma once
+
+#include "bofh_model_fwd.hpp"
+#include <cstdint>
+
+namespace bofh {
+namespace model {
+
+constexpr char          SNAPSHOT_MAGIC[8] = {'B', 'O', 'F', 'H', 'G', 'R', 'P', 'H'};
+constexpr std::uint32_t SNAPSHOT_VERSION  = 1;
+
+struct snapshot_header_t {
+    char          magic[8];
+    std::uint32_t version;
+    std::uint32_t reserved;
+    std::uint64_t reserves_block_number;
+    std::uint64_t exchanges_count;
+    std::uint64_t tokens_count;
+    std::uint64_t pools_count;
+};
+
+
+/**
+ * @brief outcome of a snapshot load
+ */
+struct SnapshotLoadResult {
+    std::size_t exchanges = 0;  ///< number of exchanges added to the graph
+    std::size_t tokens = 0;     ///< number of tokens added to the graph
+    std::size_t pools = 0;      ///< number of pools added to the graph
+    std::size_t rejected = 0;   ///< entities that were already known, or not connectable
+};
+
+
+/**
+ * @brief dump the graph content to a snapshot file at @p path
+ * @return number of written entities
+ * @throws std::runtime_error on I/O failure
+ */
+std::size_t save_graph_snapshot(const TheGraph *graph, const char *path);
+
+/**
+ * @brief load graph content from the snapshot file at @p path (memory mapped)
+ * @throws std::runtime_error on I/O failure, bad magic or version mismatch
+ */
+SnapshotLoadResult load_graph_snapshot(TheGraph *graph, const char *path);
+
+/**
+ * @brief peek the reserves_block_number from the snapshot file at @p path
+ * @return 0 if the file does not exist, or is not a valid snapshot
+ */
+std::uint64_t read_graph_snapshot_block_number(const char *path);
+
+
+} // namespace model
+} // namespace bofh
+
@@ -1,8 +1,10 @@
 #include "bofh_model.hpp"
 #include "bofh_graph_distance.hpp"
+#include "bofh_graph_snapshot.hpp"
 #include "../commons/bofh_log.hpp"
 #include "bofh_entity_idx.hpp"
 #include "../pathfinder/swaps_idx.hpp"
+#include "../pathfinder/swaps_idx_file.hpp"
 #include "../pathfinder/paths.hpp"
 #include "../pathfinder/finder_3way.hpp"
 #include "../pathfinder/finder_all_crossing.hpp"
@@ -19,6 +21,7 @@
 #include <memory>
 #include <list>
 #include <algorithm>
+#include <iterator>
 #include <exception>
 #include <assert.h>
 
@@ -221,6 +224,26 @@ LiquidityPool::reserves_ref LiquidityPool::getReserves() const noexcept
     return reserves_ref{reserves_set, reserve0, reserve1};
 }
 
+const balance_t LiquidityPool::getReserve(const Token *token, unsigned prediction_snapshot_key) const noexcept
+{
+    auto res = getReserves(prediction_snapshot_key);
+    assert(token == token1 || token == token0);
+    return token == token0 ? std::get<1>(res) : std::get<2>(res);
+}
+
+LiquidityPool::reserves_ref LiquidityPool::getReserves(unsigned prediction_snapshot_key) const noexcept
+{
+    if (prediction_snapshot_key)
+    {
+        auto entry = parent->predicted_reserves.find(this, prediction_snapshot_key);
+        if (entry)
+        {
+            return reserves_ref{true, entry->reserve0, entry->reserve1};
+        }
+    }
+    return getReserves();
+}
+
 LiquidityPool::LiquidityPool(datatag_t tag_
               , const address_t &address_
               , TheGraph *parent_
@@ -239,19 +262,6 @@ LiquidityPool::LiquidityPool(datatag_t tag_
     token1->m_pools.emplace_back(this);
 }
 
-LiquidityPool::LiquidityPool(const ephemeral_clone_with_predicted_state&
-                             , const LiquidityPool &o)
-    : Entity(TYPE_LP, o.tag, o.address, o.parent),
-      exchange(o.exchange),
-      token0(o.token0),
-      token1(o.token1)
-{
-    assert(exchange != nullptr);
-    assert(token0 != nullptr);
-    assert(token1 != nullptr);
-}
-
-
 std::string LiquidityPool::get_name() const
 {
     return strfmt("%1%-%2%", token0->symbol, token1->symbol);
@@ -265,6 +275,20 @@ void LiquidityPool::setReserves(const balance_t &reserve0_, const balance_t &res
     reserve1 = reserve1_;
 }
 
+void LiquidityPool::setReserves(const std::uint8_t *reserve0_, std::size_t len0
+                                , const std::uint8_t *reserve1_, std::size_t len1)
+{
+    constexpr std::size_t max_len = 256 / 8;
+    if (len0 > max_len || len1 > max_len)
+    {
+        throw std::invalid_argument("raw reserves are wider than 256 bits");
+    }
+    balance_t r0 = 0, r1 = 0;
+    if (len0 > 0) boost::multiprecision::import_bits(r0, reserve0_, reserve0_+len0);
+    if (len1 > 0) boost::multiprecision::import_bits(r1, reserve1_, reserve1_+len1);
+    setReserves(r0, r1);
+}
+
 balance_t LiquidityPool::SwapTokensForExactTokens(const Token *wantedToken, const balance_t &wantedAmount) const
 {
     assert(exchange != nullptr);
@@ -272,6 +296,14 @@ balance_t LiquidityPool::SwapTokensForExactTokens(const Token *wantedToken, cons
     return exchange->estimator->SwapTokensForExactTokens(this, wantedToken, wantedAmount);
 }
 
+balance_t LiquidityPool::SwapTokensForExactTokens(const Token *wantedToken, const balance_t &wantedAmount
+                                                  , unsigned prediction_snapshot_key) const
+{
+    assert(exchange != nullptr);
+    assert(exchange->estimator != nullptr);
+    return exchange->estimator->SwapTokensForExactTokens(this, wantedToken, wantedAmount, prediction_snapshot_key);
+}
+
 balance_t LiquidityPool::SwapExactTokensForTokens(const Token *tokenSent, const balance_t &sentAmount) const
 {
     assert(exchange != nullptr);
@@ -279,6 +311,14 @@ balance_t LiquidityPool::SwapExactTokensForTokens(const Token *tokenSent, const
     return exchange->estimator->SwapExactTokensForTokens(this, tokenSent, sentAmount);
 }
 
+balance_t LiquidityPool::SwapExactTokensForTokens(const Token *tokenSent, const balance_t &sentAmount
+                                                  , unsigned prediction_snapshot_key) const
+{
+    assert(exchange != nullptr);
+    assert(exchange->estimator != nullptr);
+    return exchange->estimator->SwapExactTokensForTokens(this, tokenSent, sentAmount, prediction_snapshot_key);
+}
+
 int LiquidityPool::feesPPM() const
 {
     return m_hasFees
@@ -316,38 +356,57 @@ void LiquidityPool::set_feesPPM(int val)
 
 
 
-const LiquidityPool *LiquidityPool::get_predicted_state(unsigned key) const
+void LiquidityPool::set_predicted_reserves(unsigned key
+                            , const balance_t &reserve0
+                            , const balance_t &reserve1)
+{
+    parent->predicted_reserves.set(this, key, reserve0, reserve1);
+}
+
+
+static_assert(std::is_trivially_destructible<PredictedReserves::Entry>::value
+              , "PredictedReserves::reset() relies on trivially destructible entries");
+
+void PredictedReserves::reset(unsigned key_) noexcept
 {
-    auto i = m_predicted_state.find(key);
-    if (i == m_predicted_state.end())
+    key = key_;
+    entries.clear();
+}
+
+const PredictedReserves::Entry *PredictedReserves::find(const LiquidityPool *pool, unsigned key_) const noexcept
+{
+    if (key_ == 0 || key_ != key || pool->m_predicted_key != key_)
+    {
+        return nullptr;
+    }
+    auto slot = pool->m_predicted_slot;
+    if (slot >= entries.size() || entries[slot].pool != pool)
     {
-        return this;
+        // stale stamp of a former snapshot having the same key (wrap around)
+        return nullptr;
     }
-    return &i->second;
+    return &entries[slot];
 }
 
-void LiquidityPool::set_predicted_reserves(unsigned key
+void PredictedReserves::set(LiquidityPool *pool
+                            , unsigned key_
                             , const balance_t &reserve0
                             , const balance_t &reserve1)
 {
-    auto i = m_predicted_state.find(key);
-    if (i == m_predicted_state.end())
+    if (key_ == 0 || key_ != key)
     {
-        auto n = m_predicted_state.emplace(std::piecewise_construct
-                                           , std::forward_as_tuple(key)
-                                           , std::forward_as_tuple(
-                                               ephemeral_clone_with_predicted_state()
-                                               , *this));
-        i = n.first;
-        parent->predicted_snapshot_idx.emplace(key, this);
+        throw std::invalid_argument(strfmt("predicted snapshot %1% is not active", key_));
     }
-    i->second.reserve0 = reserve0;
-    i->second.reserve1 = reserve1;
-}
-
-void LiquidityPool::leave_predicted_state(unsigned key)
-{
-    m_predicted_state.erase(key);
+    auto entry = const_cast<Entry *>(find(pool, key_));
+    if (entry == nullptr)
+    {
+        pool->m_predicted_key = key_;
+        pool->m_predicted_slot = static_cast<std::uint32_t>(entries.size());
+        entries.push_back(Entry{pool, reserve0, reserve1});
+        return;
+    }
+    entry->reserve0 = reserve0;
+    entry->reserve1 = reserve1;
 }
 
 TheGraph::TheGraph()
@@ -371,6 +430,24 @@ auto already_exists = [](const auto &i) { return !i.second; };
 }; // unnamed namespace
 
 
+UpdateLock::UpdateLock(std::mutex &mutex)
+    : m_mutex(mutex)
+{
+    if (m_mutex.try_lock())
+    {
+        return;
+    }
+    if (!Py_IsInitialized() || !PyGILState_Check())
+    {
+        m_mutex.lock();
+        return;
+    }
+    PyThreadState *state = PyEval_SaveThread();
+    m_mutex.lock();
+    PyEval_RestoreThread(state);
+}
+
+
 const Exchange *TheGraph::add_exchange(datatag_t tag
                                        , const char *address
                                        , const string &name
@@ -467,6 +544,18 @@ const Token *TheGraph::add_token(datatag_t tag
                                  , int feesPPM)
 {
     lock_guard_t lock_guard(m_update_mutex);
+    return add_token_ll_unlocked(tag, address, name, symbol, decimals, is_stablecoin, hasFees, feesPPM);
+}
+
+const Token *TheGraph::add_token_ll_unlocked(datatag_t tag
+                                             , const address_t &address
+                                             , const char *name
+                                             , const char *symbol
+                                             , unsigned int decimals
+                                             , bool is_stablecoin
+                                             , bool hasFees
+                                             , int feesPPM)
+{
     auto ptr = std::make_unique<Token>(tag
                                        , address
                                        , this
@@ -567,6 +656,18 @@ const LiquidityPool *TheGraph::add_lp_ll(datatag_t tag
                                          , Token* token1
                                          , bool hasFees
                                          , int feesPPM)
+{
+    lock_guard_t lock_guard(m_update_mutex);
+    return add_lp_ll_unlocked(tag, address, exchange, token0, token1, hasFees, feesPPM);
+}
+
+const LiquidityPool *TheGraph::add_lp_ll_unlocked(datatag_t tag
+                                                  , const address_t &address
+                                                  , const Exchange* exchange
+                                                  , Token* token0
+                                                  , Token* token1
+                                                  , bool hasFees
+                                                  , int feesPPM)
 {
     check_not_null_arg(exchange);
     check_not_null_arg(token0);
@@ -578,7 +679,6 @@ const LiquidityPool *TheGraph::add_lp_ll(datatag_t tag
                                                , token0
                                                , token1);
     if (hasFees) ptr->set_feesPPM(feesPPM);
-    lock_guard_t lock_guard(m_update_mutex);
 
     auto item = entity_index->emplace(ptr.get());
     if (already_exists(item))
@@ -617,6 +717,210 @@ const LiquidityPool *TheGraph::add_lp(datatag_t tag
 }
 
 
+BulkRejectedRows TheGraph::add_tokens_bulk(const std::vector<TokenBulkRow> &rows)
+{
+    BulkRejectedRows rejected;
+    lock_guard_t lock_guard(m_update_mutex);
+    for (std::size_t i = 0; i < rows.size(); ++i)
+    {
+        auto &row = rows[i];
+        auto t = add_token_ll_unlocked(row.tag
+                                       , row.address
+                                       , row.name.c_str()
+                                       , row.symbol.c_str()
+                                       , row.decimals
+                                       , row.is_stablecoin
+                                       , row.hasFees
+                                       , row.feesPPM);
+        if (t == nullptr)
+        {
+            rejected.push_back(i);
+        }
+    }
+    return rejected;
+}
+
+BulkRejectedRows TheGraph::add_lps_bulk(const std::vector<LPBulkRow> &rows)
+{
+    BulkRejectedRows rejected;
+    lock_guard_t lock_guard(m_update_mutex);
+    for (std::size_t i = 0; i < rows.size(); ++i)
+    {
+        auto &row = rows[i];
+        auto exchange = entity_index->lookup<Exchange, TYPE_EXCHANGE>(row.exchange);
+        auto token0 = entity_index->lookup<Token, TYPE_TOKEN>(row.token0);
+        auto token1 = entity_index->lookup<Token, TYPE_TOKEN>(row.token1);
+        if (exchange == nullptr || token0 == nullptr || token1 == nullptr ||
+                add_lp_ll_unlocked(row.tag
+                                   , row.address
+                                   , exchange
+                                   , const_cast<Token*>(token0)
+                                   , const_cast<Token*>(token1)
+                                   , row.hasFees
+                                   , row.feesPPM) == nullptr)
+        {
+            rejected.push_back(i);
+        }
+    }
+    return rejected;
+}
+
+
+namespace {
+// FIY: an unnamed namespace makes its content private to this code unit
+
+constexpr std::size_t sync_word_nibs = 256 / 4;
+
+inline int m_nibble(char c)
+{
+    if (c >= '0' && c <= '9') return c - '0';
+    if (c >= 'a' && c <= 'f') return c - 'a' + 10;
+    if (c >= 'A' && c <= 'F') return c - 'A' + 10;
+    return -1;
+}
+
+/**
+ * @brief decode one 256 bit word of hex digits
+ * @return false if any of the digits is not hex
+ */
+bool m_parse_word(const char *nibs, balance_t &res)
+{
+    std::uint8_t buf[sync_word_nibs / 2];
+    for (std::size_t i = 0; i < sizeof(buf); ++i)
+    {
+        auto hi = m_nibble(nibs[i*2]);
+        auto lo = m_nibble(nibs[i*2+1]);
+        if (hi < 0 || lo < 0) return false;
+        buf[i] = static_cast<std::uint8_t>(hi << 4 | lo);
+    }
+    res = 0;
+    boost::multiprecision::import_bits(res, buf, buf+sizeof(buf));
+    return true;
+}
+
+bool m_parse_sync_data(const std::string &data, balance_t &reserve0, balance_t &reserve1)
+{
+    std::size_t offset = data.compare(0, 2, "0x") == 0 ? 2 : 0;
+    if (data.size() < offset + sync_word_nibs * 2)
+    {
+        return false;
+    }
+    return m_parse_word(data.data() + offset, reserve0) &&
+           m_parse_word(data.data() + offset + sync_word_nibs, reserve1);
+}
+
+}; // unnamed namespace
+
+
+SyncLogsOutcome TheGraph::apply_sync_logs(const std::vector<SyncLogRow> &rows, unsigned prediction_key)
+{
+    SyncLogsOutcome res;
+    res.updated.reserve(rows.size());
+    lock_guard_t lock_guard(m_update_mutex);
+    for (std::size_t i = 0; i < rows.size(); ++i)
+    {
+        auto &row = rows[i];
+        balance_t reserve0, reserve1;
+        if (!m_parse_sync_data(row.data, reserve0, reserve1))
+        {
+            log_warning("apply_sync_logs(): malformed Sync log data of pool %1%: %2%"
+                        , row.address, row.data);
+            res.malformed.push_back(i);
+            continue;
+        }
+        auto lp = entity_index->lookup<LiquidityPool, TYPE_LP>(row.address);
+        if (lp == nullptr)
+        {
+            res.unknown.push_back(i);
+            continue;
+        }
+        if (prediction_key != 0)
+        {
+            nonconst(*lp).set_predicted_reserves(prediction_key, reserve0, reserve1);
+        }
+        else
+        {
+            m_record_sync_undo(lp, row.block_number);
+            nonconst(*lp).setReserves(reserve0, reserve1);
+        }
+        res.updated.push_back(SyncLogUpdate{i, lp, reserve0, reserve1});
+    }
+    return res;
+}
+
+
+void TheGraph::m_record_sync_undo(const LiquidityPool *lp, std::uint64_t block_number)
+{
+    if (sync_undo_depth == 0 || block_number == 0)
+    {
+        return;
+    }
+    auto &log = m_sync_undo_log;
+    // first entry of a newer block. That's the end of the log, unless this is a late comer
+    auto next = log.end();
+    while (next != log.begin() && std::prev(next)->block_number > block_number) --next;
+    auto previous = std::make_pair(lp->reserve0, lp->reserve1);
+    for (auto i = next; i != log.end(); ++i)
+    {
+        // a newer block already changed the pool: its pre-block state comes first
+        auto j = i->previous.find(lp);
+        if (j != i->previous.end())
+        {
+            previous = j->second;
+            break;
+        }
+    }
+    auto entry = next;
+    if (next != log.begin() && std::prev(next)->block_number == block_number)
+    {
+        --entry;
+    }
+    else
+    {
+        if (next == log.begin() && !log.empty() && log.size() >= sync_undo_depth)
+        {
+            // older than the oldest recorded block: out of the undo window
+            return;
+        }
+        entry = log.insert(next, BlockReservesUndo{block_number, {}});
+        while (log.size() > sync_undo_depth) log.pop_front();
+    }
+    // only the first update of the block matters: that's the pre-block state
+    entry->previous.emplace(lp, previous);
+}
+
+
+std::vector<SyncLogUpdate> TheGraph::rollback_sync_logs(std::uint64_t block_number)
+{
+    std::map<const LiquidityPool *, std::pair<balance_t, balance_t>> restored;
+    lock_guard_t lock_guard(m_update_mutex);
+    auto &log = m_sync_undo_log;
+    // newest blocks first: the oldest pre-block reserves of each pool win
+    while (!log.empty() && log.back().block_number >= block_number)
+    {
+        for (auto &i: log.back().previous)
+        {
+            restored[i.first] = i.second;
+        }
+        log.pop_back();
+    }
+    std::vector<SyncLogUpdate> res;
+    res.reserve(restored.size());
+    for (auto &i: restored)
+    {
+        auto lp = i.first;
+        nonconst(*lp).setReserves(i.second.first, i.second.second);
+        res.push_back(SyncLogUpdate{0, lp, i.second.first, i.second.second});
+    }
+    if (!res.empty())
+    {
+        log_info("rollback_sync_logs(): reserves of %1% pools restored as of before block %2%"
+                 , res.size(), block_number);
+    }
+    return res;
+}
+
+
 const LiquidityPool *TheGraph::lookup_lp(const address_t &address)
 {
     return lookup_lp(address, true);
@@ -846,6 +1150,19 @@ TheGraph::PathList TheGraph::find_paths_crossing_lp(const LiquidityPool *lp
 }
 
 
+std::size_t TheGraph::warmup_paths_crossing_lp(const LiquidityPool *lp
+                                               , unsigned max_length
+                                               , unsigned max_count)
+{
+    lock_guard_t lock_guard(m_update_mutex);
+    if (paths_index->has_paths_for(lp))
+    {
+        return 0;
+    }
+    return find_paths_crossing_lp(lp, max_length, max_count).size();
+}
+
+
 static void check_constrants_consistency(TheGraph *g, const PathEvalutionConstraints &c)
 {
     assert(g != nullptr);
@@ -953,6 +1270,7 @@ TheGraph::PathResultList TheGraph::debug_evaluate_known_paths(const PathEvalutio
     {
         // @note: loop body is a try block
 
+        if (only_ready_paths && !i.second->all_pools_ready()) continue;
         auto attack_plan = evaluate_path(c, i.second, false);
         if (attack_plan.failed) continue;
         assert(attack_plan.final_token() != nullptr);
@@ -1007,18 +1325,18 @@ unsigned TheGraph::start_predicted_snapshot()
     do {
         predicted_snapshot_key++;
     } while (predicted_snapshot_key == 0);
+    // a snapshot not terminated yet is dropped
+    predicted_reserves.reset(predicted_snapshot_key);
     return predicted_snapshot_key;
 }
 
 void TheGraph::terminate_predicted_snapshot(unsigned key)
 {
     lock_guard_t lock_guard(m_update_mutex);
-    auto range = predicted_snapshot_idx.equal_range(key);
-    for (auto i = range.first; i != range.second; ++i)
+    if (key == predicted_reserves.key)
     {
-        i->second->leave_predicted_state(key);
+        predicted_reserves.reset(0);
     }
-    predicted_snapshot_idx.erase(range.first, range.second);
 }
 
 
@@ -1094,14 +1412,18 @@ TheGraph::PathResultList TheGraph::evaluate_paths_of_interest(const PathEvalutio
     unsigned max_path_len = pathfinder::MAX_PATHS;
     if (c.max_path_len != 0) max_path_len = c.max_path_len;
 
-    auto range = predicted_snapshot_idx.equal_range(prediction_snapshot_key);
-    for (auto iter = range.first; iter != range.second; ++iter)
+    if (prediction_snapshot_key == 0 || prediction_snapshot_key != predicted_reserves.key)
+    {
+        return res;
+    }
+    for (const auto &entry: predicted_reserves.entries)
     {
-        auto pool = iter->second;
+        auto pool = entry.pool;
 
         auto paths = find_paths_crossing_lp(pool, max_path_len, path_discovery_limit);
         for (auto path: paths)
         {
+            if (only_ready_paths && !path->all_pools_ready()) continue;
             try {
                 auto attack_plan = evaluate_path(c, path, prediction_snapshot_key);
                 if (attack_plan.failed) continue;
@@ -1343,6 +1665,30 @@ void TheGraph::set_start_token(Token *token)
     calc_pools_distance_on_tokens(this);
 }
 
+std::size_t TheGraph::save_snapshot(const char *path)
+{
+    // the snapshot is also saved while live, and Sync logs may be applied meanwhile
+    lock_guard_t lock_guard(m_update_mutex);
+    return save_graph_snapshot(this, path);
+}
+
+std::size_t TheGraph::load_snapshot(const char *path)
+{
+    return load_graph_snapshot(this, path).pools;
+}
+
+std::size_t TheGraph::save_paths_index(const char *path)
+{
+    lock_guard_t lock_guard(m_update_mutex);
+    return pathfinder::idx::save_paths_index(this, path);
+}
+
+std::size_t TheGraph::load_paths_index(const char *path)
+{
+    lock_guard_t lock_guard(m_update_mutex);
+    return pathfinder::idx::load_paths_index(this, path).paths;
+}
+
 
 } // namespace model
 } // namespace bofh
@@ -26,6 +26,8 @@
 #endif
 #include <set>
 #include <map>
+#include <deque>
+#include <vector>
 #include <memory>
 #include <mutex>
 #include "../pathfinder/swaps_idx_fwd.hpp"
@@ -240,17 +242,21 @@ struct LiquidityPool: Entity, Ref<LiquidityPool>
                   , Token* token0_
                   , Token* token1_);
 
-    // specialized constructor that is only used to temporarily represent LPs
-    // in their future predicted state.
-    struct ephemeral_clone_with_predicted_state {};
-    LiquidityPool(const ephemeral_clone_with_predicted_state&
-                  , const LiquidityPool &o);
-
-
-
     void setReserves(const balance_t &reserve0, const balance_t &reserve1);
+    /**
+     * @brief set reserves from their raw big endian representation (up to 32 bytes each),
+     *        as stored in the status DB or returned on-chain
+     */
+    void setReserves(const std::uint8_t *reserve0, std::size_t len0
+                     , const std::uint8_t *reserve1, std::size_t len1);
     const balance_t getReserve(const Token *token) const noexcept;
     reserves_ref getReserves() const noexcept;
+    /**
+     * @brief reserves in the given predicted snapshot: the predicted ones if any,
+     *        or the base ones (see TheGraph::start_predicted_snapshot())
+     */
+    const balance_t getReserve(const Token *token, unsigned prediction_snapshot_key) const noexcept;
+    reserves_ref getReserves(unsigned prediction_snapshot_key) const noexcept;
     std::string get_name() const;
 
 
@@ -258,14 +264,19 @@ struct LiquidityPool: Entity, Ref<LiquidityPool>
      * @brief calculates the cost to buy a given wantedAmount of wantedToken
      */
     balance_t SwapTokensForExactTokens(const Token *wantedToken, const balance_t &wantedAmount) const;
+    balance_t SwapTokensForExactTokens(const Token *wantedToken, const balance_t &wantedAmount
+                                       , unsigned prediction_snapshot_key) const;
 
     /**
      * @brief calculates the token balance received for in return for selling sentAmount of tokenSent
      */
     balance_t SwapExactTokensForTokens(const Token *tokenSent, const balance_t &sentAmount) const;
+    balance_t SwapExactTokensForTokens(const Token *tokenSent, const balance_t &sentAmount
+                                       , unsigned prediction_snapshot_key) const;
 
     int feesPPM() const;
     bool hasFees() const;
+    bool hasOwnFees() const { return m_hasFees; } ///< true if fees are set on the pool, not inherited from exchange
     void set_feesPPM(int val);
 private:
     bool m_hasFees = false;
@@ -282,14 +293,109 @@ public:
 //public:
 
 
-    const LiquidityPool *get_predicted_state(unsigned key) const;
     void set_predicted_reserves(unsigned key
                                 , const balance_t &reserve0
                                 , const balance_t &reserve1);
-    void leave_predicted_state(unsigned key);
 
 private:
-    std::map<unsigned, LiquidityPool> m_predicted_state;
+    friend struct PredictedReserves;
+    // stamp of the predicted snapshot this pool was last set in, and of its overlay entry
+    unsigned m_predicted_key = 0;
+    std::uint32_t m_predicted_slot = 0;
+};
+
+
+/**
+ * @brief flat overlay of the predicted reserves of a snapshot, consulted before the
+ *        base reserves of the pools (see TheGraph::start_predicted_snapshot())
+ *
+ * Only one snapshot is active at a time. Its entries are appended to an arena which is
+ * reused across snapshots: reset() only drops the size, as the entries are trivially
+ * destructible. Each pool is stamped with the key of the snapshot it was predicted in,
+ * and the slot of its entry, so that lookups need no index, and the stale stamps no cleanup.
+ */
+struct PredictedReserves
+{
+    struct Entry
+    {
+        LiquidityPool *pool;
+        balance_t reserve0;
+        balance_t reserve1;
+    };
+
+    unsigned key = 0;
+    std::vector<Entry> entries;
+
+    void reset(unsigned key_) noexcept;
+    const Entry *find(const LiquidityPool *pool, unsigned key_) const noexcept;
+    void set(LiquidityPool *pool, unsigned key_, const balance_t &reserve0, const balance_t &reserve1);
+};
+
+
+/**
+ * @brief one row of a columnar token bulk-load (see TheGraph::add_tokens_bulk())
+ */
+struct TokenBulkRow {
+    datatag_t tag;
+    address_t address;
+    std::string name;
+    std::string symbol;
+    unsigned int decimals;
+    bool is_stablecoin;
+    bool hasFees;
+    int feesPPM;
+};
+
+/**
+ * @brief one row of a columnar LP bulk-load (see TheGraph::add_lps_bulk())
+ */
+struct LPBulkRow {
+    datatag_t tag;
+    address_t address;
+    datatag_t exchange;
+    datatag_t token0;
+    datatag_t token1;
+    bool hasFees;
+    int feesPPM;
+};
+
+typedef std::vector<std::size_t> BulkRejectedRows;
+
+/**
+ * @brief one raw Sync(uint112,uint112) log, as received from the node (see TheGraph::apply_sync_logs())
+ */
+struct SyncLogRow {
+    address_t address;
+    std::string data;                   ///< 0x... hexstring of the log data (reserve0, reserve1 words)
+    std::uint64_t block_number = 0;     ///< 0 if unknown (ie: pending)
+};
+
+/**
+ * @brief reserves update applied by TheGraph::apply_sync_logs()
+ */
+struct SyncLogUpdate {
+    std::size_t row;
+    const LiquidityPool *lp;
+    balance_t reserve0;
+    balance_t reserve1;
+};
+
+/**
+ * @brief reserves of the pools changed by the Sync logs of one block, as they were before it
+ * (see TheGraph::rollback_sync_logs())
+ */
+struct BlockReservesUndo {
+    std::uint64_t block_number;
+    std::map<const LiquidityPool *, std::pair<balance_t, balance_t>> previous;
+};
+
+/**
+ * @brief outcome of TheGraph::apply_sync_logs()
+ */
+struct SyncLogsOutcome {
+    std::vector<SyncLogUpdate> updated;
+    BulkRejectedRows unknown;           ///< rows of pools not in the graph
+    BulkRejectedRows malformed;         ///< rows whose data could not be parsed
 };
 
 
@@ -305,6 +411,23 @@ private:
  *
  * We want to be in that neighborhood.
  */
+/**
+ * @brief Scoped lock of TheGraph::m_update_mutex.
+ *
+ * The holder of the mutex may need the GIL, ie: to emit log events into the Python sink
+ * (see log_emit_ll()). A thread holding the GIL must not wait for the mutex with it,
+ * or they would deadlock: the GIL is released meanwhile, then taken back.
+ */
+struct UpdateLock: boost::noncopyable
+{
+    explicit UpdateLock(std::mutex &mutex);
+    ~UpdateLock() { m_mutex.unlock(); }
+
+private:
+    std::mutex &m_mutex;
+};
+
+
 struct TheGraph: boost::noncopyable, Ref<TheGraph>
 {
 
@@ -318,7 +441,7 @@ struct TheGraph: boost::noncopyable, Ref<TheGraph>
     std::unique_ptr<idx::SwapIndex>   swap_index;
     std::unique_ptr<pathfinder::idx::SwapPathsIndex> paths_index;
     std::mutex m_update_mutex;
-    typedef std::lock_guard<std::mutex> lock_guard_t;
+    typedef UpdateLock lock_guard_t;
 
     TheGraph();
 
@@ -358,6 +481,17 @@ struct TheGraph: boost::noncopyable, Ref<TheGraph>
                            , bool is_stablecoin
                            , bool hasFees
                            , int feesPPM);
+    /**
+     * @brief same as add_token(), but expects m_update_mutex to be already held by the caller
+     */
+    const Token *add_token_ll_unlocked(datatag_t tag
+                                       , const address_t &address
+                                       , const char *name
+                                       , const char *symbol
+                                       , unsigned int decimals
+                                       , bool is_stablecoin
+                                       , bool hasFees
+                                       , int feesPPM);
 
     /**
      * @brief Introduce a new LP edge into the graph, if not existing. (low level)
@@ -376,6 +510,16 @@ struct TheGraph: boost::noncopyable, Ref<TheGraph>
                                    , Token* token1
                                    , bool hasFees
                                    , int feesPPM);
+    /**
+     * @brief same as add_lp_ll(), but expects m_update_mutex to be already held by the caller
+     */
+    const LiquidityPool *add_lp_ll_unlocked(datatag_t tag
+                                            , const address_t &address
+                                            , const Exchange* exchange
+                                            , Token* token0
+                                            , Token* token1
+                                            , bool hasFees
+                                            , int feesPPM);
     /**
      * @brief Introduce a new LP edge into the graph, if not existing.
      *
@@ -395,6 +539,50 @@ struct TheGraph: boost::noncopyable, Ref<TheGraph>
                                 , bool hasFees
                                 , int feesPPM);
 
+    /**
+     * @brief Introduce many tokens at once, holding m_update_mutex only once.
+     *
+     * Rows are indexed in a single pass. No fetch callback is ever invoked.
+     * @return indexes of the rejected rows (address or tag already known)
+     */
+    BulkRejectedRows add_tokens_bulk(const std::vector<TokenBulkRow> &rows);
+
+    /**
+     * @brief Introduce many LPs at once, holding m_update_mutex only once.
+     *
+     * Exchange and tokens are looked up in the index only: the fetch callbacks
+     * used by add_lp() are never invoked.
+     * @return indexes of the rejected rows (already known, or endpoints not found)
+     */
+    BulkRejectedRows add_lps_bulk(const std::vector<LPBulkRow> &rows);
+
+    /**
+     * @brief Apply a batch of Sync logs, holding m_update_mutex only once.
+     *
+     * Log data is parsed and pools are looked up in the index only (no fetch
+     * callbacks are ever invoked), rows are applied in order.
+     * @param prediction_key if not 0, reserves are set as predicted state of
+     *        the given snapshot (see LiquidityPool::set_predicted_reserves())
+     */
+    SyncLogsOutcome apply_sync_logs(const std::vector<SyncLogRow> &rows, unsigned prediction_key = 0);
+
+    /**
+     * @brief Undo the Sync logs of the blocks from @p block_number onward (ie: reorged away).
+     *
+     * Pools changed in those blocks are set back to the reserves they had before,
+     * as recorded by apply_sync_logs() in the undo log of the last sync_undo_depth blocks.
+     * @return the restored reserves: updates are reported as they were issued to the model,
+     *         with block_number - 1 as block number.
+     */
+    std::vector<SyncLogUpdate> rollback_sync_logs(std::uint64_t block_number);
+
+    /**
+     * @brief number of blocks kept in the Sync logs undo log (0 disables it)
+     */
+    unsigned sync_undo_depth = 64;
+    std::deque<BlockReservesUndo> m_sync_undo_log;
+    void m_record_sync_undo(const LiquidityPool *lp, std::uint64_t block_number);
+
 
     /**
      * @brief fetch a known token node by address
@@ -449,6 +637,16 @@ struct TheGraph: boost::noncopyable, Ref<TheGraph>
     PathList find_paths_to_token(const Token *token) const;
     PathList find_paths_crossing_lp(const LiquidityPool *lp, unsigned max_length, unsigned max_count) const;
 
+    /**
+     * @brief populate the paths index entry of @p lp ahead of its first use
+     *
+     * Same as find_paths_crossing_lp(), but it holds m_update_mutex,
+     * so that it can run on a background thread, concurrently to path evaluation.
+     *
+     * @return number of newly indexed paths crossing @p lp (0 if the entry was already there)
+     */
+    std::size_t warmup_paths_crossing_lp(const LiquidityPool *lp, unsigned max_length, unsigned max_count);
+
 
 
     /**
@@ -470,7 +668,7 @@ struct TheGraph: boost::noncopyable, Ref<TheGraph>
     PathResult evaluate_path(const PathEvalutionConstraints &constraints, std::size_t path_hash) const;
 
     unsigned predicted_snapshot_key = 0;
-    std::multimap<unsigned, LiquidityPool*> predicted_snapshot_idx;
+    PredictedReserves predicted_reserves;
 
 
     const Path *lookup_path(std::size_t id) const;
@@ -527,6 +725,51 @@ struct TheGraph: boost::noncopyable, Ref<TheGraph>
     Token *get_start_token() const;
     void set_start_token(Token *token);
 
+
+    /**
+     * @brief block number the current pool reserves refer to.
+     *
+     * The model does not update this by itself. It's tracked on behalf of
+     * the Python runtime, and persisted by save_snapshot().
+     */
+    std::uint64_t reserves_block_number = 0;
+
+    /**
+     * @brief skip evaluation of paths crossing pools whose reserves are still unknown
+     *
+     * Set during progressive startup, while reserves are still being downloaded.
+     * Unready pools are then neither evaluated, nor fetched via callback.
+     */
+    bool only_ready_paths = false;
+
+    /**
+     * @brief dump exchanges, tokens, pools and their reserves to a binary snapshot file
+     * @see bofh_graph_snapshot.hpp
+     */
+    std::size_t save_snapshot(const char *path);
+
+    /**
+     * @brief load exchanges, tokens, pools and their reserves from a binary snapshot file
+     * @return number of loaded pools
+     */
+    std::size_t load_snapshot(const char *path);
+
+    /**
+     * @brief dump the known paths, and the lp -> paths index, to a binary file
+     * @see swaps_idx_file.hpp
+     */
+    std::size_t save_paths_index(const char *path);
+
+    /**
+     * @brief reload the known paths, and the lp -> paths index, from a binary file
+     *
+     * Requires the start token to be set. If the topology changed since the save,
+     * the whole file is ignored, and paths will be recomputed lazily.
+     *
+     * @return number of loaded paths
+     */
+    std::size_t load_paths_index(const char *path);
+
 };
 
 
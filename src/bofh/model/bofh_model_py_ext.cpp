@@ -8,6 +8,7 @@
 #include "unicodeobject.h"
 #include "bofh_model.hpp"
 #include "bofh_entity_idx.hpp"
+#include "bofh_graph_snapshot.hpp"
 #include "../pathfinder/finder_3way.hpp"
 #include "../pathfinder/swaps_idx.hpp"
 #include "../pathfinder/paths.hpp"
@@ -147,6 +148,346 @@ struct balance_to_python_long
 };
 
 
+/**
+ * @brief Helpers to decode the parallel columns passed to the *_bulk() methods of TheGraph
+ *
+ * Every column is a Python sequence of the very same length, except addresses,
+ * which are passed as one packed bytes-like object of 20 bytes per row
+ * (ie: b''.join(bytes.fromhex(a[2:]) for a in addresses)).
+ */
+struct BulkColumns
+{
+    std::size_t rows;
+    std::vector<object> columns;
+
+    BulkColumns(std::size_t rows_)
+        : rows(rows_)
+    {}
+
+    /// keeps a PySequence_Fast() reference to the column, checking its length
+    PyObject **column(object seq, const char *name)
+    {
+        object fast(handle<>(PySequence_Fast(seq.ptr(), name)));
+        if (static_cast<std::size_t>(PySequence_Fast_GET_SIZE(fast.ptr())) != rows)
+        {
+            PyErr_Format(PyExc_ValueError, "%s: column length mismatch", name);
+            throw_error_already_set();
+        }
+        columns.push_back(fast);
+        return PySequence_Fast_ITEMS(fast.ptr());
+    }
+
+    static std::vector<address_t> addresses(object buf)
+    {
+        Py_buffer view;
+        if (PyObject_GetBuffer(buf.ptr(), &view, PyBUF_SIMPLE) != 0)
+        {
+            throw_error_already_set();
+        }
+        std::vector<address_t> res;
+        if (view.len % address_t::size_bytes != 0)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_ValueError, "addresses: expected packed 20-bytes addresses");
+            throw_error_already_set();
+        }
+        auto ptr = static_cast<const unsigned char *>(view.buf);
+        auto end = ptr + view.len;
+        res.reserve(view.len / address_t::size_bytes);
+        for (; ptr < end; ptr += address_t::size_bytes)
+        {
+            res.emplace_back(address_t::from_bytes(ptr));
+        }
+        PyBuffer_Release(&view);
+        return res;
+    }
+
+    static unsigned long long to_ull(PyObject *o)
+    {
+        auto v = PyLong_AsUnsignedLongLong(o);
+        if (PyErr_Occurred()) throw_error_already_set();
+        return v;
+    }
+
+    static long to_long(PyObject *o)
+    {
+        auto v = PyLong_AsLong(o);
+        if (PyErr_Occurred()) throw_error_already_set();
+        return v;
+    }
+
+    static bool to_bool(PyObject *o)
+    {
+        auto v = PyObject_IsTrue(o);
+        if (v < 0) throw_error_already_set();
+        return v != 0;
+    }
+
+    static const char *to_str(PyObject *o)
+    {
+        auto v = PyUnicode_AsUTF8(o);
+        if (v == nullptr) throw_error_already_set();
+        return v;
+    }
+
+    static list to_list(const BulkRejectedRows &rejected)
+    {
+        list res;
+        for (auto i: rejected) res.append(i);
+        return res;
+    }
+};
+
+
+/**
+ * @brief Python binding of LiquidityPool::setReserves(), accepting raw big endian bytes-like objects
+ */
+static void LiquidityPool_setReservesRaw(LiquidityPool &self, object reserve0, object reserve1)
+{
+    Py_buffer view0, view1;
+    if (PyObject_GetBuffer(reserve0.ptr(), &view0, PyBUF_SIMPLE) != 0)
+    {
+        throw_error_already_set();
+    }
+    if (PyObject_GetBuffer(reserve1.ptr(), &view1, PyBUF_SIMPLE) != 0)
+    {
+        PyBuffer_Release(&view0);
+        throw_error_already_set();
+    }
+    try {
+        self.setReserves(static_cast<const std::uint8_t *>(view0.buf), view0.len
+                         , static_cast<const std::uint8_t *>(view1.buf), view1.len);
+    }
+    catch (std::invalid_argument &err) {
+        PyBuffer_Release(&view0);
+        PyBuffer_Release(&view1);
+        PyErr_SetString(PyExc_ValueError, err.what());
+        throw_error_already_set();
+    }
+    PyBuffer_Release(&view0);
+    PyBuffer_Release(&view1);
+}
+
+
+/**
+ * @brief Python binding of TheGraph::add_tokens_bulk(), accepting columns
+ * @return list of rejected row indexes
+ */
+static list TheGraph_add_tokens_bulk(TheGraph &self
+                                     , object tags
+                                     , object addresses
+                                     , object names
+                                     , object symbols
+                                     , object decimals
+                                     , object is_stablecoin
+                                     , object hasFees
+                                     , object feesPPM)
+{
+    auto addrs = BulkColumns::addresses(addresses);
+    BulkColumns cols(addrs.size());
+    auto tags_          = cols.column(tags         , "tags");
+    auto names_         = cols.column(names        , "names");
+    auto symbols_       = cols.column(symbols      , "symbols");
+    auto decimals_      = cols.column(decimals     , "decimals");
+    auto is_stablecoin_ = cols.column(is_stablecoin, "is_stablecoin");
+    auto hasFees_       = cols.column(hasFees      , "hasFees");
+    auto feesPPM_       = cols.column(feesPPM      , "feesPPM");
+
+    std::vector<TokenBulkRow> rows(cols.rows);
+    for (std::size_t i = 0; i < cols.rows; ++i)
+    {
+        auto &row = rows[i];
+        row.tag           = BulkColumns::to_ull(tags_[i]);
+        row.address       = addrs[i];
+        row.name          = BulkColumns::to_str(names_[i]);
+        row.symbol        = BulkColumns::to_str(symbols_[i]);
+        row.decimals      = BulkColumns::to_ull(decimals_[i]);
+        row.is_stablecoin = BulkColumns::to_bool(is_stablecoin_[i]);
+        row.hasFees       = BulkColumns::to_bool(hasFees_[i]);
+        row.feesPPM       = BulkColumns::to_long(feesPPM_[i]);
+    }
+    return BulkColumns::to_list(self.add_tokens_bulk(rows));
+}
+
+
+/**
+ * @brief Python binding of TheGraph::add_lps_bulk(), accepting columns
+ * @return list of rejected row indexes
+ */
+static list TheGraph_add_lps_bulk(TheGraph &self
+                                  , object tags
+                                  , object addresses
+                                  , object exchanges
+                                  , object tokens0
+                                  , object tokens1
+                                  , object hasFees
+                                  , object feesPPM)
+{
+    auto addrs = BulkColumns::addresses(addresses);
+    BulkColumns cols(addrs.size());
+    auto tags_      = cols.column(tags     , "tags");
+    auto exchanges_ = cols.column(exchanges, "exchanges");
+    auto tokens0_   = cols.column(tokens0  , "tokens0");
+    auto tokens1_   = cols.column(tokens1  , "tokens1");
+    auto hasFees_   = cols.column(hasFees  , "hasFees");
+    auto feesPPM_   = cols.column(feesPPM  , "feesPPM");
+
+    std::vector<LPBulkRow> rows(cols.rows);
+    for (std::size_t i = 0; i < cols.rows; ++i)
+    {
+        auto &row = rows[i];
+        row.tag      = BulkColumns::to_ull(tags_[i]);
+        row.address  = addrs[i];
+        row.exchange = BulkColumns::to_ull(exchanges_[i]);
+        row.token0   = BulkColumns::to_ull(tokens0_[i]);
+        row.token1   = BulkColumns::to_ull(tokens1_[i]);
+        row.hasFees  = BulkColumns::to_bool(hasFees_[i]);
+        row.feesPPM  = BulkColumns::to_long(feesPPM_[i]);
+    }
+    return BulkColumns::to_list(self.add_lps_bulk(rows));
+}
+
+
+static object balance_as_long(const balance_t &v)
+{
+    std::stringstream ss;
+    ss << v;
+    return object(handle<>(PyLong_FromString(ss.str().c_str(), nullptr, 0)));
+}
+
+/**
+ * @brief (reserve0, reserve1) of the pool in the given predicted snapshot
+ *        (the base ones if not predicted), or None if unknown
+ */
+static object LiquidityPool_get_predicted_reserves(const LiquidityPool &self, unsigned prediction_key)
+{
+    auto res = self.getReserves(prediction_key);
+    if (!std::get<0>(res))
+    {
+        return object();
+    }
+    return make_tuple(balance_as_long(std::get<1>(res)), balance_as_long(std::get<2>(res)));
+}
+
+
+/**
+ * @brief Python binding of TheGraph::apply_sync_logs()
+ *
+ * @p entries is a sequence of (address, data, blockNumber) tuples, as carried by Sync logs:
+ * address and data are 0x... hexstrings, blockNumber is an int, or None if unknown.
+ * The GIL is released while the batch is applied. Log events take it back (see log_emit_ll()).
+ *
+ * @return (updated, unknown): updated is a list of (reserve0, reserve1, blockNumber, pool tag) tuples,
+ *         unknown is the list of indexes of the entries of pools not in the graph.
+ */
+static tuple TheGraph_apply_sync_logs(TheGraph &self, object entries, unsigned prediction_key)
+{
+    object fast(handle<>(PySequence_Fast(entries.ptr(), "entries")));
+    auto count = static_cast<std::size_t>(PySequence_Fast_GET_SIZE(fast.ptr()));
+    auto items = PySequence_Fast_ITEMS(fast.ptr());
+
+    std::vector<SyncLogRow> rows(count);
+    for (std::size_t i = 0; i < count; ++i)
+    {
+        object entry(handle<>(borrowed(items[i])));
+        if (len(entry) != 3)
+        {
+            PyErr_SetString(PyExc_ValueError, "entries: expected (address, data, blockNumber) tuples");
+            throw_error_already_set();
+        }
+        auto &row = rows[i];
+        try {
+            row.address = address_t(BulkColumns::to_str(object(entry[0]).ptr()));
+        }
+        catch (std::runtime_error &) {
+            PyErr_Format(PyExc_ValueError, "entries[%zu]: invalid address", i);
+            throw_error_already_set();
+        }
+        row.data = BulkColumns::to_str(object(entry[1]).ptr());
+        object blocknr = entry[2];
+        row.block_number = blocknr.is_none() ? 0 : BulkColumns::to_ull(blocknr.ptr());
+    }
+
+    SyncLogsOutcome outcome;
+    {
+        struct release_gil {
+            PyThreadState *state = PyEval_SaveThread();
+            ~release_gil() { PyEval_RestoreThread(state); }
+        } unlocked;
+        outcome = self.apply_sync_logs(rows, prediction_key);
+    }
+
+    list updated;
+    for (auto &u: outcome.updated)
+    {
+        updated.append(make_tuple(balance_as_long(u.reserve0)
+                                  , balance_as_long(u.reserve1)
+                                  , rows[u.row].block_number
+                                  , u.lp->tag));
+    }
+    return make_tuple(updated, BulkColumns::to_list(outcome.unknown));
+}
+
+static tuple TheGraph_apply_sync_logs_1(TheGraph &self, object entries)
+{
+    return TheGraph_apply_sync_logs(self, entries, 0);
+}
+
+
+/**
+ * @brief Python binding of TheGraph::rollback_sync_logs()
+ * @return list of (reserve0, reserve1, blockNumber, pool tag) tuples, same as TheGraph_apply_sync_logs()
+ */
+static list TheGraph_rollback_sync_logs(TheGraph &self, std::uint64_t block_number)
+{
+    list res;
+    for (auto &u: self.rollback_sync_logs(block_number))
+    {
+        res.append(make_tuple(balance_as_long(u.reserve0)
+                              , balance_as_long(u.reserve1)
+                              , block_number - 1
+                              , u.lp->tag));
+    }
+    return res;
+}
+
+
+/**
+ * @brief Python binding of TheGraph::save_snapshot()
+ *
+ * The GIL is released while the file is written: the snapshot is saved periodically
+ * by a thread of its own, and the event loop keeps running meanwhile.
+ */
+static std::size_t TheGraph_save_snapshot(TheGraph &self, const char *path)
+{
+    struct release_gil {
+        PyThreadState *state = PyEval_SaveThread();
+        ~release_gil() { PyEval_RestoreThread(state); }
+    } unlocked;
+    return self.save_snapshot(path);
+}
+
+
+/**
+ * @brief Python binding of TheGraph::warmup_paths_crossing_lp()
+ *
+ * The GIL is released during the search, which is pure C++ (no fetch callbacks are involved):
+ * Python threads keep running while a background warmup is in progress. Log events take the GIL back
+ * (see log_emit_ll()).
+ */
+static std::size_t TheGraph_warmup_paths_crossing_lp(TheGraph &self
+                                                     , const LiquidityPool *lp
+                                                     , unsigned max_length
+                                                     , unsigned max_count)
+{
+    struct release_gil {
+        PyThreadState *state = PyEval_SaveThread();
+        ~release_gil() { PyEval_RestoreThread(state); }
+    } unlocked;
+    return self.warmup_paths_crossing_lp(lp, max_length, max_count);
+}
+
+
 /**
  * @brief Export C++ model to Python.
  *
@@ -227,13 +568,13 @@ BOOST_PYTHON_MODULE(bofh_model_ext)
             .def_readonly("token1"    , &LiquidityPool::token1)
             .def_readwrite("reserve0" , &LiquidityPool::reserve0)
             .def_readwrite("reserve1" , &LiquidityPool::reserve1)
-            .def("SwapTokensForExactTokens" , &LiquidityPool::SwapTokensForExactTokens)
-            .def("SwapExactTokensForTokens" , &LiquidityPool::SwapExactTokensForTokens)
-            .def("leave_predicted_state"    , &LiquidityPool::leave_predicted_state)
-            .def("get_predicted_state"      , &LiquidityPool::get_predicted_state, dont_manage_returned_pointer())
+            .def("SwapTokensForExactTokens" , static_cast<balance_t (LiquidityPool::*)(const Token *, const balance_t &) const>(&LiquidityPool::SwapTokensForExactTokens))
+            .def("SwapExactTokensForTokens" , static_cast<balance_t (LiquidityPool::*)(const Token *, const balance_t &) const>(&LiquidityPool::SwapExactTokensForTokens))
+            .def("get_predicted_reserves"   , &LiquidityPool_get_predicted_reserves)
             .def("set_predicted_reserves"   , &LiquidityPool::set_predicted_reserves)
-            .def("setReserves"              , &LiquidityPool::setReserves)
-            .def("getReserve"               , &LiquidityPool::getReserve)
+            .def("setReserves"              , static_cast<void (LiquidityPool::*)(const balance_t &, const balance_t &)>(&LiquidityPool::setReserves))
+            .def("setReservesRaw"           , &LiquidityPool_setReservesRaw)
+            .def("getReserve"               , static_cast<const balance_t (LiquidityPool::*)(const Token *) const noexcept>(&LiquidityPool::getReserve))
             .def("get_name"                 , &LiquidityPool::get_name)
             .def("feesPPM"                  , &LiquidityPool::feesPPM)
             .def("set_feesPPM"              , &LiquidityPool::feesPPM)
@@ -262,6 +603,7 @@ BOOST_PYTHON_MODULE(bofh_model_ext)
             .def("evaluate"             , &Path::evaluate)
             .def("evaluate_max_yield"   , &Path::evaluate_max_yield)
             .def("is_cross_exchange"    , &Path::is_cross_exchange)
+            .def("all_pools_ready"      , &Path::all_pools_ready)
             .def(self_ns::repr(self_ns::self))
             .def(self_ns::str(self_ns::self))
             ;
@@ -330,6 +672,11 @@ BOOST_PYTHON_MODULE(bofh_model_ext)
             .def("add_exchange"                , &TheGraph::add_exchange         , dont_manage_returned_pointer())
             .def("add_token"                   , &TheGraph::add_token            , dont_manage_returned_pointer())
             .def("add_lp"                      , &TheGraph::add_lp               , dont_manage_returned_pointer())
+            .def("add_tokens_bulk"             , &TheGraph_add_tokens_bulk       )
+            .def("add_lps_bulk"                , &TheGraph_add_lps_bulk          )
+            .def("apply_sync_logs"             , &TheGraph_apply_sync_logs       )
+            .def("apply_sync_logs"             , &TheGraph_apply_sync_logs_1     )
+            .def("rollback_sync_logs"          , &TheGraph_rollback_sync_logs    )
             .def("lookup_exchange"             , static_cast<const Exchange      *(TheGraph::*)(datatag_t              )>(&TheGraph::lookup_exchange)  , dont_manage_returned_pointer())
             .def("lookup_exchange"             , static_cast<const Exchange      *(TheGraph::*)(datatag_t, bool        )>(&TheGraph::lookup_exchange)  , dont_manage_returned_pointer())
             .def("lookup_token"                , static_cast<const Token         *(TheGraph::*)(const char *           )>(&TheGraph::lookup_token)     , dont_manage_returned_pointer())
@@ -352,6 +699,7 @@ BOOST_PYTHON_MODULE(bofh_model_ext)
             .def("add_path"                    , static_cast<const Path          *(TheGraph::*)(datatag_t, datatag_t, datatag_t, datatag_t)>(&TheGraph::add_path)                                                , dont_manage_returned_pointer())
             .def("find_paths_to_token"         , &TheGraph::find_paths_to_token         )
             .def("find_paths_crossing_lp"      , &TheGraph::find_paths_crossing_lp      )
+            .def("warmup_paths_crossing_lp"    , &TheGraph_warmup_paths_crossing_lp     )
 //          .def("calculate_paths"             , &TheGraph::calculate_paths             )
             .def("clear_paths"                 , &TheGraph::clear_paths                 )
             .def("debug_evaluate_known_paths"  , &TheGraph::debug_evaluate_known_paths  )
@@ -377,7 +725,15 @@ BOOST_PYTHON_MODULE(bofh_model_ext)
             .def("has_token"   , static_cast<bool (TheGraph::*)(datatag_t   ) const>(&TheGraph::has_token))
             .def("has_lp"      , static_cast<bool (TheGraph::*)(const char *) const>(&TheGraph::has_lp))
             .def("has_lp"      , static_cast<bool (TheGraph::*)(datatag_t   ) const>(&TheGraph::has_lp))
+            .def("save_snapshot"               , &TheGraph_save_snapshot                )
+            .def("load_snapshot"               , &TheGraph::load_snapshot               )
+            .def("save_paths_index"            , &TheGraph::save_paths_index            )
+            .def("load_paths_index"            , &TheGraph::load_paths_index            )
+            .def_readwrite("reserves_block_number", &TheGraph::reserves_block_number    )
+            .def_readwrite("only_ready_paths"     , &TheGraph::only_ready_paths         )
+            .def_readwrite("sync_undo_depth"      , &TheGraph::sync_undo_depth          )
             ;
+    def("read_graph_snapshot_block_number", read_graph_snapshot_block_number);
 
     enum_<log_level>("log_level")
             .value("trace"  , log_level_trace  )
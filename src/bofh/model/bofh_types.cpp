@@ -11,6 +11,13 @@ namespace model {
 address_t::address_t() : bignum::uint160_t(0) {}
 address_t::address_t(const char *hexstring) : bignum::uint160_t(hexstring) {}
 
+address_t address_t::from_bytes(const unsigned char *buf)
+{
+    address_t res;
+    boost::multiprecision::import_bits(static_cast<base_type &>(res), buf, buf+size_bytes);
+    return res;
+}
+
 
 struct addr_as_string {
     char buf[address_t::nibs+1] = {0};
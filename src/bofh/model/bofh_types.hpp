@@ -51,6 +51,12 @@ struct address_t: bignum::uint160_t
     using bignum::uint160_t::uint160_t;
     address_t();
     address_t(const char *hexstring);        ///< constructible via 0x... hexstring
+
+    static constexpr unsigned size_bytes = size_bits / 8;
+    /**
+     * @brief build from raw on-chain representation (20 bytes, big endian)
+     */
+    static address_t from_bytes(const unsigned char *buf);
 };
 
 inline bool operator==(const address_t &a, const address_t &b)
@@ -303,6 +303,18 @@ bool Path::check_consistency(bool no_except) const
 }
 
 
+bool Path::all_pools_ready() const
+{
+    for (unsigned i = 0; i < size(); ++i)
+    {
+        if (!get(i)->pool->reserves_set)
+        {
+            return false;
+        }
+    }
+    return true;
+}
+
 bool Path::is_cross_exchange() const
 {
     auto addr0 = get(0)->pool->exchange->address;
@@ -352,14 +364,6 @@ PathResult Path::evaluate(const PathEvalutionConstraints &c
             auto swap = get(i);
             assert(swap != nullptr);
             auto pool = swap->pool;
-            if (prediction_snapshot_key)
-            {
-                auto ppool = pool->get_predicted_state(prediction_snapshot_key);
-                if (ppool)
-                {
-                    pool = ppool;
-                }
-            }
             assert(pool != nullptr);
             assert(swap->tokenSrc != nullptr);
 
@@ -367,7 +371,7 @@ PathResult Path::evaluate(const PathEvalutionConstraints &c
             current_balance = swap->tokenSrc->transferResult(current_balance);
             result.set_measured_balance_before_step(i, current_balance);
 
-            auto reserves = pool->getReserves();
+            auto reserves = pool->getReserves(prediction_snapshot_key);
             auto has_reserves = std::get<0>(reserves);
             if (!has_reserves)
             {
@@ -382,7 +386,8 @@ PathResult Path::evaluate(const PathEvalutionConstraints &c
 
             current_balance =
                     pool->SwapExactTokensForTokens(swap->tokenSrc
-                                                   , current_balance);
+                                                   , current_balance
+                                                   , prediction_snapshot_key);
             result.set_issued_balance_after_step(i, current_balance);
             if (i == size()-1)
             {
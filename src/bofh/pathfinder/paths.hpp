@@ -172,6 +172,14 @@ struct Path: std::array<const OperableSwap *, MAX_PATHS>
     bool check_consistency(bool no_except=false) const;
     bool is_cross_exchange() const;
 
+    /**
+     * @brief true if the reserves of all the crossed pools are known
+     *
+     * @note unlike LiquidityPool::getReserves(), this never invokes the
+     *       reserves fetch callback
+     */
+    bool all_pools_ready() const;
+
     PathResult evaluate(const PathEvalutionConstraints &
                         , unsigned prediction_snapshot_key) const;
     PathResult evaluate_max_yield(const PathEvalutionConstraints &
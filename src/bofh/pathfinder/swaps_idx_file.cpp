@@ -0,0 +1,321 @@
+#include "swaps_idx_file.hpp"
+#include "swaps_idx.hpp"
+#include "paths.hpp"
+#include "../model/bofh_model.hpp"
+#include "../model/bofh_entity_idx.hpp"
+#include "../commons/bofh_log.hpp"
+#include <boost/interprocess/file_mapping.hpp>
+#include <boost/interprocess/mapped_region.hpp>
+#include <boost/functional/hash.hpp>
+#include <algorithm>
+#include <fstream>
+#include <cstring>
+#include <unordered_map>
+#include <vector>
+
+
+namespace bofh {
+namespace pathfinder {
+namespace idx {
+
+using model::TheGraph;
+using model::LiquidityPool;
+using model::Token;
+using model::datatag_t;
+
+namespace {
+// FIY: an unnamed namespace makes its content private to this code unit
+
+struct Writer {
+    std::ofstream out;
+
+    explicit Writer(const char *path)
+        : out(path, std::ios::binary | std::ios::trunc)
+    {
+        if (!out)
+        {
+            throw std::runtime_error(strfmt("unable to open paths index file for writing: %1%", path));
+        }
+    }
+
+    template<typename T> void pod(const T &v)
+    {
+        out.write(reinterpret_cast<const char *>(&v), sizeof(v));
+    }
+};
+
+
+struct Reader {
+    const char *ptr;
+    const char *end;
+
+    template<typename T> T pod()
+    {
+        if (static_cast<std::size_t>(end - ptr) < sizeof(T))
+        {
+            throw std::runtime_error("paths index file is truncated");
+        }
+        T v;
+        std::memcpy(&v, ptr, sizeof(T));
+        ptr += sizeof(T);
+        return v;
+    }
+};
+
+
+struct SavedPath {
+    std::uint64_t initial_token_tag;
+    std::uint8_t size;
+    std::uint64_t pools[MAX_PATHS];
+};
+
+
+struct SavedEntry {
+    std::uint64_t lp_tag;
+    std::vector<std::uint32_t> paths;
+};
+
+
+std::vector<const LiquidityPool *> m_graph_pools(const TheGraph *graph)
+{
+    std::vector<const LiquidityPool *> res;
+    for (auto e: *graph->entity_index)
+    {
+        if (e->type == model::TYPE_LP)
+        {
+            res.emplace_back(reinterpret_cast<const LiquidityPool *>(e));
+        }
+    }
+    std::sort(res.begin(), res.end(), [](auto a, auto b) { return a->tag < b->tag; });
+    return res;
+}
+
+}; // unnamed namespace
+
+
+std::uint64_t topology_fingerprint(const TheGraph *graph)
+{
+    assert(graph != nullptr);
+    std::size_t seed = 0;
+    for (auto lp: m_graph_pools(graph))
+    {
+        boost::hash_combine(seed, lp->tag);
+        boost::hash_combine(seed, lp->token0->tag);
+        boost::hash_combine(seed, lp->token1->tag);
+    }
+    return seed;
+}
+
+
+std::size_t save_paths_index(const TheGraph *graph, const char *path)
+{
+    assert(graph != nullptr);
+    if (graph->m_start_token == nullptr)
+    {
+        throw std::runtime_error("start_token is not set");
+    }
+    const auto &index = *graph->paths_index;
+
+    // paths are referenced by their ordinal in the file by the lp entries
+    std::unordered_map<const Path *, std::uint32_t> ordinals;
+    std::vector<const Path *> paths;
+    for (auto i: index.path_idx)
+    {
+        ordinals.emplace(i.second, paths.size());
+        paths.emplace_back(i.second);
+    }
+    std::unordered_map<const LiquidityPool *, std::vector<std::uint32_t>> entries;
+    for (auto i: index.path_by_lp_idx)
+    {
+        auto o = ordinals.find(i.second);
+        if (o != ordinals.end())
+        {
+            entries[i.first].emplace_back(o->second);
+        }
+    }
+
+    Writer w(path);
+    paths_index_header_t hdr;
+    std::memset(&hdr, 0, sizeof(hdr));
+    std::memcpy(hdr.magic, PATHS_INDEX_MAGIC, sizeof(hdr.magic));
+    hdr.version = PATHS_INDEX_VERSION;
+    hdr.start_token_tag = graph->m_start_token->tag;
+    hdr.topology_fingerprint = topology_fingerprint(graph);
+    hdr.paths_count = paths.size();
+    hdr.entries_count = entries.size();
+    w.pod(hdr);
+
+    for (auto p: paths)
+    {
+        w.pod(static_cast<std::uint8_t>(p->size()));
+        w.pod(static_cast<std::uint64_t>(p->get(0)->tokenSrc->tag));
+        for (unsigned i = 0; i < p->size(); ++i)
+        {
+            w.pod(static_cast<std::uint64_t>(p->get(i)->pool->tag));
+        }
+    }
+
+    for (auto &e: entries)
+    {
+        w.pod(static_cast<std::uint64_t>(e.first->tag));
+        w.pod(static_cast<std::uint32_t>(e.second.size()));
+        for (auto ordinal: e.second)
+        {
+            w.pod(ordinal);
+        }
+    }
+
+    w.out.flush();
+    if (!w.out)
+    {
+        throw std::runtime_error(strfmt("error while writing paths index file: %1%", path));
+    }
+
+    log_info("paths index saved to %1%: %2% paths, %3% lp entries"
+             , path, paths.size(), entries.size());
+    return paths.size();
+}
+
+
+PathsIndexLoadResult load_paths_index(TheGraph *graph, const char *path)
+{
+    using namespace boost::interprocess;
+    assert(graph != nullptr);
+    PathsIndexLoadResult res;
+    if (graph->m_start_token == nullptr)
+    {
+        throw std::runtime_error("start_token is not set");
+    }
+
+    file_mapping fm(path, read_only);
+    mapped_region region(fm, read_only);
+    const auto begin = static_cast<const char *>(region.get_address());
+    Reader r{begin, begin + region.get_size()};
+
+    auto hdr = r.pod<paths_index_header_t>();
+    if (std::memcmp(hdr.magic, PATHS_INDEX_MAGIC, sizeof(hdr.magic)) != 0)
+    {
+        throw std::runtime_error("not a paths index file (bad magic)");
+    }
+    if (hdr.version != PATHS_INDEX_VERSION)
+    {
+        throw std::runtime_error(strfmt("unsupported paths index version %1% (expected %2%)"
+                                        , hdr.version, PATHS_INDEX_VERSION));
+    }
+    if (hdr.start_token_tag != graph->m_start_token->tag)
+    {
+        log_info("paths index %1% was built for another start token (tag %2%), ignored"
+                 , path, hdr.start_token_tag);
+        return res;
+    }
+
+    if (hdr.topology_fingerprint != topology_fingerprint(graph))
+    {
+        // any pool added since the save may open new paths across any lp entry
+        // (the start token's included): the whole index is stale
+        log_info("paths index %1% was built on another graph topology, ignored"
+                 , path);
+        res.dropped_paths = hdr.paths_count;
+        res.dropped_lps = hdr.entries_count;
+        return res;
+    }
+
+    // the whole file is parsed before touching the index,
+    // so that a truncated file does not leave it half-loaded.
+    std::vector<SavedPath> saved_paths(hdr.paths_count);
+    for (auto &sp: saved_paths)
+    {
+        sp.size = r.pod<std::uint8_t>();
+        if (sp.size < MIN_PATHS || sp.size > MAX_PATHS)
+        {
+            throw std::runtime_error("paths index file is corrupted (bad path length)");
+        }
+        sp.initial_token_tag = r.pod<std::uint64_t>();
+        for (unsigned i = 0; i < sp.size; ++i)
+        {
+            sp.pools[i] = r.pod<std::uint64_t>();
+        }
+    }
+    std::vector<SavedEntry> saved_entries(hdr.entries_count);
+    for (auto &se: saved_entries)
+    {
+        se.lp_tag = r.pod<std::uint64_t>();
+        se.paths.resize(r.pod<std::uint32_t>());
+        for (auto &ordinal: se.paths)
+        {
+            ordinal = r.pod<std::uint32_t>();
+            if (ordinal >= saved_paths.size())
+            {
+                throw std::runtime_error("paths index file is corrupted (bad path ordinal)");
+            }
+        }
+    }
+
+    auto &index = *graph->paths_index;
+    std::vector<const Path *> loaded(saved_paths.size(), nullptr);
+    for (std::size_t n = 0; n < saved_paths.size(); ++n)
+    {
+        const auto &sp = saved_paths[n];
+        auto token = graph->entity_index->lookup<Token, model::TYPE_TOKEN>(sp.initial_token_tag);
+        const LiquidityPool *pools[MAX_PATHS];
+        bool ok = token != nullptr;
+        for (unsigned i = 0; ok && i < sp.size; ++i)
+        {
+            pools[i] = graph->entity_index->lookup<LiquidityPool, model::TYPE_LP>(sp.pools[i]);
+            ok = pools[i] != nullptr;
+        }
+        if (!ok)
+        {
+            res.dropped_paths++;
+            continue;
+        }
+        const Path *p;
+        try {
+            p = new Path(token, pools, sp.size);
+        }
+        catch (PathConsistencyError &) {
+            res.dropped_paths++;
+            continue;
+        }
+        auto feedback = index.add_path(p);
+        if (!feedback.added)
+        {
+            delete p;
+        }
+        else {
+            res.paths++;
+        }
+        loaded[n] = feedback.path;
+    }
+
+    for (const auto &se: saved_entries)
+    {
+        auto lp = graph->entity_index->lookup<LiquidityPool, model::TYPE_LP>(se.lp_tag);
+        if (lp == nullptr)
+        {
+            res.dropped_lps++;
+            continue;
+        }
+        if (index.has_paths_for(lp))
+        {
+            // already discovered during this session
+            continue;
+        }
+        for (auto ordinal: se.paths)
+        {
+            if (loaded[ordinal] == nullptr) continue;
+            index.connect_path_to_lp(loaded[ordinal], lp);
+            res.entries++;
+        }
+    }
+
+    log_info("paths index loaded from %1%: %2% paths, %3% lp -> path entries, "
+             "%4% paths dropped, %5% lp entries invalidated"
+             , path, res.paths, res.entries, res.dropped_paths, res.dropped_lps);
+    return res;
+}
+
+
+} // namespace idx
+} // namespace pathfinder
+} // namespace bofh
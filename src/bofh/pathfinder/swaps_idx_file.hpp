@@ -0,0 +1,87 @@
+/**
+ * @file swaps_idx_file.hpp
+ * @brief Binary dump and reload of the SwapPathsIndex
+ *
+ * SwapPathsIndex is filled lazily: every pool touched by a prediction
+ * round triggers an AllPathsCrossingPool search the first time it's seen.
+ * That's the slow part of the first rounds after every restart.
+ *
+ * The index file stores the known paths as sequences of pool tags, plus
+ * the lp -> paths entries, so that they can be rebuilt on the next start
+ * without running the finders again.
+ *
+ * The file is bound to the start token it was built for, and to the graph
+ * topology (the pools and the tokens they connect) it was built on, by its
+ * fingerprint. The whole file is ignored if either changed: any pool added
+ * since the save may open new paths across any lp entry, and the paths
+ * are recomputed lazily, as on a cold start.
+ *
+ * File layout (all integers are little endian):
+ *
+ *  - paths_index_header_t
+ *  - paths_count   x { length, initial token tag, length x { pool tag } }
+ *  - entries_count x { pool tag, count, count x { path ordinal } }
+ */
+
+#pragma once
+
+#include "swaps_idx_fwd.hpp"
+#include <bofh/model/bofh_model_fwd.hpp>
+#include <cstdint>
+#include <cstddef>
+
+namespace bofh {
+namespace pathfinder {
+namespace idx {
+
+constexpr char          PATHS_INDEX_MAGIC[8] = {'B', 'O', 'F', 'H', 'P', 'I', 'D', 'X'};
+constexpr std::uint32_t PATHS_INDEX_VERSION  = 2;
+
+struct paths_index_header_t {
+    char          magic[8];
+    std::uint32_t version;
+    std::uint32_t reserved;
+    std::uint64_t start_token_tag;
+    std::uint64_t topology_fingerprint;
+    std::uint64_t paths_count;
+    std::uint64_t entries_count;
+};
+
+
+/**
+ * @brief outcome of a paths index load
+ */
+struct PathsIndexLoadResult {
+    std::size_t paths = 0;          ///< number of paths added to the index
+    std::size_t entries = 0;        ///< number of lp -> path connections restored
+    std::size_t dropped_paths = 0;  ///< paths crossing pools which are not in the graph anymore
+    std::size_t dropped_lps = 0;    ///< lp entries dropped (all of them on topology changes)
+};
+
+
+/**
+ * @brief fingerprint of the graph topology (pools and the tokens they connect)
+ */
+std::uint64_t topology_fingerprint(const model::TheGraph *graph);
+
+/**
+ * @brief dump the paths index of @p graph to the file at @p path
+ * @return number of written paths
+ * @throws std::runtime_error on I/O failure, or if the start token is not set
+ */
+std::size_t save_paths_index(const model::TheGraph *graph, const char *path);
+
+/**
+ * @brief reload the paths index of @p graph from the file at @p path
+ *
+ * Nothing is loaded if the file was saved for another start token, or on
+ * another graph topology.
+ *
+ * @throws std::runtime_error on I/O failure, bad magic, version mismatch or truncated file
+ */
+PathsIndexLoadResult load_paths_index(model::TheGraph *graph, const char *path);
+
+
+} // namespace idx
+} // namespace pathfinder
+} // namespace bofh
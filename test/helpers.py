@@ -0,0 +1,107 @@
+"""Entities and stand-ins shared by the tests"""
+
+from asyncio import sleep
+from contextlib import contextmanager
+from time import monotonic
+
+from bofh_model_ext import TheGraph, log_register_sink
+
+
+EXCHANGE = "0x493631F57d1FD97FBA82E9613E832914c0144622"
+CAKE = "0x0e09fabb73bd3ade0a17ecc321fd13a19e81ce82"
+BUSD = "0xe9e7cea3dedca5984780bafc599bd69add087d56"
+WBNB = "0xae13d989daC2f0dEbFf460aC112a837C89BAa7cd"
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+
+# tag -> (address, name, symbol, is_stablecoin)
+TOKENS = {1: (CAKE, "PancakeSwap Token", "Cake", False)
+          , 2: (BUSD, "BUSD Token", "BUSD", True)
+          , 3: (WBNB, "Wrapped-BNB", "WBNB", False)
+          , 4: (USDT, "Tether USD", "USDT", True)}
+
+# tag -> address
+POOLS = {1: "0xb51e4d3F60c8453AdCa52797F9FA1481A6E13A7A"
+         , 2: "0x54a2028b7A59C6e8e62852CAE8D38f7958851F7c"
+         , 3: "0xDD4bDb1e31c6A5Edb0E96E61A05E2664bCDe578A"
+         , 4: "0x16b9a82891338f9bA80E2D6970FddA79D1eb0daE"
+         , 5: "0x7EFaEf62fDdCCa950418312c6C91Aef321375A00"
+         , 6: "0x0eD7e52944161450477ee417DE9Cd3a859b14fD0"}
+
+# tag -> (token0 tag, token1 tag), of all the POOLS
+PAIRS = {1: (3, 2), 2: (2, 1), 3: (1, 3), 4: (4, 3), 5: (4, 2), 6: (1, 3)}
+
+
+def make_graph(pools, start_token=None, token_fees=None, pool_fees=None):
+    """A graph of one exchange, with the given pools as {tag: (token0 tag, token1 tag)}, and their tokens.
+
+       token_fees and pool_fees are {tag: feesPPM}, of the tokens and pools with fees of their own"""
+    token_fees = token_fees or {}
+    pool_fees = pool_fees or {}
+    graph = TheGraph()
+    graph.add_exchange(1, EXCHANGE, "TestExchange", 2500)
+    for tag in sorted(set(tag for pair in pools.values() for tag in pair)):
+        address, name, symbol, is_stablecoin = TOKENS[tag]
+        graph.add_token(tag, address, name, symbol, 18, is_stablecoin, tag in token_fees, token_fees.get(tag, 0))
+    for tag in sorted(pools):
+        token0, token1 = pools[tag]
+        graph.add_lp(tag, POOLS[tag], 1, token0, token1, tag in pool_fees, pool_fees.get(tag, 0))
+    if start_token is not None:
+        graph.set_start_token(graph.lookup_token(start_token, False))
+    return graph
+
+
+@contextmanager
+def log_events():
+    """Collect the (level, message) log events of the model, as a registered log sink"""
+    events = []
+    log_register_sink(lambda lvl, msg: events.append((lvl, msg)))
+    try:
+        yield events
+    finally:
+        log_register_sink(lambda lvl, msg: None)
+
+
+def sync_data(reserve0, reserve1):
+    """data of a Sync log"""
+    return "0x" + reserve0.to_bytes(32, "big").hex() + reserve1.to_bytes(32, "big").hex()
+
+
+def make_chain(block_number=100, seed=1):
+    """A FakeChain (see bofh.model.fake_node) of all the POOLS, with some reserves"""
+    from bofh.model.fake_node import FakeChain
+    tokens = {address.lower(): (name, symbol, 18) for address, name, symbol, _ in TOKENS.values()}
+    pools = {POOLS[tag].lower(): [TOKENS[token0][0].lower(), TOKENS[token1][0].lower(), 10**21 * tag, 10**23 * tag]
+             for tag, (token0, token1) in PAIRS.items()}
+    return FakeChain(tokens=tokens, pools=pools, block_number=block_number, seed=seed)
+
+
+class RecordingDB:
+    """Stand-in of the status and attacks DBs behind the write-behind queues: records the written batches"""
+
+    def __init__(self, max_id=0):
+        self.batches = []
+        self.reserves_block_number = 0
+        self.max_id = max_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def update_pool_reserves_batch(self, tuples):
+        self.batches.append(sorted(tuples, key=lambda t: t[3]))
+
+    def max_attack_id(self):
+        return self.max_id
+
+    def add_attacks_batch(self, records):
+        self.batches.append([(r.tag, r.origin) for r in records])
+
+
+async def until(cond, timeout=5):
+    """Wait for cond() to hold, for timeout secs at most"""
+    deadline = monotonic() + timeout
+    while not cond():
+        assert monotonic() < deadline, "timed out"
+        await sleep(0.01)
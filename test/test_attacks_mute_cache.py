@@ -0,0 +1,38 @@
+from time import time
+
+from bofh.model.modules.attacks_mute_cache import AttacksMuteCache
+
+
+def test_deadline():
+    cache = AttacksMuteCache(deadline=10)
+    cache.add(1, ts=100)
+    assert cache.is_muted(1, now=105)
+    assert not cache.is_muted(2, now=105)
+    assert not cache.is_muted(1, now=111)
+    assert len(cache) == 0
+
+
+def test_size_bound():
+    cache = AttacksMuteCache(deadline=3600, max_size=2)
+    for path_id in (1, 2, 3):
+        cache.add(path_id)
+    assert 1 not in cache
+    assert 2 in cache and 3 in cache
+    # recording again moves an entry to the back
+    cache.add(2)
+    cache.add(4)
+    assert 3 not in cache
+    assert 2 in cache and 4 in cache
+
+
+def test_preload():
+    cache = AttacksMuteCache(deadline=10, max_size=2)
+    now = time()
+    cache.preload([("1", now - 100), ("2", now - 3), ("3", now - 2), ("4", now - 1)])
+    assert sorted(cache.entries) == [3, 4]
+
+
+if __name__ == '__main__':
+    test_deadline()
+    test_size_bound()
+    test_preload()
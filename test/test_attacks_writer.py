@@ -0,0 +1,137 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from bofh.model.modules.attacks_writer import AttacksWriteBehind
+
+from helpers import RecordingDB
+
+
+class AttackPlan:
+    tag = None
+
+
+class Entity:
+    def __init__(self, tag, address):
+        self.tag = tag
+        self.address = address
+
+    def feesPPM(self):
+        return 2500
+
+
+class Swap:
+    def __init__(self, pool, tokenSrc, tokenDest):
+        self.pool = pool
+        self.tokenSrc = tokenSrc
+        self.tokenDest = tokenDest
+
+
+class Path(list):
+    def size(self):
+        return len(self)
+
+    def get(self, i):
+        return self[i]
+
+
+class FullAttackPlan(AttackPlan):
+    """The PathResult methods used to record an attack"""
+
+    def __init__(self, path_id):
+        wbnb = Entity(1, "0xAE13d989daC2f0dEbFf460aC112a837C89BAa7cd")
+        busd = Entity(2, "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56")
+        self.path_id = path_id
+        self.path = Path([Swap(Entity(10, "0x58F876857a02D6762E0101bb5C46A8c1ED44Dc16"), wbnb, busd)
+                          , Swap(Entity(11, "0x7EFaEf62fDdCCa950418312c6C91Aef321375A00"), busd, wbnb)])
+
+    def id(self):
+        return self.path_id
+
+    def initial_balance(self):
+        return 1000
+
+    def final_balance(self):
+        return 1010
+
+    def yield_ratio(self):
+        return 1.01
+
+    def get_calldata(self, deflationary):
+        return "0x1234"
+
+    def get_description(self):
+        return "WBNB -> BUSD -> WBNB"
+
+    def pool_reserve(self, i, n):
+        return 10 ** 6 + i + n
+
+    def issued_balance_before_step(self, i):
+        return 1000 + i
+
+    def measured_balance_after_step(self, i):
+        return 1005 + i
+
+
+def test_ids_and_batches():
+    db = RecordingDB(max_id=41)
+    writer = AttacksWriteBehind(db)
+    assert not writer.due()
+    plans = [AttackPlan() for _ in range(3)]
+    assert writer.add(plans[0], origin="pred") == 42
+    assert writer.add(plans[1], origin="pred") == 43
+    assert [p.tag for p in plans[:2]] == [42, 43]
+    assert writer.due()
+    assert writer.flush() == 2
+    assert not writer.due()
+    writer.add(plans[2], origin="scan")
+    assert writer.flush() == 1
+    assert writer.flush() == 0
+    assert db.batches == [[(42, "pred"), (43, "pred")], [(44, "scan")]]
+    assert writer.written_ctr == 3
+
+
+def test_failed_flush_is_retried():
+    db = RecordingDB()
+    writer = AttacksWriteBehind(db)
+    writer.add(AttackPlan(), origin="pred")
+    db.add_attacks_batch = lambda records: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        writer.flush()
+    writer.add(AttackPlan(), origin="scan")
+    del db.add_attacks_batch
+    assert writer.flush() == 2
+    assert db.batches == [[(1, "pred"), (2, "scan")]]
+
+
+def test_sqlite_attacks_db():
+    database = pytest.importorskip("bofh.model.database")
+    with TemporaryDirectory() as tmpdir:
+        db = database.ModelDB(schema_name="attacks"
+                              , cursor_factory=database.StatusScopedCursor
+                              , db_dsn="sqlite3://" + join(tmpdir, "attacks.db"))
+        db.open_and_priming()
+        with db as curs:
+            curs.add_attack(FullAttackPlan(1234), origin="pred")
+        writer = AttacksWriteBehind(db)
+        plans = [FullAttackPlan(5678), FullAttackPlan(9012)]
+        tags = [writer.add(plan, origin="pred", origin_tx="0xabcd", contract_address=plan.path[0].pool.address)
+                for plan in plans]
+        assert tags == [2, 3]
+        assert writer.flush() == 2
+        with db as curs:
+            attack = curs.get_attack(3)
+            assert attack.path_id == 9012
+            assert attack.origin_tx == "0xabcd"
+            assert attack.contract == plans[1].path[0].pool.address.lower()
+            assert (attack.amountIn, attack.amountOut) == (1000, 1010)
+            assert [(s.pool_id, s.reserve0, s.amountIn, s.amountOut) for s in attack.steps] == \
+                   [(10, 10 ** 6, 1000, 1005), (11, 10 ** 6 + 1, 1001, 1006)]
+            assert curs.max_attack_id() == 3
+
+
+if __name__ == '__main__':
+    test_ids_and_batches()
+    test_failed_flush_is_retried()
+    test_sqlite_attacks_db()
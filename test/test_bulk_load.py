@@ -0,0 +1,73 @@
+from bofh_model_ext import *
+
+
+def pack_addresses(addresses):
+    return b''.join(bytes.fromhex(a[2:]) for a in addresses)
+
+
+def test_add_tokens_bulk():
+    graph = TheGraph()
+    addresses = ["0x0e09fabb73bd3ade0a17ecc321fd13a19e81ce82"
+        , "0xe9e7cea3dedca5984780bafc599bd69add087d56"
+        , "0xae13d989daC2f0dEbFf460aC112a837C89BAa7cd"
+        , "0x0e09fabb73bd3ade0a17ecc321fd13a19e81ce82"]
+    rejected = graph.add_tokens_bulk([1, 2, 3, 4]
+                                     , pack_addresses(addresses)
+                                     , ["PancakeSwap Token", "BUSD Token", "Wrapped-BNB", "Dup"]
+                                     , ["Cake", "BUSD", "WBNB", "DUP"]
+                                     , [18, 18, 18, 18]
+                                     , [False, True, False, False]
+                                     , [False, False, True, False]
+                                     , [0, 0, 1000, 0])
+    assert rejected == [3]
+    assert graph.tokens_count() == 3
+    wbnb = graph.lookup_token(addresses[2], False)
+    assert wbnb.tag == 3
+    assert wbnb.symbol == "WBNB"
+    assert wbnb.hasFees() and wbnb.feesPPM() == 1000
+    assert graph.lookup_token(2, False).is_stable
+
+
+def test_add_lps_bulk():
+    graph = TheGraph()
+    graph.add_exchange(1, "0x493631F57d1FD97FBA82E9613E832914c0144622", "TestExchange", 2500)
+    graph.add_token(1, "0x0e09fabb73bd3ade0a17ecc321fd13a19e81ce82", "PancakeSwap Token", "Cake", 18, False, False, 0)
+    graph.add_token(2, "0xe9e7cea3dedca5984780bafc599bd69add087d56", "BUSD Token", "BUSD", 18, True, False, 0)
+    addresses = ["0xb51e4d3F60c8453AdCa52797F9FA1481A6E13A7A"
+        , "0x54a2028b7A59C6e8e62852CAE8D38f7958851F7c"
+        , "0xDD4bDb1e31c6A5Edb0E96E61A05E2664bCDe578A"]
+    rejected = graph.add_lps_bulk([1, 2, 3]
+                                  , pack_addresses(addresses)
+                                  , [1, 1, 2]
+                                  , [1, 2, 1]
+                                  , [2, 1, 2]
+                                  , [False, True, False]
+                                  , [0, 2000, 0])
+    assert rejected == [2]  # unknown exchange
+    assert graph.pools_count() == 2
+    p1 = graph.lookup_lp(addresses[1], False)
+    assert p1.tag == 2
+    assert p1.feesPPM() == 2000
+    assert graph.lookup_lp(1, False).feesPPM() == 2500
+
+
+def test_bulk_rejects_bad_columns():
+    graph = TheGraph()
+    try:
+        graph.add_lps_bulk([1, 2], b'\x00' * 20, [1], [1], [2], [False], [0])
+    except ValueError:
+        pass
+    else:
+        assert False, "column length mismatch not detected"
+    try:
+        graph.add_lps_bulk([1], b'\x00' * 19, [1], [1], [2], [False], [0])
+    except ValueError:
+        pass
+    else:
+        assert False, "bad address blob not detected"
+
+
+if __name__ == '__main__':
+    test_add_tokens_bulk()
+    test_add_lps_bulk()
+    test_bulk_rejects_bad_columns()
@@ -0,0 +1,80 @@
+from asyncio import run
+
+import pytest
+
+fake_node = pytest.importorskip("bofh.model.fake_node")
+
+from aiohttp import ClientSession
+from jsonrpc_base import ProtocolError
+from jsonrpc_websocket import Server
+
+from helpers import make_chain, until, POOLS, TOKENS
+
+
+async def post(node, payload):
+    async with ClientSession() as session:
+        async with session.post(node.url, json=payload) as response:
+            return await response.json()
+
+
+def rpc(method, *params, id=1):
+    return {"jsonrpc": "2.0", "id": id, "method": method, "params": list(params)}
+
+
+def test_json_rpc_over_http():
+    async def scenario():
+        node = fake_node.FakeNode(make_chain(), sync_rate=0)
+        await node.start(port=0)
+        try:
+            res = await post(node, rpc("eth_blockNumber"))
+            assert res["result"] == hex(100)
+
+            pool = POOLS[1].lower()
+            batch = await post(node, [rpc("eth_call", {"to": pool, "data": "0x" + fake_node.MID_GET_RESERVES.hex()}, id=1)
+                                      , rpc("eth_call", {"to": pool, "data": "0x" + fake_node.MID_TOKEN0.hex()}, id=2)
+                                      , rpc("eth_noSuchMethod", id=3)])
+            assert [r["id"] for r in batch] == [1, 2, 3]
+            data = bytes.fromhex(batch[0]["result"][2:])
+            assert int.from_bytes(data[:32], "big") == 10**21
+            assert int.from_bytes(data[32:64], "big") == 10**23
+            assert batch[1]["result"] == "0x" + TOKENS[3][0][2:].lower().rjust(64, "0")
+            assert batch[2]["error"]["code"] == -32601
+
+            node.error_rate = 1
+            assert "error" in await post(node, rpc("eth_blockNumber"))
+        finally:
+            await node.stop()
+
+    run(scenario())
+
+
+def test_logs_subscription_and_history():
+    async def scenario():
+        chain = make_chain()
+        node = fake_node.FakeNode(chain, sync_rate=200, logs_per_block=2, max_logs_range=10, max_filter_addresses=2)
+        await node.start(port=0)
+        server = Server(node.ws_url)
+        received = []
+        server.eth_subscription = lambda subscription, result: received.append(result)
+        try:
+            await server.ws_connect()
+            pools = [POOLS[1].lower(), POOLS[2].lower()]
+            await server.eth_subscribe("logs", {"address": pools})
+            await until(lambda: len(received) >= 6)
+            assert set(entry["address"] for entry in received) <= set(pools)
+            blocks = [int(entry["blockNumber"], 16) for entry in received]
+            assert blocks == sorted(blocks) and blocks[-1] > 100
+            assert all(entry["blockHash"] for entry in received)
+
+            # the mined logs are served by eth_getLogs, and too wide filters are refused
+            logs = await server.eth_getLogs({"fromBlock": hex(100), "toBlock": hex(blocks[5]), "address": pools})
+            assert logs[:6] == received[:6]
+            with pytest.raises(ProtocolError):
+                await server.eth_getLogs({"fromBlock": hex(100), "toBlock": hex(200)})
+            with pytest.raises(ProtocolError):
+                await server.eth_subscribe("logs", {"address": [POOLS[i] for i in (1, 2, 3)]})
+        finally:
+            await server.close()
+            await node.stop()
+
+    run(scenario())
@@ -0,0 +1,18 @@
+from bofh.model.modules.feeds_recording import FeedRecorder, read_feeds, FEED_SYNC, FEED_PREDICTION
+
+
+def test_record_and_read(tmp_path):
+    for name in ("feeds.jsonl", "feeds.jsonl.gz"):
+        path = str(tmp_path / name)
+        sync = {"address": "0xb51e4d3F60c8453AdCa52797F9FA1481A6E13A7A", "blockNumber": "0x64", "data": "0x00"}
+        pred = {"blockNumber": 100, "logs": []}
+        rec = FeedRecorder(path)
+        rec.record(FEED_SYNC, sync)
+        rec.close()
+        # append-only: a second session adds to the file
+        rec = FeedRecorder(path)
+        rec.record(FEED_PREDICTION, pred)
+        rec.close()
+        records = list(read_feeds(path))
+        assert [(kind, payload) for _, kind, payload in records] == [(FEED_SYNC, sync), (FEED_PREDICTION, pred)]
+        assert records[0][0] <= records[1][0]
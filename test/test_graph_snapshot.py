@@ -0,0 +1,104 @@
+from asyncio import run, create_task, get_running_loop, CancelledError
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Lock
+from types import SimpleNamespace
+
+import pytest
+
+from bofh_model_ext import *
+
+from helpers import make_graph, until, RecordingDB, WBNB, POOLS
+
+
+def test_graph_snapshot_roundtrip():
+    graph = make_graph({1: (3, 2), 2: (2, 1), 3: (3, 1)}, token_fees={3: 1000}, pool_fees={2: 2000})
+    graph.lookup_lp(1, False).setReserves(10**24, 2**111 + 1)
+    graph.lookup_lp(2, False).setReserves(1, 2)
+    graph.reserves_block_number = 12345678
+    with TemporaryDirectory() as tmpdir:
+        path = join(tmpdir, "graph.snapshot")
+        assert read_graph_snapshot_block_number(path) == 0
+        graph.save_snapshot(path)
+        assert read_graph_snapshot_block_number(path) == 12345678
+
+        loaded = TheGraph()
+        assert loaded.load_snapshot(path) == 3
+    assert loaded.reserves_block_number == 12345678
+    assert loaded.exchanges_count() == 1
+    assert loaded.tokens_count() == 3
+    assert loaded.pools_count() == 3
+
+    wbnb = loaded.lookup_token(WBNB, False)
+    assert wbnb.symbol == "WBNB"
+    assert wbnb.hasFees() and wbnb.feesPPM() == 1000
+
+    p0 = loaded.lookup_lp(POOLS[1], False)
+    assert p0.tag == 1
+    assert int(str(p0.reserve0)) == 10**24
+    assert int(str(p0.reserve1)) == 2**111 + 1
+    assert p0.feesPPM() == 2500
+    p1 = loaded.lookup_lp(2, False)
+    assert p1.feesPPM() == 2000
+
+
+def test_graph_snapshot_rejects_garbage():
+    with TemporaryDirectory() as tmpdir:
+        path = join(tmpdir, "graph.snapshot")
+        with open(path, "wb") as fd:
+            fd.write(b"\0" * 128)
+        assert read_graph_snapshot_block_number(path) == 0
+        graph = TheGraph()
+        try:
+            graph.load_snapshot(path)
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
+        assert graph.pools_count() == 0
+
+
+def test_graph_snapshot_follows_reserves_flushes():
+    event_listener = pytest.importorskip("bofh.model.modules.event_listener")
+    status_preloaders = pytest.importorskip("bofh.model.modules.status_preloaders")
+    from bofh.model.modules.reserves_flusher import ReservesWriteBehind
+
+    class Runner(event_listener.SyncEventRealtimeTracker, status_preloaders.EntitiesPreloader):
+        """Just the reserves flushing side of the runtime"""
+        RESERVES_FLUSH_CHECK_INTERVAL = 0.01
+
+        def __init__(self, path):
+            status_preloaders.EntitiesPreloader.__init__(self)
+            self.args = SimpleNamespace(graph_snapshot_file=path)
+            self.graph = make_graph({1: (3, 2)})
+            self.status_lock = Lock()
+            self.reserves_flusher = ReservesWriteBehind(RecordingDB(), max_size=1)
+
+    async def scenario(runner, path):
+        runner.ioloop = get_running_loop()
+        task = create_task(runner.periodic_reserve_flush_task())
+        try:
+            # nothing is saved while reserves are still being loaded
+            runner.reserves_flusher.add([(1, 2, 1000, 1)])
+            await until(lambda: runner.graph.reserves_block_number == 1000)
+            assert read_graph_snapshot_block_number(path) == 0
+            # then the snapshot keeps up with the status DB
+            runner.reserves_ready.set()
+            runner.reserves_flusher.add([(3, 4, 1001, 1)])
+            await until(lambda: read_graph_snapshot_block_number(path) == 1001)
+            assert runner.reserves_flusher.db.reserves_block_number == 1001
+        finally:
+            task.cancel()
+            try:
+                await task
+            except CancelledError:
+                pass
+
+    with TemporaryDirectory() as tmpdir:
+        path = join(tmpdir, "graph.snapshot")
+        run(scenario(Runner(path), path))
+
+
+if __name__ == '__main__':
+    test_graph_snapshot_roundtrip()
+    test_graph_snapshot_rejects_garbage()
+    test_graph_snapshot_follows_reserves_flushes()
@@ -0,0 +1,116 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+import helpers
+from helpers import log_events
+
+
+def make_graph(extra_pool=False, cake_wbnb_pool=False):
+    pools = {1: (3, 2), 2: (2, 1), 3: (1, 3), 4: (4, 3)}
+    if extra_pool:
+        pools[5] = (4, 2)
+    if cake_wbnb_pool:
+        pools[6] = (1, 3)
+    return helpers.make_graph(pools, start_token=3)
+
+
+def path_ids(paths):
+    return sorted(p.id() for p in paths)
+
+
+def test_paths_index_roundtrip():
+    graph = make_graph()
+    lp = graph.lookup_lp(1, False)
+    expected = path_ids(graph.find_paths_crossing_lp(lp, 4, 100))
+    assert expected
+    with TemporaryDirectory() as tmpdir:
+        path = join(tmpdir, "paths.idx")
+        assert graph.save_paths_index(path) == graph.paths_count()
+
+        loaded = make_graph()
+        assert loaded.load_paths_index(path) == graph.paths_count()
+        assert loaded.paths_count() == graph.paths_count()
+        assert path_ids(loaded.find_paths_crossing_lp(loaded.lookup_lp(1, False), 4, 100)) == expected
+
+
+def test_paths_index_invalidation():
+    graph = make_graph()
+    graph.find_paths_crossing_lp(graph.lookup_lp(1, False), 4, 100)
+    graph.find_paths_crossing_lp(graph.lookup_lp(2, False), 4, 100)
+    with TemporaryDirectory() as tmpdir:
+        path = join(tmpdir, "paths.idx")
+        graph.save_paths_index(path)
+
+        # pool 5 connects USDT and BUSD: the entry of pool 1 (WBNB-BUSD) gets recomputed
+        loaded = make_graph(extra_pool=True)
+        loaded.load_paths_index(path)
+        lp = loaded.lookup_lp(1, False)
+        found = loaded.find_paths_crossing_lp(lp, 4, 100)
+        assert any(5 in [p.get(i).pool.tag for i in range(p.size())] for p in found)
+
+
+def test_paths_index_new_pool_at_start_token():
+    graph = make_graph()
+    graph.find_paths_crossing_lp(graph.lookup_lp(1, False), 3, 100)
+    with TemporaryDirectory() as tmpdir:
+        path = join(tmpdir, "paths.idx")
+        graph.save_paths_index(path)
+
+        # pool 6 is a second Cake-WBNB pool: it touches the start token
+        fresh = make_graph(cake_wbnb_pool=True)
+        expected = path_ids(fresh.find_paths_crossing_lp(fresh.lookup_lp(1, False), 3, 100))
+        loaded = make_graph(cake_wbnb_pool=True)
+        assert loaded.load_paths_index(path) == 0
+        found = loaded.find_paths_crossing_lp(loaded.lookup_lp(1, False), 3, 100)
+        assert path_ids(found) == expected
+        assert any(6 in [p.get(i).pool.tag for i in range(p.size())] for p in found)
+
+
+def test_paths_index_other_start_token():
+    graph = make_graph()
+    graph.find_paths_crossing_lp(graph.lookup_lp(1, False), 4, 100)
+    with TemporaryDirectory() as tmpdir:
+        path = join(tmpdir, "paths.idx")
+        graph.save_paths_index(path)
+        loaded = make_graph()
+        loaded.set_start_token(loaded.lookup_token(2, False))
+        assert loaded.load_paths_index(path) == 0
+        assert loaded.paths_count() == 0
+
+
+def test_paths_warmup():
+    graph = make_graph()
+    lp = graph.lookup_lp(1, False)
+    res = []
+    th = Thread(target=lambda: res.append(graph.warmup_paths_crossing_lp(lp, 3, 1000)))
+    th.start()
+    th.join()
+    assert res[0] > 0
+    assert graph.paths_count() == res[0]
+    # already warm
+    assert graph.warmup_paths_crossing_lp(lp, 3, 1000) == 0
+    assert len(graph.find_paths_crossing_lp(lp, 3, 1000)) == res[0]
+
+
+def test_paths_warmup_logging():
+    # pool 5 (USDT-Cake) has no way to the start token
+    graph = helpers.make_graph({1: (3, 2), 5: (4, 1)}, start_token=3)
+    lp = graph.lookup_lp(5, False)
+    res = []
+    with log_events() as events:
+        # the warmup runs without the GIL, its log events take it back
+        th = Thread(target=lambda: res.append(graph.warmup_paths_crossing_lp(lp, 3, 1000)))
+        th.start()
+        th.join()
+    assert res == [0]
+    assert any("unable to reach start_token" in msg for _, msg in events)
+
+
+if __name__ == '__main__':
+    test_paths_index_roundtrip()
+    test_paths_index_invalidation()
+    test_paths_index_new_pool_at_start_token()
+    test_paths_index_other_start_token()
+    test_paths_warmup()
+    test_paths_warmup_logging()
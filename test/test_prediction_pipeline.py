@@ -0,0 +1,133 @@
+from asyncio import run, sleep, create_task, CancelledError, Queue
+from time import monotonic
+from types import SimpleNamespace
+
+import pytest
+
+constant_prediction = pytest.importorskip("bofh.model.modules.constant_prediction")
+fake_node = pytest.importorskip("bofh.model.fake_node")
+
+from helpers import make_chain, until
+
+
+class Predictor(constant_prediction.ConstantPrediction):
+    """Just the fetch stage of the prediction pipeline"""
+
+    PREDICTION_RECONNECT_DELAY_MIN = 0.01
+    PREDICTION_RECONNECT_DELAY_MAX = 0.04
+
+    def __init__(self, url, polling_interval=20):
+        self.args = SimpleNamespace(web3_rpc_url=url, pred_polling_interval=polling_interval, pred_polling=False)
+        self.feeds_recorder = None
+        self.prediction_events = 0
+        self.prediction_attacks = 0
+        self.prediction_stages = dict(fetch=constant_prediction.PipelineStage("fetch")
+                                      , evaluate=constant_prediction.PipelineStage("evaluate", Queue(maxsize=2)))
+
+    def start_fetch(self):
+        return create_task(self.prediction_fetch_stage())
+
+
+class LaggingNode(fake_node.FakeNode):
+    """Its predictions lag behind its head for the next `lag` calls"""
+
+    def __init__(self, *args, **ka):
+        super(LaggingNode, self).__init__(*args, **ka)
+        self.lag = 0
+        self.calls = []
+
+    def rpc_eth_consPredictLogs(self, *args, **ka):
+        self.calls.append(monotonic())
+        result = self.chain.predicted_logs()
+        if self.lag:
+            self.lag -= 1
+            result["blockNumber"] -= 1
+        return result
+
+
+async def cancelled(task):
+    task.cancel()
+    try:
+        await task
+    except CancelledError:
+        pass
+
+
+async def next_item(stage):
+    await until(lambda: not stage.queue.empty())
+    return await stage.get_latest()
+
+
+def test_stage_keeps_the_latest():
+    async def scenario():
+        stage = constant_prediction.PipelineStage("evaluate", Queue(maxsize=2))
+        for i in range(5):
+            stage.put_latest(i)
+        assert stage.dropped == 3
+        # the older queued item is stale as well
+        assert await stage.get_latest() == 4
+        assert stage.dropped == 4
+        assert stage.queue.empty()
+
+    run(scenario())
+
+
+def test_fetch_on_new_heads_with_back_off():
+    async def scenario():
+        chain = make_chain(block_number=100)
+        node = LaggingNode(chain, sync_rate=0)
+        await node.start(port=0)
+        # the polling interval is only a safety net: fetches are driven by the new heads
+        predictor = Predictor(node.ws_url, polling_interval=2000)
+        evaluate = predictor.prediction_stages["evaluate"]
+        task = predictor.start_fetch()
+        try:
+            result, blockNumber = await next_item(evaluate)
+            assert blockNumber == 101
+            await sleep(0.1)
+            assert len(node.calls) == 1
+
+            # a new head, but its predictions are not ready on the first calls
+            node.lag = 4
+            t0 = monotonic()
+            chain.block_number += 1
+            result, blockNumber = await next_item(evaluate)
+            assert blockNumber == 102
+            assert monotonic() - t0 < 1
+            gaps = [b - a for a, b in zip(node.calls[1:], node.calls[2:])]
+            assert len(gaps) == 4
+            assert gaps[-1] > 2 * gaps[0]
+        finally:
+            await cancelled(task)
+            await node.stop()
+
+    run(scenario())
+
+
+def test_fetch_stage_reconnects():
+    async def scenario():
+        chain = make_chain(block_number=100)
+        node = fake_node.FakeNode(chain, sync_rate=0)
+        await node.start(port=0)
+        port = int(node.url.rsplit(":", 1)[1])
+        predictor = Predictor(node.ws_url)
+        evaluate = predictor.prediction_stages["evaluate"]
+        task = predictor.start_fetch()
+        try:
+            result, blockNumber = await next_item(evaluate)
+            assert blockNumber == 101
+
+            # the node goes away for a while: the stage keeps trying
+            await node.stop()
+            await sleep(0.2)
+            assert not task.done()
+            chain.block_number += 1
+            await node.start(port=port)
+            result, blockNumber = await next_item(evaluate)
+            assert blockNumber == 102
+            assert result["logs"][0]["address"] in chain.pools
+        finally:
+            await cancelled(task)
+            await node.stop()
+
+    run(scenario())
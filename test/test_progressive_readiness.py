@@ -0,0 +1,33 @@
+import helpers
+
+
+def make_graph():
+    return helpers.make_graph({1: (3, 2), 2: (2, 1), 3: (1, 3)}, start_token=3)
+
+
+def test_distance_ranking():
+    graph = make_graph()
+    wbnb, busd, cake = (graph.lookup_token(i, False) for i in (3, 2, 1))
+    assert wbnb.distance() == 0
+    assert busd.distance() == 1
+    assert cake.distance() == 1
+
+
+def test_path_readiness():
+    graph = make_graph()
+    path = graph.add_path(1, 2, 3)
+    assert path is not None
+    assert not path.all_pools_ready()
+    for i in (1, 2):
+        graph.lookup_lp(i, False).setReserves(10**18, 10**18)
+    assert not path.all_pools_ready()
+    graph.lookup_lp(3, False).setReserves(10**18, 10**18)
+    assert path.all_pools_ready()
+    assert not graph.only_ready_paths
+    graph.only_ready_paths = True
+    assert graph.only_ready_paths
+
+
+if __name__ == '__main__':
+    test_distance_ranking()
+    test_path_readiness()
@@ -0,0 +1,52 @@
+from bofh.model.modules.reserves_flusher import ReservesWriteBehind
+
+from helpers import RecordingDB
+
+
+def test_coalescing():
+    db = RecordingDB()
+    flusher = ReservesWriteBehind(db, max_size=2, max_age_secs=3600)
+    assert not flusher.due()
+    flusher.add([(1, 2, 10, 1), (3, 4, 11, 1)])
+    assert len(flusher) == 1
+    assert not flusher.due()
+    flusher.add([(5, 6, 12, 2), (7, 8, 13, 1)])
+    assert flusher.due()
+    assert flusher.flush() == 2
+    assert db.batches == [[(7, 8, 13, 1), (5, 6, 12, 2)]]
+    assert db.reserves_block_number == 13
+    assert flusher.coalescing_ratio == 2.0
+    assert not flusher.due()
+    assert flusher.flush() == 0
+
+
+def test_failed_flush_is_retried():
+    db = RecordingDB()
+    flusher = ReservesWriteBehind(db, max_size=100, max_age_secs=3600)
+    flusher.add([(1, 2, 10, 1), (3, 4, 10, 2)])
+    db.update_pool_reserves_batch = lambda tuples: 1 / 0
+    try:
+        flusher.flush()
+        assert False, "write failure swallowed"
+    except ZeroDivisionError:
+        pass
+    assert db.reserves_block_number == 0
+    # newer reserves of pool 1 came in meanwhile
+    flusher.add([(5, 6, 11, 1)])
+    del db.update_pool_reserves_batch
+    assert flusher.flush() == 2
+    assert db.batches == [[(5, 6, 11, 1), (3, 4, 10, 2)]]
+    assert db.reserves_block_number == 11
+
+
+def test_age_trigger():
+    flusher = ReservesWriteBehind(RecordingDB(), max_size=100, max_age_secs=0)
+    assert not flusher.due()
+    flusher.add([(1, 2, 10, 1)])
+    assert flusher.due()
+
+
+if __name__ == '__main__':
+    test_coalescing()
+    test_failed_flush_is_retried()
+    test_age_trigger()
@@ -0,0 +1,31 @@
+from helpers import make_graph
+
+
+def make_pool():
+    graph = make_graph({1: (1, 2)})
+    return graph, graph.lookup_lp(1, False)
+
+
+def test_set_reserves_raw():
+    graph, pool = make_pool()
+    pool.setReservesRaw((2**111 + 1).to_bytes(14, "big"), (10**18).to_bytes(32, "big"))
+    assert int(str(pool.reserve0)) == 2**111 + 1
+    assert int(str(pool.reserve1)) == 10**18
+    pool.setReservesRaw(b'', memoryview(b'\x01\x00'))
+    assert int(str(pool.reserve0)) == 0
+    assert int(str(pool.reserve1)) == 256
+
+
+def test_set_reserves_raw_too_wide():
+    graph, pool = make_pool()
+    try:
+        pool.setReservesRaw(b'\x01' * 33, b'\x01')
+    except ValueError:
+        pass
+    else:
+        assert False, "oversized reserves not detected"
+
+
+if __name__ == '__main__':
+    test_set_reserves_raw()
+    test_set_reserves_raw_too_wide()
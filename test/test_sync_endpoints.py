@@ -0,0 +1,171 @@
+from asyncio import run, sleep, gather, create_task, CancelledError
+from types import SimpleNamespace
+
+import pytest
+
+event_listener = pytest.importorskip("bofh.model.modules.event_listener")
+fake_node = pytest.importorskip("bofh.model.fake_node")
+
+from helpers import make_chain, sync_data, until, POOLS
+
+POOL_A = POOLS[1].lower()
+POOL_B = POOLS[6].lower()
+
+
+def sync_log(address, reserve0, reserve1, blocknr, block_hash, log_index=0, removed=False):
+    return {"address": address
+            , "topics": [event_listener.TOPIC_SYNC]
+            , "data": sync_data(reserve0, reserve1)
+            , "blockNumber": hex(blocknr)
+            , "blockHash": block_hash
+            , "logIndex": hex(log_index)
+            , "removed": removed}
+
+
+class ReportsDB:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def list_unknown_pools(self):
+        return []
+
+
+class Tracker(event_listener.SyncEventRealtimeTracker):
+    """Just the endpoints side of the tracker: queued entries are collected instead of applied"""
+
+    def __init__(self, urls):
+        self.args = SimpleNamespace(web3_rpc_url=urls[0]
+                                    , sync_ws_urls=",".join(urls)
+                                    , sync_subscription_shard_size=1000
+                                    , sync_subscription_catch_all=False)
+        self.pool_addresses = {POOL_A, POOL_B}
+        self.graph = SimpleNamespace(reserves_block_number=0)
+        self.reports_db = ReportsDB()
+        self.feeds_recorder = None
+        self.queued = []
+        self.start(live=False)
+
+    def queue_sync_logs(self, entries):
+        self.queued.extend(entries)
+
+    def start_tasks(self):
+        return [create_task(self.track_sync_events_task(endpoint)) for endpoint in self.sync_endpoints]
+
+    def connected(self):
+        return all(e.subscriptions and e.backfill_buffer is None for e in self.sync_endpoints)
+
+
+async def cancelled(tasks):
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except CancelledError:
+            pass
+
+
+def test_first_arrival_across_endpoints():
+    async def scenario():
+        chain = make_chain()
+        # the same chain, served by a close and by a far away node
+        fast = fake_node.FakeNode(chain, sync_rate=0)
+        slow = fake_node.FakeNode(chain, latency_ms=50, sync_rate=0)
+        await fast.start(port=0)
+        await slow.start(port=0)
+        tracker = Tracker([fast.ws_url, slow.ws_url])
+        tasks = tracker.start_tasks()
+        try:
+            await until(tracker.connected)
+
+            async def mined(*entries):
+                expected = len(tracker.queued) + len(entries)
+                await gather(fast.notify_logs(entries), slow.notify_logs(entries))
+                await until(lambda: sum(e.first + e.late for e in tracker.sync_endpoints) >= 2 * expected)
+                await sleep(0.05)
+
+            hash0, hash1 = chain.new_hash(), chain.new_hash()
+            await mined(sync_log(POOL_A, 100, 200, 10, hash0), sync_log(POOL_B, 300, 400, 10, hash0, 1))
+            assert tracker.queued == [(POOL_A, sync_data(100, 200), 10), (POOL_B, sync_data(300, 400), 10)]
+            fast_endpoint, slow_endpoint = tracker.sync_endpoints
+            assert (fast_endpoint.first, fast_endpoint.late) == (2, 0)
+            assert (slow_endpoint.first, slow_endpoint.late) == (0, 2)
+            assert slow_endpoint.lag > 0
+
+            # block 10 is reorged: its logs are removed, then the new canonical block has a log
+            # at the same position, with other reserves
+            del tracker.queued[:]
+            await mined(sync_log(POOL_A, 100, 200, 10, hash0, removed=True)
+                        , sync_log(POOL_B, 300, 400, 10, hash0, 1, removed=True))
+            await mined(sync_log(POOL_A, 110, 190, 10, hash1))
+            assert tracker.queued == [(None, None, 10)
+                                      , (None, None, 10)
+                                      , (POOL_A, sync_data(110, 190), 10)]
+        finally:
+            await cancelled(tasks)
+            await fast.stop()
+            await slow.stop()
+
+    run(scenario())
+
+
+def test_backfill_since_last_block():
+    async def scenario():
+        chain = make_chain(block_number=105)
+        hashes = dict((blocknr, chain.new_hash()) for blocknr in range(98, 107))
+        chain.add_logs([sync_log(POOL_A, blocknr, blocknr, blocknr, hashes[blocknr]) for blocknr in range(98, 106)])
+        # not a watched pool
+        chain.add_logs([sync_log(POOLS[2].lower(), 1, 1, 104, hashes[104], 1)])
+        # the node serves 2 blocks per eth_getLogs call
+        node = fake_node.FakeNode(chain, sync_rate=0, max_logs_range=2)
+        await node.start(port=0)
+        tracker = Tracker([node.ws_url])
+        tracker.pool_addresses = {POOL_A}
+        # block 100 may have been seen only in part: it's fetched again
+        tracker.last_sync_block = 100
+        tasks = tracker.start_tasks()
+        try:
+            await until(tracker.connected)
+            assert tracker.queued == [(POOL_A, sync_data(blocknr, blocknr), blocknr) for blocknr in range(100, 106)]
+            # live events come next
+            del tracker.queued[:]
+            await node.notify_logs([sync_log(POOL_A, 106, 106, 106, hashes[106])])
+            await until(lambda: tracker.queued)
+            assert tracker.queued == [(POOL_A, sync_data(106, 106), 106)]
+        finally:
+            await cancelled(tasks)
+            await node.stop()
+
+    run(scenario())
+
+
+def test_failed_backfill_keeps_live_events():
+    async def scenario():
+        chain = make_chain(block_number=105)
+        node = fake_node.FakeNode(chain, sync_rate=0)
+        await node.start(port=0)
+        tracker = Tracker([node.ws_url])
+        tracker.last_sync_block = 100
+        endpoint, = tracker.sync_endpoints
+        live = sync_log(POOL_A, 105, 105, 105, chain.new_hash())
+
+        async def failing_fetch(server, from_block, to_block):
+            # the head block is notified while the backfill runs, then the backfill fails
+            await node.notify_logs([live])
+            await until(lambda: endpoint.backfill_buffer)
+            raise ValueError("node unavailable")
+
+        tracker.fetch_sync_logs = failing_fetch
+        tasks = tracker.start_tasks()
+        try:
+            await until(tracker.connected)
+            assert tracker.queued == [(POOL_A, sync_data(105, 105), 105)]
+        finally:
+            await cancelled(tasks)
+            await node.stop()
+
+    run(scenario())
+
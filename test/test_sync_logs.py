@@ -0,0 +1,142 @@
+import helpers
+from helpers import log_events, sync_data, POOLS
+
+
+POOL1 = POOLS[1]
+POOL2 = POOLS[2]
+UNKNOWN = POOLS[3]
+
+
+def make_graph():
+    return helpers.make_graph({1: (1, 2), 2: (2, 1)})
+
+
+def test_apply_sync_logs():
+    graph = make_graph()
+    entries = [(POOL1.lower(), sync_data(10**18, 2**111 + 1), 100)
+               , (UNKNOWN, sync_data(1, 2), 100)
+               , (POOL2, sync_data(5, 6), None)
+               , (POOL1, sync_data(7, 8), 101)]
+    updated, unknown = graph.apply_sync_logs(entries)
+    assert updated == [(10**18, 2**111 + 1, 100, 1), (5, 6, 0, 2), (7, 8, 101, 1)]
+    assert unknown == [1]
+    pool1 = graph.lookup_lp(1, False)
+    assert int(str(pool1.reserve0)) == 7
+    assert int(str(pool1.reserve1)) == 8
+
+
+def test_apply_sync_logs_malformed():
+    graph = make_graph()
+    updated, unknown = graph.apply_sync_logs([(POOL1, "0x1234", 1), (POOL2, "0x" + "zz" * 64, 1)])
+    assert updated == []
+    assert unknown == []
+    assert int(str(graph.lookup_lp(1, False).reserve0)) == 0
+
+
+def test_apply_sync_logs_malformed_logging():
+    graph = make_graph()
+    with log_events() as events:
+        # the batch is applied without the GIL, its log events take it back
+        updated, unknown = graph.apply_sync_logs([(POOL1, "0xzz", 5)])
+    assert updated == []
+    assert any("malformed Sync log data" in msg for _, msg in events)
+
+
+def test_apply_sync_logs_predicted():
+    graph = make_graph()
+    pool = graph.lookup_lp(1, False)
+    pool.setReserves(10, 20)
+    key = graph.start_predicted_snapshot()
+    updated, unknown = graph.apply_sync_logs([(POOL1, sync_data(11, 19), 5)], key)
+    assert updated == [(11, 19, 5, 1)]
+    assert int(str(pool.reserve0)) == 10
+    assert pool.get_predicted_reserves(key)[0] == 11
+    graph.terminate_predicted_snapshot(key)
+    assert pool.get_predicted_reserves(key)[0] == 10
+
+
+def test_predicted_snapshots_overlay():
+    graph = make_graph()
+    pool1, pool2 = graph.lookup_lp(1, False), graph.lookup_lp(2, False)
+    pool1.setReserves(10, 20)
+    pool2.setReserves(30, 40)
+    key = graph.start_predicted_snapshot()
+    pool1.set_predicted_reserves(key, 11, 19)
+    pool1.set_predicted_reserves(key, 12, 18)
+    assert pool1.get_predicted_reserves(key) == (12, 18)
+    assert pool2.get_predicted_reserves(key) == (30, 40)
+    # starting a new snapshot drops the former one
+    key2 = graph.start_predicted_snapshot()
+    assert pool1.get_predicted_reserves(key) == (10, 20)
+    pool2.set_predicted_reserves(key2, 31, 39)
+    assert pool1.get_predicted_reserves(key2) == (10, 20)
+    assert pool2.get_predicted_reserves(key2) == (31, 39)
+    try:
+        pool1.set_predicted_reserves(key, 13, 17)
+        assert False, "stale snapshot accepted"
+    except ValueError:
+        pass
+    graph.terminate_predicted_snapshot(key2)
+    assert pool2.get_predicted_reserves(key2) == (30, 40)
+
+
+def reserves(graph, tag):
+    pool = graph.lookup_lp(tag, False)
+    return int(str(pool.reserve0)), int(str(pool.reserve1))
+
+
+def test_rollback_sync_logs():
+    graph = make_graph()
+    graph.lookup_lp(1, False).setReserves(1, 1)
+    graph.lookup_lp(2, False).setReserves(2, 2)
+    graph.apply_sync_logs([(POOL1, sync_data(10, 10), 100)
+                           , (POOL1, sync_data(11, 11), 101)
+                           , (POOL2, sync_data(20, 20), 101)
+                           , (POOL1, sync_data(12, 12), 101)
+                           , (POOL2, sync_data(21, 21), 102)])
+    restored = graph.rollback_sync_logs(102)
+    assert restored == [(20, 20, 101, 2)]
+    assert reserves(graph, 2) == (20, 20)
+    restored = sorted(graph.rollback_sync_logs(101), key=lambda r: r[3])
+    assert restored == [(10, 10, 100, 1), (2, 2, 100, 2)]
+    assert reserves(graph, 1) == (10, 10)
+    assert reserves(graph, 2) == (2, 2)
+    # nothing left to undo
+    assert graph.rollback_sync_logs(101) == []
+
+
+def test_rollback_sync_logs_depth():
+    graph = make_graph()
+    graph.sync_undo_depth = 2
+    for blocknr in range(100, 105):
+        graph.apply_sync_logs([(POOL1, sync_data(blocknr, blocknr), blocknr)])
+    # older blocks were evicted: the oldest recorded state is the one before block 103
+    assert graph.rollback_sync_logs(100) == [(102, 102, 99, 1)]
+    assert reserves(graph, 1) == (102, 102)
+
+
+def test_rollback_sync_logs_late_comers():
+    graph = make_graph()
+    graph.lookup_lp(1, False).setReserves(1, 1)
+    graph.lookup_lp(2, False).setReserves(2, 2)
+    # logs of block 100 arrive after those of block 101
+    graph.apply_sync_logs([(POOL1, sync_data(10, 10), 101)
+                           , (POOL2, sync_data(20, 20), 100)
+                           , (POOL1, sync_data(5, 5), 100)])
+    # before block 101, pool 1 was as it was before any of these logs
+    assert graph.rollback_sync_logs(101) == [(1, 1, 100, 1)]
+    assert reserves(graph, 2) == (20, 20)
+    restored = sorted(graph.rollback_sync_logs(100), key=lambda r: r[3])
+    assert restored == [(1, 1, 99, 1), (2, 2, 99, 2)]
+    assert reserves(graph, 1) == (1, 1)
+    assert reserves(graph, 2) == (2, 2)
+
+
+if __name__ == '__main__':
+    test_apply_sync_logs()
+    test_apply_sync_logs_malformed()
+    test_apply_sync_logs_malformed_logging()
+    test_apply_sync_logs_predicted()
+    test_rollback_sync_logs()
+    test_rollback_sync_logs_depth()
+    test_rollback_sync_logs_late_comers()
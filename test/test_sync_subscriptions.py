@@ -0,0 +1,76 @@
+from asyncio import run
+
+import pytest
+
+fake_node = pytest.importorskip("bofh.model.fake_node")
+
+from jsonrpc_websocket import Server
+
+from bofh.model.modules.sync_subscriptions import SyncLogsSubscriptions
+from helpers import make_chain, until, POOLS
+
+TOPIC_SYNC = fake_node.PREDICTION_LOG_TOPIC0_SYNC
+
+
+def test_shards_halving_and_incremental_update():
+    async def scenario():
+        chain = make_chain()
+        # the node takes filters of 2 addresses at most
+        node = fake_node.FakeNode(chain, sync_rate=0, max_filter_addresses=2)
+        await node.start(port=0)
+        server = Server(node.ws_url)
+        received = []
+        server.eth_subscription = lambda subscription, result: received.append((subscription, result["address"]))
+        try:
+            await server.ws_connect()
+            subscriptions = SyncLogsSubscriptions(server, TOPIC_SYNC, shard_size=4)
+            pools = [POOLS[i].lower() for i in range(1, 6)]
+            await subscriptions.subscribe(pools)
+            assert subscriptions.shard_size == 2
+            assert len(subscriptions) == 3
+            assert sorted(subscriptions.watched) == sorted(pools)
+            assert len(node._log_subscribers) == 3
+
+            # pool 1 is dropped, pool 6 is added: only the shard of pool 1 is replaced
+            shards = dict(subscriptions.shards)
+            dropped = subscriptions.watched[pools[0]]
+            assert await subscriptions.update(pools[1:] + [POOLS[6].lower()])
+            assert dropped not in subscriptions.shards
+            for subscription, addresses in shards.items():
+                if subscription != dropped:
+                    assert subscriptions.shards[subscription] == addresses
+            assert sorted(subscriptions.watched) == sorted(pools[1:] + [POOLS[6].lower()])
+            assert sorted(node._log_subscribers) == sorted(subscriptions.shards)
+            assert not await subscriptions.update(pools[1:] + [POOLS[6].lower()])
+
+            # each watched pool is notified once, through the subscription of its shard
+            await node.notify_logs([chain.next_sync_log([address]) for address in chain.pools])
+            await until(lambda: len(received) == 5)
+            assert sorted(address for _, address in received) == sorted(subscriptions.watched)
+            assert all(subscriptions.watched[address] == subscription for subscription, address in received)
+        finally:
+            await server.close()
+            await node.stop()
+
+    run(scenario())
+
+
+def test_catch_all_is_redundant_on_watched_pools():
+    async def scenario():
+        node = fake_node.FakeNode(make_chain(), sync_rate=0)
+        await node.start(port=0)
+        server = Server(node.ws_url)
+        try:
+            await server.ws_connect()
+            subscriptions = SyncLogsSubscriptions(server, TOPIC_SYNC, catch_all=True)
+            await subscriptions.subscribe([POOLS[1]])
+            assert len(subscriptions) == 1
+            assert subscriptions.catch_all_subscription is not None
+            assert subscriptions.is_redundant(subscriptions.catch_all_subscription, POOLS[1])
+            assert not subscriptions.is_redundant(subscriptions.catch_all_subscription, POOLS[2])
+            assert not subscriptions.is_redundant(subscriptions.watched[POOLS[1].lower()], POOLS[1])
+        finally:
+            await server.close()
+            await node.stop()
+
+    run(scenario())
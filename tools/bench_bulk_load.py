@@ -0,0 +1,115 @@
+"""Usage: bench_bulk_load.py [options] [<input_file>]
+
+Compare per-row and bulk (columnar) loading of tokens and pools into TheGraph.
+
+The input file is in the format of test/bsc_pools.data.reduced. As that
+file is small, its content can be replicated --scale times, with synthetic
+(but unique) addresses and tags.
+
+Options:
+  -h --help
+  -s, --scale=<n>        replicate input data n times [default: 1000]
+  -r, --repeat=<n>       take the best of n runs [default: 3]
+
+"""
+
+import json
+from time import perf_counter
+
+from docopt import docopt
+
+from bofh_model_ext import TheGraph
+
+
+DEFAULT_INPUT_FILE = "test/bsc_pools.data.reduced"
+
+
+def synth_address(addr, i):
+    # keep the low 32 bits as-is, stamp the replica number in the high bits
+    return "0x%08x%s" % (i, addr[10:])
+
+
+def read_dataset(fn, scale):
+    with open(fn) as fd:
+        data = json.load(fd)
+    exchanges = []
+    tokens = {}
+    pools = []
+    for exchange_id, (name, content) in enumerate(data["wrapped"].items(), start=1):
+        exchanges.append((exchange_id, "0x%040x" % exchange_id, name, 0))
+        for i in range(scale):
+            for group in content["pools"]:
+                for p in group:
+                    t0 = synth_address(p["token0"], i)
+                    t1 = synth_address(p["token1"], i)
+                    for t in (t0, t1):
+                        if t not in tokens:
+                            tokens[t] = len(tokens) + 1
+                    pools.append((len(pools) + 1
+                                  , synth_address(p["address"], i)
+                                  , exchange_id
+                                  , tokens[t0]
+                                  , tokens[t1]
+                                  , True
+                                  , p.get("swapFee", 0) * 100))
+    tokens = [(tag, addr, "", "", 18, False, False, 0) for addr, tag in tokens.items()]
+    return exchanges, tokens, pools
+
+
+def columns(rows):
+    cols = list(zip(*rows))
+    cols[1] = b''.join(bytes.fromhex(a[2:]) for a in cols[1])
+    return cols
+
+
+def new_graph(exchanges):
+    graph = TheGraph()
+    for e in exchanges:
+        graph.add_exchange(*e)
+    return graph
+
+
+def load_per_row(exchanges, tokens, pools):
+    graph = new_graph(exchanges)
+    for t in tokens:
+        graph.add_token(*t)
+    for p in pools:
+        graph.add_lp(*p)
+    return graph
+
+
+def load_bulk(exchanges, tokens, pools):
+    graph = new_graph(exchanges)
+    assert not graph.add_tokens_bulk(*columns(tokens))
+    assert not graph.add_lps_bulk(*columns(pools))
+    return graph
+
+
+def bench(fn, repeat, *args):
+    best = None
+    for _ in range(repeat):
+        t0 = perf_counter()
+        graph = fn(*args)
+        elapsed = perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, graph
+
+
+def main():
+    arguments = docopt(__doc__)
+    fn = arguments["<input_file>"] or DEFAULT_INPUT_FILE
+    scale = int(arguments["--scale"])
+    repeat = int(arguments["--repeat"])
+    exchanges, tokens, pools = read_dataset(fn, scale)
+    print("dataset: %u tokens, %u pools (%s x %u)" % (len(tokens), len(pools), fn, scale))
+
+    per_row, g1 = bench(load_per_row, repeat, exchanges, tokens, pools)
+    bulk, g2 = bench(load_bulk, repeat, exchanges, tokens, pools)
+    assert g1.pools_count() == g2.pools_count() == len(pools)
+    print("per-row: %8.3fs (%.0f rows/s)" % (per_row, (len(tokens) + len(pools)) / per_row))
+    print("bulk:    %8.3fs (%.0f rows/s)" % (bulk, (len(tokens) + len(pools)) / bulk))
+    print("speedup: %8.2fx" % (per_row / bulk))
+
+
+if __name__ == '__main__':
+    main()